@@ -0,0 +1,177 @@
+"""
+Adherence rollups for SafeDoser backend
+Dashboards read the adherence_daily rollups (one row per supplement per day,
+kept current by triggers on supplement_logs) instead of raw logs, and aggregate
+them in NumPy: a range becomes a supplements x days matrix, weeks and months are
+one reduceat over the day axis, and streaks are run lengths over the same
+matrix. A dashboard view costs O(days x supplements) however many logs exist.
+"""
+
+import logging
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from timeline import PERIODS, created_on, parse_dose_time
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_TABLE = "adherence_daily"
+
+ROLLUP_COUNTS = ("taken", "skipped", "missed", "pending")
+
+BUCKETS = ("day", "week", "month")
+
+# Longest range one dashboard request may cover
+MAX_RANGE_DAYS = 366
+
+def doses_per_day(supplement: Dict[str, Any]) -> int:
+    """Number of valid scheduled times in a supplement's current schedule"""
+    times_of_day = supplement.get("times_of_day") or {}
+    return sum(
+        1
+        for period in PERIODS
+        for value in (times_of_day.get(period) if isinstance(times_of_day.get(period), list) else [])
+        if parse_dose_time(value) is not None
+    )
+
+def _rate(taken: int, expected: int) -> Optional[float]:
+    return round(int(taken) / int(expected), 4) if expected else None
+
+def load_rollups(db, user_id: str, start: date, end: date) -> List[Dict[str, Any]]:
+    """A user's rollup rows for start..end inclusive"""
+    result = (
+        db.supabase.table(ROLLUP_TABLE)
+        .select("supplement_id, log_date, " + ", ".join(ROLLUP_COUNTS))
+        .eq("user_id", user_id)
+        .gte("log_date", start.isoformat())
+        .lte("log_date", end.isoformat())
+        .execute()
+    )
+    return result.data or []
+
+def streak_lengths(hit: np.ndarray, due: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Current and longest streak per row of a rows x days matrix
+
+    A streak is a run of days with hit set; days with nothing due keep a run
+    going without adding to it. The current streak is the run reaching the last
+    day, or the day before when the last day is not (yet) a hit.
+    """
+    rows, days = hit.shape
+    if days == 0:
+        return np.zeros(rows, dtype=np.int32), np.zeros(rows, dtype=np.int32)
+    # A False column after every row stops runs from spilling into the next row
+    flat_hit = np.concatenate([hit, np.zeros((rows, 1), dtype=bool)], axis=1).ravel()
+    flat_due = np.concatenate([due & hit, np.zeros((rows, 1), dtype=bool)], axis=1).ravel()
+    counted = np.concatenate([[0], np.cumsum(flat_due, dtype=np.int64)])
+
+    edges = np.diff(np.concatenate([[False], flat_hit]).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    lengths = counted[ends] - counted[starts]
+    run_rows = starts // (days + 1)
+
+    longest = np.zeros(rows, dtype=np.int32)
+    np.maximum.at(longest, run_rows, lengths)
+
+    # Runs ending on the last day, or on the day before for rows where the last day is open
+    last = np.where(hit[:, -1], days, days - 1)
+    current = np.zeros(rows, dtype=np.int32)
+    reaching = ends - run_rows * (days + 1) == last[run_rows]
+    current[run_rows[reaching]] = lengths[reaching]
+    return current, longest
+
+class AdherenceRange:
+    """Expected and logged doses per supplement per day over a date range"""
+
+    def __init__(self, start: date, end: date, supplements: List[Dict[str, Any]], rollups: Iterable[Dict[str, Any]]):
+        self.start = start
+        self.end = end
+        self.days = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1)
+        self.supplements = supplements
+        self.supplement_ids = np.array([supplement["id"] for supplement in supplements], dtype=np.int64)
+        shape = (len(supplements), len(self.days))
+
+        # Current schedule applied from each supplement's creation day onwards
+        created = np.array(
+            [np.datetime64(created_on(supplement) or start, "D") for supplement in supplements],
+            dtype="datetime64[D]"
+        ).reshape(-1, 1)
+        per_day = np.array([doses_per_day(supplement) for supplement in supplements], dtype=np.int32).reshape(-1, 1)
+        self.expected = np.where(self.days >= created, per_day, 0).astype(np.int32).reshape(shape)
+
+        self.counts = {name: np.zeros(shape, dtype=np.int32) for name in ROLLUP_COUNTS}
+        positions = {supplement_id: position for position, supplement_id in enumerate(self.supplement_ids.tolist())}
+        for row in rollups:
+            position = positions.get(row["supplement_id"])
+            day = (date.fromisoformat(str(row["log_date"])) - start).days
+            if position is None or not 0 <= day < shape[1]:
+                continue
+            for name in ROLLUP_COUNTS:
+                self.counts[name][position, day] = row.get(name) or 0
+
+        # Doses taken beyond today's schedule (it changed since) don't make up for others
+        self.taken = np.minimum(self.counts["taken"], self.expected)
+
+    def _bucket_starts(self, bucket: str) -> np.ndarray:
+        if bucket == "week":
+            # datetime64 day 0 (1970-01-01) was a Thursday; weeks start on Monday
+            keys = self.days - (self.days.astype(np.int64) + 3) % 7
+        elif bucket == "month":
+            keys = self.days.astype("datetime64[M]")
+        else:
+            keys = self.days
+        return np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+
+    def buckets(self, bucket: str = "day") -> List[Dict[str, Any]]:
+        """Totals over all supplements per day, week or month in the range"""
+        if not len(self.days):
+            return []
+        starts = self._bucket_starts(bucket)
+        expected = np.add.reduceat(self.expected.sum(axis=0), starts)
+        taken = np.add.reduceat(self.taken.sum(axis=0), starts)
+        skipped = np.add.reduceat(self.counts["skipped"].sum(axis=0), starts)
+        missed = np.add.reduceat(self.counts["missed"].sum(axis=0), starts)
+        return [
+            {
+                "start": self.days[position].item(),
+                "expected": int(expected[index]),
+                "taken": int(taken[index]),
+                "skipped": int(skipped[index]),
+                "missed": int(missed[index]),
+                "rate": _rate(taken[index], expected[index]),
+            }
+            for index, position in enumerate(starts.tolist())
+        ]
+
+    def summary(self) -> Dict[str, Any]:
+        """Overall and per-supplement rates and streaks"""
+        expected = self.expected.sum(axis=1)
+        taken = self.taken.sum(axis=1)
+        current, longest = streak_lengths(self.taken >= self.expected, self.expected > 0)
+
+        day_expected = self.expected.sum(axis=0, keepdims=True)
+        day_taken = self.taken.sum(axis=0, keepdims=True)
+        user_current, user_longest = streak_lengths(day_taken >= day_expected, day_expected > 0)
+
+        total_expected = int(expected.sum())
+        return {
+            "expected": total_expected,
+            "taken": int(taken.sum()),
+            "rate": _rate(taken.sum(), total_expected),
+            "current_streak": int(user_current[0]),
+            "longest_streak": int(user_longest[0]),
+            "supplements": [
+                {
+                    "supplement_id": supplement["id"],
+                    "name": supplement.get("name", ""),
+                    "expected": int(expected[position]),
+                    "taken": int(taken[position]),
+                    "rate": _rate(taken[position], expected[position]),
+                    "current_streak": int(current[position]),
+                    "longest_streak": int(longest[position]),
+                }
+                for position, supplement in enumerate(self.supplements)
+            ],
+        }
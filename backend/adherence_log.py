@@ -0,0 +1,164 @@
+"""
+Adherence log writer for SafeDoser backend
+Check-offs are the most frequent write in the app and peak together every
+morning, so they are group-committed: rows queue for a few milliseconds and go
+out as one multi-row upsert, and each request returns once its batch is stored.
+Batches go through the upsert_supplement_logs function, which matches logs on
+(supplement, date, scheduled time): marking a dose twice rewrites the same row,
+keeps its id (logs written before ids were derived keep theirs) and keeps the
+first taken_at. A new log's id is derived from the same key.
+"""
+
+import os
+import uuid
+import asyncio
+import logging
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from timeline import format_minute, parse_dose_time
+
+logger = logging.getLogger(__name__)
+
+# Fixed namespace for log ids; changing it would fork the id of every existing dose
+LOG_ID_NAMESPACE = uuid.UUID("5b7c2f4e-1d9a-4c61-9a0e-3f2d8e6b1c47")
+
+# Every written row carries all of these, as multi-row upserts need uniform keys
+LOG_COLUMNS = ("id", "user_id", "supplement_id", "log_date", "scheduled_time", "status", "taken_at", "notes", "updated_at")
+
+UPSERT_FUNCTION = "upsert_supplement_logs"
+
+def log_id_for(supplement_id: int, log_date: date, scheduled_time: str) -> str:
+    return str(uuid.uuid5(LOG_ID_NAMESPACE, f"{supplement_id}:{log_date.isoformat()}:{scheduled_time}"))
+
+def log_row(
+    user_id: str,
+    supplement_id: int,
+    log_date: date,
+    scheduled_time: str,
+    status: str,
+    taken_at: Optional[datetime] = None,
+    notes: Optional[str] = None,
+) -> Dict[str, Any]:
+    """A complete supplement_logs row, ready to upsert
+
+    taken_at is only set when given; the upsert stamps a new taken log with the
+    write time and keeps the first taken_at of a dose that was already taken.
+    """
+    minute = parse_dose_time(scheduled_time)
+    if minute is None:
+        raise ValueError(f"Invalid scheduled time: {scheduled_time!r}")
+    scheduled_time = format_minute(minute)
+    now = datetime.now(timezone.utc)
+    if status != "taken":
+        taken_at = None
+    return {
+        "id": log_id_for(supplement_id, log_date, scheduled_time),
+        "user_id": user_id,
+        "supplement_id": supplement_id,
+        "log_date": log_date.isoformat(),
+        "scheduled_time": scheduled_time,
+        "status": status,
+        "taken_at": taken_at.isoformat() if taken_at else None,
+        "notes": notes,
+        "updated_at": now.isoformat(),
+    }
+
+def _dose_key(row: Dict[str, Any]) -> Tuple[int, str, Optional[int]]:
+    # Stored rows come back with "HH:MM:SS" times
+    return int(row["supplement_id"]), str(row["log_date"]), parse_dose_time(str(row["scheduled_time"]))
+
+class AdherenceLogWriter:
+    """Coalesces log writes into batched upserts on supplement_logs"""
+
+    def __init__(self, db, max_batch: int = 500, flush_interval_ms: int = 20):
+        self.db = db
+        self.max_batch = max_batch
+        # How long the first write of a batch waits for company
+        self.flush_interval = flush_interval_ms / 1000
+        self._pending: Dict[Tuple[int, str, Optional[int]], Dict[str, Any]] = {}
+        self._waiter: Optional[asyncio.Future] = None
+        self._full = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._tasks: set = set()
+        self.stats: Dict[str, int] = {"writes": 0, "rows": 0, "coalesced": 0, "flushes": 0, "failed": 0, "max_batch_rows": 0}
+
+    @classmethod
+    def from_env(cls, db) -> "AdherenceLogWriter":
+        return cls(
+            db,
+            max_batch=int(os.getenv("ADHERENCE_LOG_MAX_BATCH", "500")),
+            flush_interval_ms=int(os.getenv("ADHERENCE_LOG_FLUSH_MS", "20")),
+        )
+
+    async def write(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Queue rows for the next batch and return them as stored once it is written
+
+        A row whose dose belongs to another user's log is not written or returned.
+        """
+        for row in rows:
+            key = _dose_key(row)
+            if key in self._pending:
+                # Same dose twice in one batch: the later action wins
+                self.stats["coalesced"] += 1
+            self._pending[key] = row
+        self.stats["writes"] += 1
+
+        waiter = self._waiter
+        if waiter is None:
+            waiter = self._waiter = asyncio.get_running_loop().create_future()
+            task = asyncio.create_task(self._flush(waiter))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+
+        stored = await asyncio.shield(waiter)
+        return [stored[key] for key in dict.fromkeys(_dose_key(row) for row in rows) if key in stored]
+
+    async def _flush(self, waiter: asyncio.Future) -> None:
+        try:
+            await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+        except asyncio.TimeoutError:
+            pass
+
+        async with self._lock:
+            # Writes that arrived while an earlier batch was in flight ride along
+            rows = list(self._pending.values())
+            self._pending = {}
+            self._full.clear()
+            if self._waiter is waiter:
+                self._waiter = None
+            try:
+                stored: Dict[Tuple[int, str, Optional[int]], Dict[str, Any]] = {}
+                for start in range(0, len(rows), self.max_batch):
+                    chunk = rows[start:start + self.max_batch]
+                    for row in await asyncio.to_thread(self._upsert, chunk):
+                        stored[_dose_key(row)] = row
+                    self.stats["flushes"] += 1
+                    self.stats["max_batch_rows"] = max(self.stats["max_batch_rows"], len(chunk))
+                self.stats["rows"] += len(rows)
+                waiter.set_result(stored)
+            except Exception as e:
+                logger.error(f"Failed to write {len(rows)} supplement logs: {str(e)}")
+                self.stats["failed"] += len(rows)
+                waiter.set_exception(e)
+                # Mark retrieved so a batch nobody awaited does not log "never retrieved"
+                waiter.exception()
+
+    def _upsert(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Write rows and return them as stored"""
+        result = self.db.supabase.rpc(UPSERT_FUNCTION, {"p_rows": rows}).execute()
+        return result.data or []
+
+    async def close(self) -> None:
+        """Wait for batches already queued"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "pending": len(self._pending),
+            "avg_batch_rows": round(self.stats["rows"] / self.stats["flushes"], 1) if self.stats["flushes"] else 0.0,
+        }
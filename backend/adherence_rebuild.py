@@ -0,0 +1,120 @@
+"""
+Adherence rollup rebuild for SafeDoser backend
+Recomputes adherence_daily from the raw supplement_logs and rewrites every row
+that differs, zeroing rollups whose logs are gone. The triggers keep rollups
+current on their own; this is for repairs after bulk imports, restores or
+manual edits, and for checking for drift with --dry-run. Log writes that land
+while it runs can be overwritten, so run it when traffic is quiet.
+
+Usage:
+    python adherence_rebuild.py --dry-run
+    python adherence_rebuild.py --user 00000000-0000-0000-0000-000000000000
+"""
+
+import asyncio
+import logging
+import argparse
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from database import Database
+from adherence import ROLLUP_COUNTS, ROLLUP_TABLE
+
+logger = logging.getLogger(__name__)
+
+RollupKey = Tuple[int, str]
+
+def _log_pages(db: Database, user_id: Optional[str], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """supplement_logs rows a page at a time, keyset paged on id"""
+    last_id = None
+    while True:
+        query = db.supabase.table("supplement_logs").select("id, user_id, supplement_id, log_date, status")
+        if user_id:
+            query = query.eq("user_id", user_id)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.order("id").limit(batch_size).execute().data or []
+        if not rows:
+            return
+        last_id = rows[-1]["id"]
+        yield rows
+
+def count_logs(db: Database, user_id: Optional[str] = None, batch_size: int = 1000) -> Tuple[Dict[RollupKey, Counter], Dict[RollupKey, str], int]:
+    """Status counts per (supplement, day) straight from supplement_logs"""
+    counts: Dict[RollupKey, Counter] = {}
+    owners: Dict[RollupKey, str] = {}
+    logs = 0
+    for rows in _log_pages(db, user_id, batch_size):
+        for row in rows:
+            key = (row["supplement_id"], str(row["log_date"]))
+            counts.setdefault(key, Counter())[row["status"]] += 1
+            owners[key] = row["user_id"]
+        logs += len(rows)
+    return counts, owners, logs
+
+def load_existing(db: Database, user_id: Optional[str] = None, batch_size: int = 1000) -> Dict[RollupKey, Dict[str, Any]]:
+    """Current rollup rows by (supplement, day)"""
+    existing: Dict[RollupKey, Dict[str, Any]] = {}
+    offset = 0
+    while True:
+        # Offset paging on the (supplement_id, log_date) key; nothing rewrites rollups until the read is done
+        query = db.supabase.table(ROLLUP_TABLE).select("supplement_id, log_date, user_id, " + ", ".join(ROLLUP_COUNTS))
+        if user_id:
+            query = query.eq("user_id", user_id)
+        rows = query.order("supplement_id").order("log_date").range(offset, offset + batch_size - 1).execute().data or []
+        for row in rows:
+            existing[(row["supplement_id"], str(row["log_date"]))] = row
+        if len(rows) < batch_size:
+            break
+        offset += batch_size
+    return existing
+
+def rebuild(db: Database, user_id: Optional[str] = None, batch_size: int = 1000, dry_run: bool = False) -> Dict[str, int]:
+    """Rewrite every rollup that disagrees with the raw logs"""
+    counts, owners, logs = count_logs(db, user_id, batch_size)
+    existing = load_existing(db, user_id, batch_size)
+
+    changed = []
+    for key in counts.keys() | existing.keys():
+        supplement_id, log_date = key
+        fresh = counts.get(key, Counter())
+        current = existing.get(key, {})
+        if key in existing and all((current.get(name) or 0) == fresh[name] for name in ROLLUP_COUNTS):
+            continue
+        changed.append({
+            "supplement_id": supplement_id,
+            "log_date": log_date,
+            "user_id": owners.get(key) or current["user_id"],
+            **{name: fresh[name] for name in ROLLUP_COUNTS},
+        })
+
+    if not dry_run:
+        for start in range(0, len(changed), batch_size):
+            db.supabase.table(ROLLUP_TABLE).upsert(changed[start:start + batch_size], on_conflict="supplement_id,log_date").execute()
+    return {"logs": logs, "rollups": len(counts), "existing": len(existing), "changed": len(changed)}
+
+async def main_async(args: argparse.Namespace) -> None:
+    db = Database()
+    await db.initialize()
+    try:
+        report = rebuild(db, args.user, args.batch_size, args.dry_run)
+        verb = "would rewrite" if args.dry_run else "rewrote"
+        print(
+            f"{report['logs']:,} logs -> {report['rollups']:,} daily rollups; "
+            f"{verb} {report['changed']:,} of {report['existing']:,} existing rows"
+        )
+    finally:
+        await db.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recompute adherence rollups from supplement logs")
+    parser.add_argument("--user", help="Only rebuild this user's rollups")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="Report rollups that drifted without rewriting them")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
@@ -3,71 +3,273 @@ import logging
 import asyncio
 import json
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 
-from google import genai
-from google.genai import types
 from dotenv import load_dotenv
 
+from response_cache import ResponseCache, is_personalised_follow_up
+from model_governor import ModelGovernor, ModelOverloaded
+from circuit_breaker import CircuitBreaker
+from prompt_builder import PromptBuilder
+from conversation_memory import ConversationMemory, SUMMARY_PROMPT
+from chat_retrieval import ChatRetriever
+from fallback_matcher import FallbackMatcher
+from knowledge_base import KnowledgeBase
+from model_backends import ModelBackend, backend_from_env
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+NO_RESPONSE_REPLY = "I'm sorry, I couldn't generate a helpful response at this time."
+
 class AIService:
     """AI service for generating medical assistance responses"""
 
-    def __init__(self) -> None:
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        self.client = None
+    def __init__(self, backend: Optional[ModelBackend] = None) -> None:
+        # Without a backend every reply comes from the fallback responder
+        self.backend = backend if backend is not None else backend_from_env()
 
-        if self.api_key:
-            try:
-                self.client = genai.Client(api_key=self.api_key)
-                logger.info("Gemini client initialized successfully")
-            except Exception as e:
-                logger.error(f"Failed to initialize Gemini client: {e}")
-                self.client = None
-        else:
-            logger.warning("No GEMINI_API_KEY provided — using fallback responses")
+        self.response_cache = ResponseCache.from_env()
+        self.model_governor = ModelGovernor.from_env()
+        self.circuit_breaker = CircuitBreaker.from_env()
+        self.call_timeout = float(os.getenv("GEMINI_CALL_TIMEOUT_SECONDS", "20"))
+        self.hedge_enabled = os.getenv("GEMINI_HEDGE_ENABLED", "false").lower() == "true"
+        self.hedge_max_ratio = float(os.getenv("GEMINI_HEDGE_MAX_RATIO", "0.1"))
+        self.hedge_stats: Dict[str, int] = {"calls": 0, "fired": 0, "won": 0}
+        self.prompt_builder = PromptBuilder.from_env()
+        self.fallback_matcher = FallbackMatcher()
+        self.knowledge_base = KnowledgeBase.from_env()
+        self.chat_retriever = ChatRetriever.from_env()
+        self.conversation_memory = ConversationMemory.from_env(
+            summarize=self._summarize_with_model if self.backend else None
+        )
 
     async def generate_response(
         self,
         user_message: str,
         context: Dict[str, Any],
-        chat_history: List[Dict[str, Any]]
+        chat_history: List[Dict[str, Any]],
+        use_cache: bool = True
     ) -> str:
         """Generate AI response to user message"""
+        # Simple factual questions are answered straight from the knowledge base
+        instant = self.knowledge_base.answer(user_message)
+        if instant:
+            return instant
+
         try:
-            if self.client:
-                return await self._generate_gemini_response(user_message, context, chat_history)
+            if self.backend:
+                cache_key = self._cache_key(user_message, context, use_cache)
+                if cache_key:
+                    cached = await self.response_cache.get(cache_key)
+                    if cached is not None:
+                        return cached
+
+                reply = await self._generate_model_response(user_message, context, chat_history)
+                await self._cache_reply(cache_key, reply, context)
+                return reply
+            return self._generate_fallback_response(user_message, context)
+        except ModelOverloaded as e:
+            logger.warning(f"Shedding model call: {e}")
+            return self._generate_fallback_response(user_message, context)
+        except asyncio.TimeoutError:
+            logger.warning(f"Model call timed out after {self.call_timeout}s")
             return self._generate_fallback_response(user_message, context)
         except Exception as e:
             logger.error(f"AI response generation error: {e}")
             return self._generate_fallback_response(user_message, context)
 
-    async def _generate_gemini_response(
+    async def _generate_model_response(
         self,
         user_message: str,
         context: Dict[str, Any],
         chat_history: List[Dict[str, Any]]
     ) -> str:
-        """Generate response using Gemini AI"""
-        if self.client is None:
-            raise RuntimeError("Gemini client is not initialized")
+        """Generate response using the model backend"""
+        if self.backend is None:
+            raise RuntimeError("Model backend is not initialized")
 
+        self.circuit_breaker.check()
         prompt = self._build_medical_prompt(user_message, context, chat_history)
+        # Async backend call, bounded by the governor rather than a thread pool
+        async with self.model_governor.slot(context.get("user_id")):
+            try:
+                with self.circuit_breaker.guard():
+                    text = await self._hedged_generate(prompt)
+            except (ModelOverloaded, asyncio.TimeoutError):
+                raise
+            except Exception as e:
+                logger.error(f"Model backend error: {e}")
+                return NO_RESPONSE_REPLY
+        return text or NO_RESPONSE_REPLY
+
+    async def _model_call(self, prompt: str, timeout: float) -> Optional[str]:
+        """One backend call, bounded by a timeout"""
+        return await asyncio.wait_for(
+            self.backend.generate(prompt, system_instruction=self.prompt_builder.system_instruction),
+            timeout,
+        )
+
+    async def _hedged_generate(self, prompt: str) -> Optional[str]:
+        """Call the model, firing a second request if the first outlives the recent p95"""
+        self.hedge_stats["calls"] += 1
+        delay = self._hedge_delay()
+        if delay is None:
+            return await self._model_call(prompt, self.call_timeout)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.call_timeout
+        primary = asyncio.ensure_future(self._model_call(prompt, self.call_timeout))
+        pending = {primary}
         try:
-            response = await asyncio.to_thread(
-                self.client.models.generate_content,
-                model="gemini-2.5-flash",
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    thinking_config=types.ThinkingConfig(thinking_budget=0)
-                ),
-            )
-            return response.text or "I'm sorry, I couldn't generate a helpful response at this time."
-        except Exception as e:
-            logger.error(f"Gemini AI error: {e}")
-            return "I'm sorry, I couldn't generate a helpful response at this time."
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                # The hedge shares the caller's governor slot; the ratio cap bounds the extra load
+                self.hedge_stats["fired"] += 1
+                # Both requests share the original deadline
+                hedge = asyncio.ensure_future(self._model_call(prompt, max(0.0, deadline - loop.time())))
+                pending.add(hedge)
+
+            error: Optional[BaseException] = None
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_stats["won"] += 1
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None when hedging is off or over budget"""
+        if not self.hedge_enabled:
+            return None
+        if self.hedge_stats["fired"] >= self.hedge_stats["calls"] * self.hedge_max_ratio:
+            return None
+        return self.circuit_breaker.latency_percentile(95)
+
+    async def stream_response(
+        self,
+        user_message: str,
+        context: Dict[str, Any],
+        chat_history: List[Dict[str, Any]],
+        use_cache: bool = True
+    ) -> AsyncIterator[str]:
+        """Stream AI response text chunks as they are generated"""
+        instant = self.knowledge_base.answer(user_message)
+        if instant:
+            for chunk in self._chunk_text(instant):
+                yield chunk
+            return
+
+        if self.backend:
+            cache_key = self._cache_key(user_message, context, use_cache)
+            if cache_key:
+                cached = await self.response_cache.get(cache_key)
+                if cached is not None:
+                    for chunk in self._chunk_text(cached):
+                        yield chunk
+                    return
+
+            streamed: List[str] = []
+            try:
+                async for chunk in self._stream_model_response(user_message, context, chat_history):
+                    streamed.append(chunk)
+                    yield chunk
+                await self._cache_reply(cache_key, "".join(streamed), context)
+                return
+            except ModelOverloaded as e:
+                logger.warning(f"Shedding model stream: {e}")
+            except Exception as e:
+                logger.error(f"Model streaming error: {e!r}")
+                # Once text has reached the client, appending a fallback would garble the reply
+                if streamed:
+                    return
+
+        for chunk in self._chunk_text(self._generate_fallback_response(user_message, context)):
+            yield chunk
+
+    async def _stream_model_response(
+        self,
+        user_message: str,
+        context: Dict[str, Any],
+        chat_history: List[Dict[str, Any]]
+    ) -> AsyncIterator[str]:
+        """Stream a response from the model backend"""
+        if self.backend is None:
+            raise RuntimeError("Model backend is not initialized")
+
+        self.circuit_breaker.check()
+        prompt = self._build_medical_prompt(user_message, context, chat_history)
+        async with self.model_governor.slot(context.get("user_id")):
+            # Breaker latency for a stream is the time to its first text
+            with self.circuit_breaker.guard() as call:
+                stream = self.backend.stream(prompt, system_instruction=self.prompt_builder.system_instruction)
+                produced_text = False
+                try:
+                    while True:
+                        # The timeout bounds each wait for text, not the whole stream
+                        try:
+                            text = await asyncio.wait_for(stream.__anext__(), self.call_timeout)
+                        except StopAsyncIteration:
+                            break
+                        if text:
+                            call.mark_first_output()
+                            produced_text = True
+                            yield text
+                finally:
+                    await stream.aclose()
+
+        if not produced_text:
+            yield NO_RESPONSE_REPLY
+
+    def _cache_key(self, user_message: str, context: Dict[str, Any], use_cache: bool) -> Optional[str]:
+        """Cache key for a question, or None when the cache is off or must be bypassed"""
+        if self.response_cache is None:
+            return None
+        if not use_cache or is_personalised_follow_up(user_message):
+            self.response_cache.record_bypass()
+            return None
+        return self.response_cache.make_key(user_message, context)
+
+    async def _cache_reply(self, cache_key: Optional[str], reply: str, context: Dict[str, Any]) -> None:
+        """Store a model reply unless it is an error reply or addresses the user by name"""
+        if not cache_key or not reply or reply == NO_RESPONSE_REPLY:
+            return
+        user_name = context.get("user_name") or ""
+        if user_name and user_name.lower() in reply.lower():
+            return
+        await self.response_cache.set(cache_key, reply)
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Response cache hit-rate and knowledge base instant-answer metrics"""
+        knowledge_base = self.knowledge_base.get_stats()
+        if self.response_cache is None:
+            return {"enabled": False, "knowledge_base": knowledge_base}
+        return {"enabled": True, **self.response_cache.get_stats(), "knowledge_base": knowledge_base}
+
+    def get_model_stats(self) -> Dict[str, Any]:
+        """Model concurrency governor, circuit breaker, hedging and backend metrics"""
+        return {
+            **self.model_governor.get_stats(),
+            "backend": self.backend.get_stats() if self.backend else None,
+            "circuit_breaker": self.circuit_breaker.get_stats(),
+            "hedging": {"enabled": self.hedge_enabled, **self.hedge_stats},
+        }
+
+    @staticmethod
+    def _chunk_text(text: str, words_per_chunk: int = 4) -> List[str]:
+        """Split a ready-made reply into word groups so it streams like model output"""
+        words = text.split(" ")
+        return [
+            " ".join(words[i:i + words_per_chunk]) + (" " if i + words_per_chunk < len(words) else "")
+            for i in range(0, len(words), words_per_chunk)
+        ]
 
     def _build_medical_prompt(
         self,
@@ -75,57 +277,34 @@ class AIService:
         context: Dict[str, Any],
         chat_history: List[Dict[str, Any]]
     ) -> str:
-        """Build a concise medical prompt with context and history"""
-        
-        # Get user context
-        user_name = context.get("user_name", "")
-        user_age = context.get("user_age", "")
-        supplements = context.get("supplements", [])
-        
-        # Build supplement context
-        supplement_context = ""
-        if supplements:
-            supplement_list = []
-            for supp in supplements:
-                name = supp.get('name', 'Unknown')
-                form = supp.get('dosage_form', '')
-                freq = supp.get('frequency', '')
-                supplement_list.append(f"{name} ({form}, {freq})")
-            supplement_context = f"Current supplements: {', '.join(supplement_list[:3])}" # Limit to 3 for brevity
-            if len(supplements) > 3:
-                supplement_context += f" and {len(supplements) - 3} more"
-        
-        # Build conversation history (last 3 exchanges only)
-        history_context = ""
-        recent_history = chat_history[-6:] if chat_history else []
-        if recent_history:
-            history_parts = []
-            for msg in recent_history:
-                sender = "User" if msg.get('sender') == 'user' else "Assistant"
-                text = msg.get('message', '')[:100] # Truncate long messages
-                history_parts.append(f"{sender}: {text}")
-            history_context = f"Recent conversation: {' | '.join(history_parts)}"
-
-        # Concise system prompt
-        system_prompt = f"""You are SafeDoser Assistant, a helpful medical AI for supplement and medication guidance.
-
-GUIDELINES:
-- Be concise and helpful (2-3 sentences max for simple questions)
-- Only mention user's name/age when directly relevant to the medical advice
-- Prioritize safety - recommend healthcare providers for serious concerns
-- Provide evidence-based information
-- Never diagnose conditions
-
-CONTEXT:
-User: {user_name}, {user_age} years old
-{supplement_context}
-{history_context}
-
-USER QUESTION: {user_message}
-
-Provide a helpful, concise response. Use the user's name sparingly and only when it adds value to the response."""
-
-        return system_prompt
+        """Build a medical prompt with context and history within the token budget"""
+        return self.prompt_builder.build(user_message, context, chat_history)
+
+    async def _summarize_with_model(
+        self,
+        summary: str,
+        user_message: str,
+        reply: str,
+        max_tokens: int
+    ) -> Optional[str]:
+        """Fold an exchange into the running conversation summary using the model"""
+        if self.backend is None:
+            return None
+
+        prompt = SUMMARY_PROMPT.format(
+            max_words=int(max_tokens * 0.75),
+            summary=summary or "(empty)",
+            user_message=user_message,
+            reply=reply,
+        )
+        self.circuit_breaker.check()
+        # Background work: only the global limit applies, not the user's slots
+        async with self.model_governor.slot():
+            with self.circuit_breaker.guard():
+                return await asyncio.wait_for(
+                    self.backend.generate(prompt, max_output_tokens=max_tokens * 2),
+                    self.call_timeout,
+                )
 
     def _generate_fallback_response(
         self,
@@ -144,10 +323,13 @@ Provide a helpful, concise response. Use the user's name sparingly and only when
 
         # Supplement-specific questions
         mentioned_supplement = None
-        for supp in supplements:
-            if supp.get('name', '').lower() in lower_message:
-                mentioned_supplement = supp
-                break
+        if len(supplements) >= self.fallback_matcher.compiled_names_min:
+            mentioned_supplement = self.fallback_matcher.first_mentioned(lower_message, supplements, context.get("user_id"))
+        else:
+            for supp in supplements:
+                if supp.get('name', '').lower() in lower_message:
+                    mentioned_supplement = supp
+                    break
 
         if mentioned_supplement:
             name = mentioned_supplement.get('name', 'this supplement')
@@ -179,65 +361,3 @@ Provide a helpful, concise response. Use the user's name sparingly and only when
 
         # Default response
         return "I can help with supplement information, interactions, timing, dosage guidance, and general health questions. What would you like to know? For personalized medical advice, always consult your healthcare provider."
-
-    def _get_supplement_info(self, name: str, age: int) -> str:
-        """Get basic information about a supplement"""
-        lower_name = name.lower()
-        
-        if 'vitamin d' in lower_name:
-            return "Vitamin D3 supports bone health and immune function. Best absorbed with fat-containing meals. Consider checking blood levels annually."
-        
-        if 'omega' in lower_name or 'fish oil' in lower_name:
-            return "Omega-3 supports heart and brain health. Take with meals to reduce aftertaste. Look for EPA/DHA content on labels."
-        
-        if 'magnesium' in lower_name:
-            return "Magnesium supports muscle function and sleep. Evening timing is often preferred as it can be relaxing."
-        
-        if 'vitamin c' in lower_name:
-            return "Vitamin C is a powerful antioxidant supporting immune function. Timing is flexible since it's water-soluble."
-        
-        if 'probiotic' in lower_name:
-            return "Probiotics support digestive and immune health. Best taken consistently, often with meals."
-        
-        if 'melatonin' in lower_name:
-            return "Melatonin helps regulate sleep cycles. Take 30-60 minutes before bedtime. Start with the lowest effective dose."
-        
-        return "This supplement can be beneficial as part of a balanced health regimen. Consult your healthcare provider for specific guidance."
-
-    def _get_basic_interaction_info(self, name: str) -> str:
-        """Get basic interaction information for a supplement"""
-        lower_name = name.lower()
-        
-        if 'vitamin d' in lower_name:
-            return 'Works well with calcium, avoid with thiazide diuretics'
-        if 'omega' in lower_name:
-            return 'May enhance blood-thinning medications'
-        if 'magnesium' in lower_name:
-            return 'Can affect absorption of antibiotics'
-        if 'vitamin c' in lower_name:
-            return 'Enhances iron absorption'
-        if 'probiotic' in lower_name:
-            return 'Take 2+ hours apart from antibiotics'
-        if 'melatonin' in lower_name:
-            return 'May interact with blood thinners'
-        
-        return 'Check with pharmacist for specific interactions'
-
-    def _get_basic_benefit_info(self, name: str) -> str:
-        """Get basic benefit information for a supplement"""
-        lower_name = name.lower()
-        
-        if 'vitamin d' in lower_name:
-            return 'Bone health, immune support'
-        if 'omega' in lower_name:
-            return 'Heart health, brain function'
-        if 'magnesium' in lower_name:
-            return 'Muscle function, sleep quality'
-        if 'vitamin c' in lower_name:
-            return 'Immune support, antioxidant protection'
-        if 'probiotic' in lower_name:
-            return 'Digestive health, immune support'
-        if 'melatonin' in lower_name:
-            return 'Sleep regulation'
-        
-        return 'Supports overall health and wellness'
\ No newline at end of file
@@ -5,15 +5,18 @@ A comprehensive FastAPI backend for the SafeDoser medication management app.
 
 import os
 import logging
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 from typing import Optional, List, Dict, Any
 import asyncio
+import json
+import time
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Request, Form
+from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Request, Form, Response, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, EmailStr, validator
 import uvicorn
 
@@ -21,16 +24,33 @@ import uvicorn
 from database import Database, get_database
 from auth import AuthService, get_current_user
 from ai_service import AIService
+from interactions import InteractionIndex
 from email_service import EmailService, EmailDeliveryResult
 from token_service import TokenService
 from oauth_service import OAuthService
 from models import (
     UserCreate, UserLogin, UserResponse, UserUpdate,
     SupplementCreate, SupplementUpdate, SupplementResponse,
+    SupplementAlert, SupplementInteraction, InteractionCheckResponse,
     ChatMessage, ChatResponse, ChatHistoryResponse,
-    HealthResponse
+    HealthResponse, ImageUploadResponse, ScanJobResponse,
+    TimelineItem, TimelineResponse,
+    SupplementLogCreate, SupplementLogUpdate, SupplementLogBatchCreate, SupplementLogResponse,
+    AdherenceResponse
 )
-from utils import setup_logging, handle_image_upload
+from utils import setup_logging, handle_image_upload, handle_image_url, handle_inline_image, StageTimer
+from image_ingest import UploadIngestor
+from image_pipeline import ImagePipeline
+from blob_store import LocalBlobStore, BLOB_KEY
+from image_derivatives import DerivativeCache, DERIVATIVE_FORMATS, pick_format, pick_size
+from image_pipeline import ImagePipelineBusy, InvalidImage
+from image_dedup import ImageHashIndex
+from scan_jobs import ScanJobQueue, ScanQueueFull
+from timeline import TimelineEngine, MINUTES_PER_DAY, SupplementsVersion, iter_supplement_pages
+from reminder_scheduler import ReminderFeed, ReminderScheduler
+from dose_index import DoseIndex
+from adherence_log import AdherenceLogWriter, log_row
+from adherence import AdherenceRange, BUCKETS, MAX_RANGE_DAYS, load_rollups
 
 # Setup logging
 setup_logging()
@@ -39,6 +59,34 @@ logger = logging.getLogger(__name__)
 # Security
 security = HTTPBearer()
 
+# Reply sent when the chat pipeline fails outright
+CHAT_FALLBACK_REPLY = (
+    "I'm experiencing some technical difficulties right now, but I'm still here to help! 🔧\n\n"
+    "For immediate medical questions, please contact your healthcare provider. "
+    "For general supplement information, you can also check reliable sources like your pharmacist "
+    "or trusted medical websites.\n\n"
+    "I'll be back to full functionality soon. Thank you for your patience! 💊"
+)
+
+# Deferred chat persistence retry policy
+CHAT_SAVE_ATTEMPTS = 3
+CHAT_SAVE_BACKOFF_SECONDS = 0.5
+
+async def _load_dose_schedules(db: Database, reminder_scheduler: ReminderScheduler, dose_index: DoseIndex):
+    """Fill the reminder wheel and dose index from every stored supplement"""
+    loaded = 0
+    try:
+        async for rows in iter_supplement_pages(db):
+            for row in rows:
+                reminder_scheduler.set_supplement(row["user_id"], row)
+                dose_index.set_supplement(row["user_id"], row)
+            loaded += len(rows)
+            # Let requests in between pages
+            await asyncio.sleep(0)
+        logger.info(f"Loaded schedules for {loaded} supplements ({len(dose_index)} doses)")
+    except Exception as e:
+        logger.error(f"Failed to load supplement schedules: {str(e)}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager"""
@@ -50,6 +98,22 @@ async def lifespan(app: FastAPI):
     
     # Initialize services
     ai_service = AIService()
+    interaction_index = InteractionIndex.from_env()
+    upload_ingestor = UploadIngestor.from_env()
+    image_pipeline = ImagePipeline.from_env()
+    blob_store = LocalBlobStore.from_env()
+    derivative_cache = DerivativeCache.from_env()
+    image_hash_index = ImageHashIndex.from_env()
+    scan_queue = ScanJobQueue.from_env()
+    scan_queue.start()
+    timeline_engine = TimelineEngine()
+    reminder_feed = ReminderFeed()
+    reminder_scheduler = ReminderScheduler.from_env(reminder_feed.deliver)
+    reminder_scheduler.start()
+    dose_index = DoseIndex(default_tz_offset=reminder_scheduler.default_tz_offset)
+    dose_index.start()
+    adherence_log = AdherenceLogWriter.from_env(db)
+    schedule_loader = asyncio.create_task(_load_dose_schedules(db, reminder_scheduler, dose_index))
     email_service = EmailService()
     token_service = TokenService(db)
     oauth_service = OAuthService(db)
@@ -57,6 +121,18 @@ async def lifespan(app: FastAPI):
     # Store in app state
     app.state.db = db
     app.state.ai_service = ai_service
+    app.state.interaction_index = interaction_index
+    app.state.upload_ingestor = upload_ingestor
+    app.state.image_pipeline = image_pipeline
+    app.state.blob_store = blob_store
+    app.state.derivative_cache = derivative_cache
+    app.state.image_hash_index = image_hash_index
+    app.state.scan_queue = scan_queue
+    app.state.timeline_engine = timeline_engine
+    app.state.reminder_feed = reminder_feed
+    app.state.reminder_scheduler = reminder_scheduler
+    app.state.dose_index = dose_index
+    app.state.adherence_log = adherence_log
     app.state.email_service = email_service
     app.state.token_service = token_service
     app.state.oauth_service = oauth_service
@@ -88,6 +164,12 @@ async def lifespan(app: FastAPI):
     
     # Cleanup
     logger.info("Shutting down SafeDoser Backend API...")
+    image_pipeline.shutdown()
+    await scan_queue.stop()
+    schedule_loader.cancel()
+    await reminder_scheduler.stop()
+    await dose_index.stop()
+    await adherence_log.close()
     await db.close()
 
 # Create FastAPI app
@@ -248,6 +330,11 @@ async def signup(
                 detail=f"Email '{user_data.email}' is already registered."
             )
         
+        # Store an inline avatar as a blob so the row only holds its URL; avatars stay out of the hash index
+        user_data.avatar = await handle_inline_image(
+            user_data.avatar, user_data.email, app.state.image_pipeline, app.state.blob_store
+        )
+
         # Create user (will be unverified initially)
         user = await auth_service.create_user(user_data)
         
@@ -623,15 +710,23 @@ async def update_profile(
     """Update user profile"""
     try:
         auth_service = AuthService(db)
+        update_data = profile_data.dict(exclude_unset=True)
+        if update_data.get("avatar"):
+            # Avatars stay out of the near-duplicate hash index
+            update_data["avatar"] = await handle_inline_image(
+                update_data["avatar"], current_user["id"], app.state.image_pipeline, app.state.blob_store
+            )
         
         # Update user profile
         updated_user = await auth_service.update_user(
             current_user["id"], 
-            profile_data.dict(exclude_unset=True)
+            update_data
         )
         
         return {"user": updated_user}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Profile update error: {str(e)}")
         raise HTTPException(
@@ -657,6 +752,51 @@ async def get_supplements(
             detail="Failed to fetch supplements"
         )
 
+def _interaction_alert(found: Dict[str, Any]) -> SupplementAlert:
+    first, second = found["supplements"]
+    return SupplementAlert(
+        type="interaction",
+        message=f"{found['severity'].capitalize()} interaction between {first['name']} and {second['name']}: {' '.join(found['messages'])}"
+    )
+
+@app.get("/supplements/interactions", response_model=InteractionCheckResponse)
+async def check_supplement_interactions(
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_database)
+):
+    """Check the user's whole regimen for interactions"""
+    try:
+        supplements = await db.get_user_supplements(current_user["id"])
+        result = app.state.interaction_index.check(supplements)
+
+        interactions = []
+        alerts: Dict[int, List[SupplementAlert]] = {}
+        for found in result["interactions"]:
+            first, second = found["supplements"]
+            alert = _interaction_alert(found)
+            interactions.append(SupplementInteraction(
+                supplement_ids=[first["id"], second["id"]],
+                supplement_names=[first["name"], second["name"]],
+                ingredients=found["ingredients"],
+                severity=found["severity"],
+                alert=alert
+            ))
+            for supp in (first, second):
+                alerts.setdefault(supp["id"], []).append(alert)
+
+        return InteractionCheckResponse(
+            interactions=interactions,
+            alerts=alerts,
+            unrecognized=result["unrecognized"]
+        )
+
+    except Exception as e:
+        logger.error(f"Interaction check error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to check interactions"
+        )
+
 @app.post("/supplements", response_model=SupplementResponse)
 async def create_supplement(
     supplement_data: SupplementCreate,
@@ -665,12 +805,23 @@ async def create_supplement(
 ):
     """Create a new supplement"""
     try:
+        supplement_dict = supplement_data.dict()
+        supplement_dict["image_url"] = await handle_image_url(
+            supplement_dict.get("image_url"), current_user["id"], app.state.image_pipeline, app.state.blob_store,
+            app.state.image_hash_index
+        )
         supplement = await db.create_supplement(
             current_user["id"], 
-            supplement_data.dict()
+            supplement_dict
         )
+        app.state.ai_service.fallback_matcher.invalidate(current_user["id"])
+        app.state.timeline_engine.invalidate(current_user["id"])
+        app.state.reminder_scheduler.set_supplement(current_user["id"], supplement)
+        app.state.dose_index.set_supplement(current_user["id"], supplement)
         return supplement
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Create supplement error: {str(e)}")
         raise HTTPException(
@@ -696,10 +847,20 @@ async def update_supplement(
             )
         
         # Update supplement
+        update_data = supplement_data.dict(exclude_unset=True)
+        if update_data.get("image_url"):
+            update_data["image_url"] = await handle_image_url(
+                update_data["image_url"], current_user["id"], app.state.image_pipeline, app.state.blob_store,
+                app.state.image_hash_index
+            )
         updated_supplement = await db.update_supplement(
             supplement_id, 
-            supplement_data.dict(exclude_unset=True)
+            update_data
         )
+        app.state.ai_service.fallback_matcher.invalidate(current_user["id"])
+        app.state.timeline_engine.invalidate(current_user["id"])
+        app.state.reminder_scheduler.set_supplement(current_user["id"], updated_supplement)
+        app.state.dose_index.set_supplement(current_user["id"], updated_supplement)
         return updated_supplement
         
     except HTTPException:
@@ -729,6 +890,10 @@ async def delete_supplement(
         
         # Delete supplement
         await db.delete_supplement(supplement_id)
+        app.state.ai_service.fallback_matcher.invalidate(current_user["id"])
+        app.state.timeline_engine.invalidate(current_user["id"])
+        app.state.reminder_scheduler.remove_supplement(supplement_id)
+        app.state.dose_index.remove_supplement(supplement_id)
         return {"message": "Supplement deleted successfully"}
         
     except HTTPException:
@@ -740,69 +905,512 @@ async def delete_supplement(
             detail="Failed to delete supplement"
         )
 
+# Timeline endpoints
+def _client_now(user_id: str, tz_offset: Optional[int]) -> datetime:
+    """Current time on the client's clock; tz_offset is minutes east of UTC (e.g. 60 for UTC+1)"""
+    if tz_offset is None:
+        return datetime.now(timezone.utc)
+    if not -14 * 60 <= tz_offset <= 14 * 60:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="tz_offset must be between -840 and 840 minutes"
+        )
+    # Reminders follow the clock of the device the user last opened the app on
+    app.state.reminder_scheduler.set_user_offset(user_id, tz_offset)
+    app.state.dose_index.set_user_offset(user_id, tz_offset)
+    return datetime.now(timezone(timedelta(minutes=tz_offset)))
+
+def _supplements_version(db: Database, user_id: str) -> SupplementsVersion:
+    """Count and latest updated_at of a user's supplements; any add, edit or delete changes it"""
+    result = (
+        db.supabase.table("supplements")
+        .select("updated_at", count="exact")
+        .eq("user_id", user_id)
+        .order("updated_at", desc=True)
+        .limit(1)
+        .execute()
+    )
+    return result.count or 0, result.data[0]["updated_at"] if result.data else None
+
+async def _user_timeline(db: Database, user_id: str, day: date):
+    """A user's compiled timeline for a day, compiling it on a cache miss"""
+    engine = app.state.timeline_engine
+    # One small query keeps workers from serving timelines another worker made stale
+    version = await asyncio.to_thread(_supplements_version, db, user_id)
+    timeline = engine.cached(user_id, day, version)
+    if timeline is None:
+        supplements = await db.get_user_supplements(user_id)
+        alerts: Dict[int, List[Dict[str, Any]]] = {}
+        for found in app.state.interaction_index.check(supplements)["interactions"]:
+            alert = _interaction_alert(found).dict()
+            for supp in found["supplements"]:
+                alerts.setdefault(supp["id"], []).append(alert)
+        timeline = engine.compile(user_id, day, supplements, alerts, version)
+    return timeline
+
+def _load_day_logs(db: Database, user_id: str, day: date) -> List[Dict[str, Any]]:
+    """A user's supplement logs for one day"""
+    result = db.supabase.table("supplement_logs").select("*").eq("user_id", user_id).eq("log_date", day.isoformat()).execute()
+    return result.data or []
+
+@app.get("/timeline", response_model=TimelineResponse)
+async def get_timeline(
+    date: Optional[date] = None,
+    tz_offset: Optional[int] = None,
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_database)
+):
+    """Get the day's doses in time order with their current status (date defaults to the client's today)"""
+    now = _client_now(current_user["id"], tz_offset)
+    try:
+        day = date or now.date()
+        timeline = await _user_timeline(db, current_user["id"], day)
+
+        logs: List[Dict[str, Any]] = []
+        if len(timeline):
+            try:
+                logs = await asyncio.to_thread(_load_day_logs, db, current_user["id"], day)
+            except Exception as e:
+                logger.error(f"Failed to load supplement logs for {current_user['id']}: {str(e)}")
+        # Minutes between now and the requested day's midnight
+        minutes_from_now = (day - now.date()).days * MINUTES_PER_DAY - (now.hour * 60 + now.minute)
+
+        return TimelineResponse(
+            date=day,
+            items=[TimelineItem(**row) for row in timeline.rows(minutes_from_now, logs)]
+        )
+
+    except Exception as e:
+        logger.error(f"Timeline error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to build timeline"
+        )
+
+@app.get("/timeline/stats")
+async def timeline_stats():
+    """Get timeline cache metrics"""
+    return app.state.timeline_engine.get_stats()
+
+# Adherence endpoints
+@app.get("/adherence", response_model=AdherenceResponse)
+async def get_adherence(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    bucket: str = "day",
+    tz_offset: Optional[int] = None,
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_database)
+):
+    """Get adherence rate, streaks and day/week/month totals (defaults to the last 30 days)"""
+    today = _client_now(current_user["id"], tz_offset).date()
+    end = min(end or today, today)
+    start = start or end - timedelta(days=29)
+    if bucket not in BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"bucket must be one of {', '.join(BUCKETS)}"
+        )
+    if start > end or (end - start).days >= MAX_RANGE_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"start must be on or before end and at most {MAX_RANGE_DAYS} days earlier"
+        )
+    try:
+        supplements = await db.get_user_supplements(current_user["id"])
+        rollups = await asyncio.to_thread(load_rollups, db, current_user["id"], start, end)
+        adherence = AdherenceRange(start, end, supplements, rollups)
+        return AdherenceResponse(start=start, end=end, bucket=bucket, buckets=adherence.buckets(bucket), **adherence.summary())
+
+    except Exception as e:
+        logger.error(f"Adherence error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to compute adherence"
+        )
+
+# Supplement log endpoints
+async def _check_supplement_owner(db: Database, user_id: str, supplement_ids: List[int]) -> None:
+    """404 unless every supplement belongs to the user; scheduled ones are checked in memory"""
+    dose_index = app.state.dose_index
+    for supplement_id in set(supplement_ids):
+        owner = dose_index.owner(supplement_id)
+        if owner is None:
+            supplement = await db.get_supplement_by_id(supplement_id)
+            owner = supplement["user_id"] if supplement else None
+        if owner != user_id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Supplement not found"
+            )
+
+@app.get("/supplement-logs", response_model=List[SupplementLogResponse])
+async def get_supplement_logs(
+    date: Optional[date] = None,
+    supplement_id: Optional[int] = None,
+    tz_offset: Optional[int] = None,
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_database)
+):
+    """Get the user's supplement logs for a day (defaults to the client's today)"""
+    now = _client_now(current_user["id"], tz_offset)
+    try:
+        logs = await asyncio.to_thread(_load_day_logs, db, current_user["id"], date or now.date())
+        if supplement_id is not None:
+            logs = [log for log in logs if log["supplement_id"] == supplement_id]
+        return logs
+
+    except Exception as e:
+        logger.error(f"Get supplement logs error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch supplement logs"
+        )
+
+@app.get("/supplement-logs/today", response_model=List[SupplementLogResponse])
+async def get_today_supplement_logs(
+    tz_offset: Optional[int] = None,
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_database)
+):
+    """Get the user's supplement logs for today"""
+    return await get_supplement_logs(None, None, tz_offset, current_user, db)
+
+@app.post("/supplement-logs", response_model=SupplementLogResponse)
+async def create_supplement_log(
+    log_data: SupplementLogCreate,
+    tz_offset: Optional[int] = None,
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_database)
+):
+    """Record a dose's status; repeating it for the same dose and day updates the same log"""
+    now = _client_now(current_user["id"], tz_offset)
+    await _check_supplement_owner(db, current_user["id"], [log_data.supplement_id])
+    try:
+        row = log_row(
+            current_user["id"], log_data.supplement_id, log_data.log_date or now.date(),
+            log_data.scheduled_time, log_data.status, notes=log_data.notes
+        )
+        stored = await app.state.adherence_log.write([row])
+        return stored[0]
+
+    except Exception as e:
+        logger.error(f"Create supplement log error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to save supplement log"
+        )
+
+@app.post("/supplement-logs/mark-completed", response_model=SupplementLogResponse)
+async def mark_supplement_completed(
+    log_data: SupplementLogCreate,
+    tz_offset: Optional[int] = None,
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_database)
+):
+    """Check a dose off (or record it skipped or missed)"""
+    return await create_supplement_log(log_data, tz_offset, current_user, db)
+
+@app.post("/supplement-logs/batch", response_model=List[SupplementLogResponse])
+async def batch_supplement_logs(
+    batch: SupplementLogBatchCreate,
+    tz_offset: Optional[int] = None,
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_database)
+):
+    """Set the status of many of the day's doses in one write, e.g. every morning dose taken"""
+    now = _client_now(current_user["id"], tz_offset)
+    try:
+        day = batch.log_date or now.date()
+        timeline = await _user_timeline(db, current_user["id"], day)
+        wanted = set(batch.supplement_ids) if batch.supplement_ids is not None else None
+        rows = [
+            log_row(current_user["id"], item["supplement_id"], day, item["time"], batch.status)
+            for item in timeline.items
+            if (batch.period is None or item["period"] == batch.period)
+            and (wanted is None or item["supplement_id"] in wanted)
+        ]
+        if rows:
+            rows = await app.state.adherence_log.write(rows)
+        return rows
+
+    except Exception as e:
+        logger.error(f"Batch supplement log error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to save supplement logs"
+        )
+
+@app.put("/supplement-logs/{log_id}", response_model=SupplementLogResponse)
+async def update_supplement_log(
+    log_id: str,
+    update_data: SupplementLogUpdate,
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_database)
+):
+    """Update a supplement log"""
+    try:
+        writer = app.state.adherence_log
+        # Always the stored row: another worker may have changed the dose since this one wrote it
+        result = await asyncio.to_thread(
+            lambda: db.supabase.table("supplement_logs").select("*").eq("id", log_id).execute()
+        )
+        log = result.data[0] if result.data else None
+        if not log or log["user_id"] != current_user["id"]:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Supplement log not found"
+            )
+
+        changes = update_data.dict(exclude_unset=True)
+        status_value = changes.get("status") or log["status"]
+        row = log_row(
+            current_user["id"],
+            log["supplement_id"],
+            date.fromisoformat(str(log["log_date"])),
+            log["scheduled_time"],
+            status_value,
+            taken_at=changes.get("taken_at"),
+            notes=changes["notes"] if "notes" in changes else log.get("notes"),
+        )
+        # Stored under the dose's existing log, whatever its id
+        stored = await writer.write([row])
+        return stored[0]
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Update supplement log error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to update supplement log"
+        )
+
+@app.get("/supplement-logs/stats")
+async def supplement_log_stats():
+    """Get adherence log batching metrics"""
+    return app.state.adherence_log.get_stats()
+
+# Reminder endpoints
+@app.get("/reminders/events")
+async def stream_reminders(current_user: dict = Depends(get_current_user)):
+    """Stream dose reminders as Server-Sent Events while the app is open"""
+    feed = app.state.reminder_feed
+
+    async def event_stream():
+        queue = feed.subscribe(current_user["id"])
+        try:
+            yield _sse_event({"status": "subscribed"}, event="start")
+            while True:
+                try:
+                    reminder = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Comment frame keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse_event(reminder, event="reminder")
+        finally:
+            feed.unsubscribe(current_user["id"], queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/reminders/stats")
+async def reminder_stats():
+    """Get reminder scheduler and delivery metrics"""
+    return {
+        **app.state.reminder_scheduler.get_stats(),
+        "feed": app.state.reminder_feed.get_stats(),
+        "doses": app.state.dose_index.get_stats(),
+    }
+
 # Chat endpoints
+def _chat_supplements(db: Database, user_id: str) -> List[Dict[str, Any]]:
+    """A user's supplements for the chat prompt; blocks on the Supabase client"""
+    result = db.supabase.table("supplements").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
+    return result.data or []
+
+def _recent_chat_history(db: Database, user_id: str, limit: int) -> List[Dict[str, Any]]:
+    """A user's newest chat messages, oldest first; blocks on the Supabase client"""
+    result = (
+        db.supabase.table("chat_messages")
+        .select("*")
+        .eq("user_id", user_id)
+        .order("timestamp", desc=True)
+        .limit(limit)
+        .execute()
+    )
+    return list(reversed(result.data or []))
+
+async def _gather_chat_context(db: Database, current_user: dict, user_message: str):
+    """Fetch supplements, recent history, the conversation summary and relevant
+    earlier exchanges concurrently"""
+    ai_service = app.state.ai_service
+    # The Supabase client is synchronous, so its queries run in threads to overlap
+    supplements, chat_history, summary, relevant_history = await asyncio.gather(
+        asyncio.to_thread(_chat_supplements, db, current_user["id"]),
+        asyncio.to_thread(_recent_chat_history, db, current_user["id"], 10),
+        ai_service.conversation_memory.get_summary(db, current_user["id"]),
+        ai_service.chat_retriever.retrieve(db, current_user["id"], user_message)
+    )
+    context = {
+        "user_id": current_user["id"],
+        "user_name": current_user["name"],
+        "user_age": current_user["age"],
+        "supplements": supplements,
+        "conversation_summary": summary,
+        "relevant_history": relevant_history,
+        "current_time": datetime.utcnow().isoformat()
+    }
+    return context, chat_history
+
+async def _persist_chat_exchange(
+    db: Database,
+    user_id: str,
+    user_message: str,
+    reply: str,
+    context: Dict[str, Any]
+):
+    """Save a user message and its reply in order, retrying transient failures,
+    then fold the exchange into the rolling conversation summary"""
+    for sender, text in (("user", user_message), ("assistant", reply)):
+        for attempt in range(1, CHAT_SAVE_ATTEMPTS + 1):
+            try:
+                await db.save_chat_message(user_id, sender, text, context)
+                break
+            except Exception as e:
+                if attempt == CHAT_SAVE_ATTEMPTS:
+                    logger.error(f"Giving up saving {sender} chat message for {user_id} after {attempt} attempts: {str(e)}")
+                    return
+                logger.warning(f"Saving {sender} chat message for {user_id} failed (attempt {attempt}): {str(e)}")
+                await asyncio.sleep(CHAT_SAVE_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+    if reply != CHAT_FALLBACK_REPLY:
+        await app.state.ai_service.conversation_memory.record_exchange(db, user_id, user_message, reply)
+
 @app.post("/chat", response_model=ChatResponse)
 async def send_chat_message(
     message_data: ChatMessage,
+    response: Response,
+    background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user),
     db: Database = Depends(get_database)
 ):
     """Send a chat message and get AI response"""
+    timer = StageTimer()
     try:
         ai_service = app.state.ai_service
         
-        # Get user's supplements for context
-        supplements = await db.get_user_supplements(current_user["id"])
-        
-        # Get recent chat history
-        chat_history = await db.get_chat_history(current_user["id"], limit=10)
-        
-        # Prepare context for AI
-        context = {
-            "user_name": current_user["name"],
-            "user_age": current_user["age"],
-            "supplements": supplements,
-            "current_time": datetime.utcnow().isoformat()
-        }
+        # Get user's supplements and recent chat history for context
+        with timer.stage("context"):
+            context, chat_history = await _gather_chat_context(db, current_user, message_data.message)
         
         # Generate AI response
-        ai_response = await ai_service.generate_response(
-            message_data.message,
-            context,
-            chat_history
-        )
+        with timer.stage("model"):
+            ai_response = await ai_service.generate_response(
+                message_data.message,
+                context,
+                chat_history,
+                use_cache=not message_data.bypass_cache
+            )
         
-        # Save user message
-        await db.save_chat_message(
+        # Save both messages after the response has been sent
+        background_tasks.add_task(
+            _persist_chat_exchange,
+            db,
             current_user["id"],
-            "user",
             message_data.message,
-            context
-        )
-        
-        # Save AI response
-        await db.save_chat_message(
-            current_user["id"],
-            "assistant",
             ai_response,
             context
         )
         
+        response.headers["Server-Timing"] = timer.server_timing_header()
+        logger.info(f"Chat timings: {timer.summary()}")
         return ChatResponse(reply=ai_response)
         
     except Exception as e:
         logger.error(f"Chat error: {str(e)}")
         
         # Return fallback response
-        fallback_response = (
-            "I'm experiencing some technical difficulties right now, but I'm still here to help! 🔧\n\n"
-            "For immediate medical questions, please contact your healthcare provider. "
-            "For general supplement information, you can also check reliable sources like your pharmacist "
-            "or trusted medical websites.\n\n"
-            "I'll be back to full functionality soon. Thank you for your patience! 💊"
-        )
-        
-        return ChatResponse(reply=fallback_response)
+        return ChatResponse(reply=CHAT_FALLBACK_REPLY)
+
+def _sse_event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """Format a Server-Sent Events frame"""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def stream_chat_message(
+    message_data: ChatMessage,
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_database)
+):
+    """Send a chat message and stream the AI response as Server-Sent Events"""
+    ai_service = app.state.ai_service
+
+    async def event_stream():
+        # Flush headers straight away so the client sees the stream open
+        yield _sse_event({"status": "started"}, event="start")
+
+        timer = StageTimer()
+        context = None
+        reply_parts: List[str] = []
+        try:
+            with timer.stage("context"):
+                context, chat_history = await _gather_chat_context(db, current_user, message_data.message)
+
+            model_started = time.perf_counter()
+            async for chunk in ai_service.stream_response(
+                message_data.message,
+                context,
+                chat_history,
+                use_cache=not message_data.bypass_cache
+            ):
+                if not reply_parts:
+                    timer.stages["first_token"] = (time.perf_counter() - model_started) * 1000
+                reply_parts.append(chunk)
+                yield _sse_event({"delta": chunk})
+            timer.stages["model"] = (time.perf_counter() - model_started) * 1000
+        except Exception as e:
+            logger.error(f"Chat stream error: {str(e)}")
+            if not reply_parts:
+                reply_parts.append(CHAT_FALLBACK_REPLY)
+                yield _sse_event({"delta": CHAT_FALLBACK_REPLY})
+
+        reply = "".join(reply_parts)
+        if context is not None:
+            exchange["reply"] = reply
+            exchange["context"] = context
+        logger.info(f"Chat stream timings: {timer.summary()}")
+        yield _sse_event({"reply": reply}, event="done")
+
+    async def persist_exchange():
+        # Runs after the response even when the client closes the stream on "done",
+        # which cancels the generator
+        if "reply" in exchange:
+            await _persist_chat_exchange(db, current_user["id"], message_data.message, exchange["reply"], exchange["context"])
+
+    exchange: Dict[str, Any] = {}
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(persist_exchange)
+    )
+
+@app.get("/chat/cache/stats")
+async def chat_cache_stats():
+    """Get AI response cache hit-rate metrics"""
+    return app.state.ai_service.get_cache_stats()
+
+@app.get("/chat/model/stats")
+async def chat_model_stats():
+    """Get model concurrency and load-shedding metrics"""
+    return app.state.ai_service.get_model_stats()
 
 @app.get("/chat/history", response_model=ChatHistoryResponse)
 async def get_chat_history(
@@ -830,6 +1438,8 @@ async def clear_chat_history(
     """Clear chat history"""
     try:
         await db.clear_chat_history(current_user["id"])
+        await app.state.ai_service.conversation_memory.clear(db, current_user["id"])
+        app.state.ai_service.chat_retriever.clear(current_user["id"])
         return {"message": "Chat history cleared successfully"}
         
     except Exception as e:
@@ -840,7 +1450,7 @@ async def clear_chat_history(
         )
 
 # Image upload endpoint
-@app.post("/upload/image")
+@app.post("/upload/image", response_model=ImageUploadResponse)
 async def upload_image(
     file: UploadFile = File(...),
     current_user: dict = Depends(get_current_user)
@@ -855,9 +1465,12 @@ async def upload_image(
             )
         
         # Handle image upload
-        image_url = await handle_image_upload(file, current_user["id"])
+        result = await handle_image_upload(
+            file, current_user["id"], app.state.upload_ingestor, app.state.image_pipeline, app.state.blob_store,
+            app.state.image_hash_index
+        )
         
-        return {"image_url": image_url}
+        return ImageUploadResponse(**result)
         
     except HTTPException:
         raise
@@ -868,6 +1481,157 @@ async def upload_image(
             detail="Failed to upload image"
         )
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header names the ETag; weak comparison, "*" matches any"""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+@app.get("/blobs/{key}")
+async def get_blob(
+    key: str,
+    request: Request,
+    size: Optional[int] = None,
+    format: Optional[str] = None
+):
+    """Serve a stored image, or a downscaled copy when a size or format is requested"""
+    blob_store = app.state.blob_store
+    if not BLOB_KEY.match(key) or not blob_store.exists(key):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
+        )
+
+    # Keys are content hashes, so every variant is immutable
+    headers = {"Cache-Control": "public, max-age=31536000, immutable"}
+    if size is None and format is None:
+        path = blob_store.path_for(key)
+        media_type = blob_store.mime_type_for(key)
+        etag = f'"{key.split(".")[0]}"'
+    else:
+        derivative_format = pick_format(format, request.headers.get("accept", ""))
+        if derivative_format is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unsupported format, expected one of: {', '.join(DERIVATIVE_FORMATS)}"
+            )
+        if format is None:
+            headers["Vary"] = "Accept"
+        derivative_size = pick_size(size)
+        media_type = DERIVATIVE_FORMATS[derivative_format][1]
+        etag = f'"{key.split(".")[0]}-{derivative_size}-{derivative_format}"'
+
+    headers["ETag"] = etag
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if size is not None or format is not None:
+        try:
+            path = await app.state.derivative_cache.get(
+                blob_store, app.state.image_pipeline, key, derivative_size, derivative_format
+            )
+        except ImagePipelineBusy:
+            # The original is always servable; clients just get more bytes under load
+            path = blob_store.path_for(key)
+            media_type = blob_store.mime_type_for(key)
+            headers["ETag"] = f'"{key.split(".")[0]}"'
+        except InvalidImage:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Image cannot be resized"
+            )
+
+    # FileResponse handles Range requests and uses sendfile when the server supports it
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+@app.get("/upload/image/stats")
+async def upload_image_stats():
+    """Get image upload, buffer memory and processing pipeline metrics"""
+    return {
+        **app.state.upload_ingestor.get_stats(),
+        "pipeline": app.state.image_pipeline.get_stats(),
+        "blob_store": app.state.blob_store.get_stats(),
+        "derivatives": app.state.derivative_cache.get_stats(),
+        "deduplication": app.state.image_hash_index.get_stats(),
+    }
+
+# Scan endpoints
+@app.post("/scan", response_model=ScanJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_scan(
+    file: UploadFile = File(...),
+    current_user: dict = Depends(get_current_user)
+):
+    """Queue a supplement label photo for recognition"""
+    try:
+        with await app.state.upload_ingestor.ingest(file) as upload:
+            # The job takes over the spooled file; the recognizer worker reads it by path
+            job = app.state.scan_queue.submit(current_user["id"], upload.detach())
+        return ScanJobResponse(**job.to_dict())
+
+    except ScanQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Scanner is busy, please try again shortly"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Scan submit error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to start scan"
+        )
+
+@app.get("/scan/stats")
+async def scan_stats():
+    """Get scan queue and recognizer timing metrics"""
+    return app.state.scan_queue.get_stats()
+
+def _scan_job(job_id: str, user_id: str):
+    job = app.state.scan_queue.get(job_id, user_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Scan not found"
+        )
+    return job
+
+@app.get("/scan/{job_id}", response_model=ScanJobResponse)
+async def get_scan(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get a scan job's status and draft"""
+    return ScanJobResponse(**_scan_job(job_id, current_user["id"]).to_dict())
+
+@app.get("/scan/{job_id}/events")
+async def stream_scan(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream a scan job's status as Server-Sent Events, ending with the result"""
+    job = _scan_job(job_id, current_user["id"])
+
+    async def event_stream():
+        yield _sse_event({"job_id": job.id, "status": job.status}, event="status")
+        while not job.finished.is_set():
+            try:
+                await asyncio.wait_for(job.finished.wait(), timeout=15)
+            except asyncio.TimeoutError:
+                # Comment frame keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+        yield _sse_event(job.to_dict(), event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Error handlers
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
@@ -0,0 +1,106 @@
+"""
+Blob migration job for SafeDoser backend
+Moves inline base64 data URLs out of users.avatar_url and supplements.image_url
+into the blob store, replacing each with a short blob URL. Each image is decoded,
+verified and resized like a new upload; supplement images are indexed under
+their owner, avatars are not indexed.
+
+Usage:
+    python blob_migration.py --dry-run
+    python blob_migration.py --batch-size 50
+"""
+
+import asyncio
+import logging
+import argparse
+from typing import Any, Dict, Optional
+
+from database import Database
+from blob_store import BlobStore, LocalBlobStore
+from image_dedup import ImageHashIndex
+from image_pipeline import ImagePipeline
+from utils import handle_image_url
+
+logger = logging.getLogger(__name__)
+
+# table -> (image column, owning user column, whether images join the hash index)
+INLINE_IMAGE_COLUMNS = {
+    "users": ("avatar_url", "id", False),
+    "supplements": ("image_url", "user_id", True),
+}
+
+async def migrate_column(
+    db: Database,
+    store: BlobStore,
+    pipeline: ImagePipeline,
+    hash_index: Optional[ImageHashIndex],
+    table: str,
+    column: str,
+    owner_column: str,
+    batch_size: int = 50,
+    dry_run: bool = False
+) -> Dict[str, Any]:
+    """Externalize every inline data URL in one column"""
+    report = {"table": table, "rows": 0, "failed": 0, "bytes_before": 0, "bytes_after": 0}
+    last_id = None
+    while True:
+        # Keyset paging by id works the same whether or not rows are rewritten
+        columns = "id" if owner_column == "id" else f"id, {owner_column}"
+        query = db.supabase.table(table).select(f"{columns}, {column}").like(column, "data:%")
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        result = query.order("id").limit(batch_size).execute()
+        rows = result.data or []
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+
+        for row in rows:
+            value = row[column]
+            try:
+                url = await handle_image_url(value, str(row[owner_column]), pipeline, store, hash_index)
+            except Exception as e:
+                logger.error(f"Failed to migrate {table}.{column} for {row['id']}: {str(e)}")
+                report["failed"] += 1
+                continue
+
+            if not dry_run:
+                db.supabase.table(table).update({column: url}).eq("id", row["id"]).execute()
+            report["rows"] += 1
+            report["bytes_before"] += len(value)
+            report["bytes_after"] += len(url)
+    return report
+
+async def main_async(args: argparse.Namespace) -> None:
+    db = Database()
+    await db.initialize()
+    store = LocalBlobStore.from_env()
+    pipeline = ImagePipeline.from_env()
+    hash_index = ImageHashIndex.from_env()
+    try:
+        for table, (column, owner_column, indexed) in INLINE_IMAGE_COLUMNS.items():
+            report = await migrate_column(
+                db, store, pipeline, hash_index if indexed else None, table, column, owner_column,
+                args.batch_size, args.dry_run
+            )
+            shrink = report["bytes_before"] / report["bytes_after"] if report["bytes_after"] else 0.0
+            print(
+                f"{table}.{column}: {report['rows']} rows, {report['failed']} failed, "
+                f"{report['bytes_before']:,} -> {report['bytes_after']:,} bytes ({shrink:.0f}x smaller)"
+            )
+        print(f"blob store: {store.get_stats()}")
+    finally:
+        pipeline.shutdown()
+        await db.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move inline image data URLs into the blob store")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--dry-run", action="store_true", help="Write blobs and report savings without updating rows")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
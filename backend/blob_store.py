@@ -0,0 +1,144 @@
+"""
+Blob storage for SafeDoser backend
+Stores uploaded images once, keyed by the SHA-256 of their bytes, so rows hold a
+short URL instead of an inline base64 data URL. The local store shards files into
+two directory levels and writes them atomically, so a reader never sees a partial
+file and identical uploads share one blob.
+"""
+
+import os
+import re
+import asyncio
+import hashlib
+import shutil
+import logging
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "blobs")
+
+EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/gif": "gif",
+    "image/webp": "webp",
+}
+MIME_TYPES = {ext: mime_type for mime_type, ext in EXTENSIONS.items()}
+
+BLOB_KEY = re.compile(r"^[0-9a-f]{64}\.(jpg|png|gif|webp)$")
+
+FILE_CHUNK_BYTES = 1024 * 1024
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(FILE_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class BlobStore(ABC):
+    """Interface for content-addressed image storage"""
+
+    @abstractmethod
+    async def put(self, data: bytes, mime_type: str) -> str:
+        """Store bytes and return their key; storing the same bytes twice is a no-op"""
+
+    @abstractmethod
+    async def put_file(self, path: str, mime_type: str) -> str:
+        """Store a file's contents without reading it into memory whole"""
+
+    @abstractmethod
+    def path_for(self, key: str) -> str:
+        """Local file holding a blob"""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """Whether a blob is stored"""
+
+    @abstractmethod
+    def public_url(self, key: str) -> str:
+        """URL clients fetch a blob from"""
+
+class LocalBlobStore(BlobStore):
+    """Blobs as files under root/ab/cd/<sha256>.<ext>"""
+
+    def __init__(self, root: str = DEFAULT_BLOB_DIR, public_base_url: str = ""):
+        self.root = root
+        self.public_base_url = public_base_url.rstrip("/")
+        self.stats: Dict[str, int] = {"stored": 0, "deduplicated": 0, "bytes_written": 0}
+
+    @classmethod
+    def from_env(cls) -> "LocalBlobStore":
+        return cls(
+            root=os.getenv("BLOB_STORE_DIR", DEFAULT_BLOB_DIR),
+            public_base_url=os.getenv("API_PUBLIC_URL", "https://safedoser.onrender.com"),
+        )
+
+    @staticmethod
+    def key_for(data: bytes, mime_type: str) -> str:
+        return f"{hashlib.sha256(data).hexdigest()}.{EXTENSIONS.get(mime_type, 'jpg')}"
+
+    @staticmethod
+    def mime_type_for(key: str) -> str:
+        return MIME_TYPES.get(key.rsplit(".", 1)[-1], "application/octet-stream")
+
+    async def put(self, data: bytes, mime_type: str) -> str:
+        key = self.key_for(data, mime_type)
+        if self.exists(key):
+            self.stats["deduplicated"] += 1
+            return key
+        await asyncio.to_thread(self._write, key, data)
+        self.stats["stored"] += 1
+        self.stats["bytes_written"] += len(data)
+        return key
+
+    async def put_file(self, path: str, mime_type: str) -> str:
+        key = f"{await asyncio.to_thread(file_sha256, path)}.{EXTENSIONS.get(mime_type, 'jpg')}"
+        if self.exists(key):
+            self.stats["deduplicated"] += 1
+            return key
+        await asyncio.to_thread(self._write, key, None, path)
+        self.stats["stored"] += 1
+        self.stats["bytes_written"] += os.path.getsize(path)
+        return key
+
+    def _write(self, key: str, data: Optional[bytes], source_path: Optional[str] = None) -> None:
+        path = self.path_for(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write beside the target and rename, so the blob appears complete or not at all
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if source_path is not None:
+                    with open(source_path, "rb") as source:
+                        shutil.copyfileobj(source, f, FILE_CHUNK_BYTES)
+                else:
+                    f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def path_for(self, key: str) -> str:
+        if not BLOB_KEY.match(key):
+            raise ValueError(f"Invalid blob key: {key!r}")
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path_for(key))
+
+    def public_url(self, key: str) -> str:
+        return f"{self.public_base_url}/blobs/{key}"
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "root": self.root}
@@ -0,0 +1,332 @@
+"""
+Chat load benchmark for SafeDoser backend
+Drives the /chat handler (send_chat_message) end to end against the local model
+backend and an in-memory database at rising concurrency, and reports throughput,
+p50/p99 latency and event-loop lag without spending API quota.
+
+Usage:
+    python chat_benchmark.py --concurrency 1 8 32 128 --requests 400
+    python chat_benchmark.py --latency-ms 1500 --dist lognormal --error-rate 0.05
+"""
+
+import time
+import asyncio
+import logging
+import argparse
+import itertools
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from fastapi import BackgroundTasks, Response
+
+import app as app_module
+from ai_service import AIService
+from models import ChatMessage
+from model_backends import LocalModelBackend, LATENCY_DISTRIBUTIONS, LOCAL_REPLIES
+from email_benchmark import percentile
+
+logger = logging.getLogger(__name__)
+
+QUESTIONS = [
+    "Can I take my magnesium and zinc at the same time as my morning coffee?",
+    "I keep forgetting my evening dose, what should I do?",
+    "Is it safe to take vitamin D with my blood pressure medication?",
+    "What should I eat with fish oil to avoid the aftertaste?",
+    "My stomach feels upset after iron, any tips?",
+    "Should I stop melatonin before a long flight?",
+]
+
+SUPPLEMENTS = [
+    {"name": "Vitamin D3", "dosage_form": "Softgel", "frequency": "Daily"},
+    {"name": "Magnesium Glycinate", "dosage_form": "Capsule", "frequency": "Daily"},
+    {"name": "Omega-3 Fish Oil", "dosage_form": "Softgel", "frequency": "Twice daily"},
+]
+
+class _MemoryQuery:
+    """Just enough of the Supabase query builder for the chat path"""
+
+    def __init__(self, supabase: "_MemorySupabase", name: str):
+        self._supabase = supabase
+        self._name = name
+        self._rows = supabase.tables.setdefault(name, [])
+        self._filters: List[Any] = []
+        self._order: Optional[tuple] = None
+        self._limit: Optional[int] = None
+        self._action = "select"
+        self._payload: Any = None
+
+    def select(self, *_, **__):
+        self._action = "select"
+        return self
+
+    def insert(self, payload: Any):
+        self._action, self._payload = "insert", payload
+        return self
+
+    def update(self, payload: Dict[str, Any]):
+        self._action, self._payload = "update", payload
+        return self
+
+    def upsert(self, payload: Dict[str, Any]):
+        self._action, self._payload = "upsert", payload
+        return self
+
+    def delete(self):
+        self._action = "delete"
+        return self
+
+    def eq(self, column: str, value: Any):
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gte(self, column: str, value: Any):
+        self._filters.append(lambda row: row.get(column) is not None and str(row[column]) >= str(value))
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        self._order = (column, desc)
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def _matches(self, row: Dict[str, Any]) -> bool:
+        return all(check(row) for check in self._filters)
+
+    def execute(self):
+        # The real client blocks its thread for a round trip
+        time.sleep(self._supabase.latency)
+        with self._supabase.lock:
+            data, count = self._apply()
+        return type("Result", (), {"data": data, "count": count})()
+
+    def _apply(self) -> tuple:
+        """Returned rows, and the matching row count before any limit"""
+        if self._action in ("insert", "upsert"):
+            key = self._supabase.primary_keys.get(self._name, "id")
+            rows = self._payload if isinstance(self._payload, list) else [self._payload]
+            data = []
+            for payload in rows:
+                row = dict(payload)
+                row.setdefault("id", self._supabase.next_id())
+                existing = [stored for stored in self._rows if stored.get(key) == row.get(key)]
+                if existing and self._action == "insert":
+                    raise BenchDuplicateKey(f"duplicate key value violates unique constraint on {self._name}.{key}")
+                self._rows[:] = [stored for stored in self._rows if stored.get(key) != row.get(key)]
+                self._rows.append(row)
+                data.append(dict(row))
+            return data, len(data)
+        matched = [row for row in self._rows if self._matches(row)]
+        if self._action == "update":
+            for row in matched:
+                row.update(self._payload)
+            return [dict(row) for row in matched], len(matched)
+        if self._action == "delete":
+            self._rows[:] = [row for row in self._rows if not self._matches(row)]
+            return matched, len(matched)
+        count = len(matched)
+        if self._order is not None:
+            column, desc = self._order
+            matched.sort(key=lambda row: str(row.get(column)), reverse=desc)
+        if self._limit is not None:
+            matched = matched[:self._limit]
+        return [dict(row) for row in matched], count
+
+class BenchDuplicateKey(Exception):
+    """Unique violation, carrying the Postgres error code like the Supabase client's errors"""
+
+    code = "23505"
+
+class _MemorySupabase:
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        # table -> column that makes a second insert fail
+        self.primary_keys = {"chat_summaries": "user_id"}
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def table(self, name: str) -> _MemoryQuery:
+        return _MemoryQuery(self, name)
+
+class BenchDatabase:
+    """In-memory stand-in for Database with a fixed per-call latency"""
+
+    def __init__(self, latency_ms: float = 5.0):
+        self.latency = latency_ms / 1000
+        self.supabase = _MemorySupabase(self.latency)
+
+    def _rows(self, table: str) -> List[Dict[str, Any]]:
+        with self.supabase.lock:
+            return [dict(row) for row in self.supabase.tables.get(table, [])]
+
+    def seed_users(self, users: int) -> None:
+        """Give every benchmark user the same supplement list"""
+        with self.supabase.lock:
+            rows = self.supabase.tables.setdefault("supplements", [])
+            for index in range(users):
+                for supp in SUPPLEMENTS:
+                    rows.append(dict(supp, id=self.supabase.next_id(), user_id=f"bench-user-{index}"))
+
+    async def get_user_supplements(self, user_id: str) -> List[Dict[str, Any]]:
+        await asyncio.sleep(self.latency)
+        return [row for row in self._rows("supplements") if row["user_id"] == user_id]
+
+    async def get_chat_history(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        await asyncio.sleep(self.latency)
+        return [row for row in self._rows("chat_messages") if row["user_id"] == user_id][-limit:]
+
+    async def save_chat_message(self, user_id: str, sender: str, message: str, context: Dict[str, Any]) -> None:
+        await asyncio.sleep(self.latency)
+        with self.supabase.lock:
+            self.supabase.tables.setdefault("chat_messages", []).append({
+                "id": self.supabase.next_id(),
+                "user_id": user_id,
+                "sender": sender,
+                "message": message,
+                "timestamp": datetime.utcnow().isoformat()
+            })
+
+class ErrorCounter(logging.Handler):
+    """Counts error records so a run that hit errors is reported as failed"""
+
+    def __init__(self) -> None:
+        super().__init__(level=logging.ERROR)
+        self.errors: Counter = Counter()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.errors[record.name] += 1
+
+def classify_reply(reply: str) -> str:
+    """Whether a reply came from the model, the fallback responder or the error path"""
+    if reply in LOCAL_REPLIES:
+        return "model"
+    if reply == app_module.CHAT_FALLBACK_REPLY:
+        return "error"
+    return "fallback"
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a periodic timer"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - expected))
+
+    def start(self) -> None:
+        self.lags = []
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+async def run_level(db: BenchDatabase, requests: int, concurrency: int, users: int) -> Dict[str, Any]:
+    """Send `requests` chat messages with at most `concurrency` in flight"""
+    latencies: List[float] = []
+    replies: Counter = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    monitor = LoopLagMonitor()
+    background: List[asyncio.Task] = []
+
+    async def one(index: int) -> None:
+        async with semaphore:
+            user = {"id": f"bench-user-{index % users}", "name": f"Bench {index % users}", "age": 40}
+            # Vary the wording so the response cache does not absorb the load
+            message = ChatMessage(message=f"{QUESTIONS[index % len(QUESTIONS)]} (run {concurrency}, #{index})")
+            background_tasks = BackgroundTasks()
+            started = time.perf_counter()
+            result = await app_module.send_chat_message(message, Response(), background_tasks, user, db)
+            latencies.append(time.perf_counter() - started)
+            replies[classify_reply(result.reply)] += 1
+        # Starlette runs these after the response is sent, off the client's critical path
+        background.append(asyncio.ensure_future(background_tasks()))
+
+    monitor.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    await asyncio.gather(*background)
+    await monitor.stop()
+
+    latencies.sort()
+    lags = sorted(monitor.lags)
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "elapsed": elapsed,
+        "throughput": requests / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "lag_p99_ms": percentile(lags, 99) * 1000,
+        "lag_max_ms": (lags[-1] if lags else 0.0) * 1000,
+        "replies": dict(replies),
+    }
+
+def format_row(result: Dict[str, Any]) -> str:
+    return (
+        f"{result['concurrency']:>11}  {result['throughput']:>9.1f}  {result['p50_ms']:>8.1f}  "
+        f"{result['p99_ms']:>8.1f}  {result['lag_p99_ms']:>10.2f}  {result['lag_max_ms']:>10.2f}  {result['replies']}"
+    )
+
+async def main_async(args: argparse.Namespace) -> None:
+    backend = LocalModelBackend(
+        latency_ms=args.latency_ms,
+        distribution=args.dist,
+        spread=args.spread,
+        chunk_delay_ms=args.chunk_delay_ms,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    app_module.app.state.ai_service = AIService(backend=backend)
+    db = BenchDatabase(latency_ms=args.db_latency_ms)
+    db.seed_users(args.users)
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+
+    print(f"{'concurrency':>11}  {'req/s':>9}  {'p50 ms':>8}  {'p99 ms':>8}  {'lag p99 ms':>10}  {'lag max ms':>10}  replies")
+    for concurrency in args.concurrency:
+        result = await run_level(db, args.requests, concurrency, args.users)
+        print(format_row(result))
+    print(f"model stats: {app_module.app.state.ai_service.get_model_stats()}")
+    if errors.errors:
+        # A run that logged errors measured a broken path, not the chat path
+        raise SystemExit(f"benchmark logged errors: {dict(errors.errors)}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load-test the /chat handler against the local model backend")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=100, help="Requests per concurrency level")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=800.0)
+    parser.add_argument("--dist", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--spread", type=float, default=0.5)
+    parser.add_argument("--chunk-delay-ms", type=float, default=30.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--db-latency-ms", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    # Per-request chat logging would dominate the measurement
+    logging.getLogger("app").setLevel(logging.WARNING)
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
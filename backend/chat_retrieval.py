@@ -0,0 +1,260 @@
+"""
+Chat history retrieval for SafeDoser AI assistant
+Keeps an incremental per-user BM25 index over past chat exchanges so the prompt
+can include the earlier turns most relevant to a new question, not just the
+latest ones. Pure Python, built from stored messages. Each retrieval first pulls
+messages stored since the index last synced, so exchanges saved by any worker
+are searchable, and compares the user's stored message count with what the
+index has seen: fewer rows than expected means history was cleared or deleted
+(possibly through another worker), and the index is rebuilt.
+"""
+
+import os
+import re
+import math
+import asyncio
+import logging
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a about after again all also am an and any are as at be because been before being between both but by can
+could did do does doing for from had has have having he her here hers him his how i if in into is it its
+just me more most my no nor not now of off on once only or other our out over own same she should so some
+such than that the their them then there these they this those through to too under until up very was we
+were what when where which while who whom why will with would you your yours hello hi hey thanks thank please
+""".split())
+
+# Rows can become visible slightly out of timestamp order (NOW() is the insert
+# transaction's start), so each sync re-reads this far back and skips known ids
+SYNC_OVERLAP = timedelta(seconds=10)
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased content words with a light plural strip"""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS or len(token) < 2:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+class UserChatIndex:
+    """BM25 index over one user's chat exchanges, appended to incrementally"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents: List[str] = []
+        self._lengths: List[int] = []
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._total_length = 0
+        # A user message waiting for its reply
+        self._pending_user: Optional[str] = None
+        # Newest stored message indexed, and ids indexed within SYNC_OVERLAP of it
+        self.synced_at: Optional[datetime] = None
+        self._recent_ids: Dict[str, datetime] = {}
+        # The user's stored message count as of the last sync
+        self.stored_count = 0
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add_message(self, sender: str, message: str) -> None:
+        """Feed messages in order; each user message and its reply form one document"""
+        if sender == "user":
+            if self._pending_user is not None:
+                self._add_document(f"User: {self._pending_user}")
+            self._pending_user = message
+            return
+        if self._pending_user is not None:
+            self._add_document(f"User: {self._pending_user}\nAssistant: {message}")
+            self._pending_user = None
+        else:
+            self._add_document(f"Assistant: {message}")
+
+    def add_rows(self, rows: List[Dict[str, Any]]) -> int:
+        """Index stored chat_messages rows in timestamp order, skipping ones already indexed"""
+        added = 0
+        for row in rows:
+            timestamp = _parse_timestamp(row.get("timestamp"))
+            if row.get("id") in self._recent_ids:
+                continue
+            self.add_message(row.get("sender", "user"), row.get("message") or "")
+            added += 1
+            if timestamp is not None:
+                self._recent_ids[row.get("id")] = timestamp
+                if self.synced_at is None or timestamp > self.synced_at:
+                    self.synced_at = timestamp
+        if self.synced_at is not None:
+            horizon = self.synced_at - SYNC_OVERLAP
+            self._recent_ids = {row_id: at for row_id, at in self._recent_ids.items() if at >= horizon}
+        return added
+
+    def _add_document(self, text: str) -> None:
+        doc_id = len(self.documents)
+        terms = Counter(tokenize(text))
+        self.documents.append(text)
+        length = sum(terms.values())
+        self._lengths.append(length)
+        self._total_length += length
+        for term, tf in terms.items():
+            self._postings.setdefault(term, []).append((doc_id, tf))
+
+    def search(self, query: str, k: int = 3, skip_recent: int = 0) -> List[Tuple[float, int]]:
+        """Top-k (score, doc id) by BM25, ignoring the newest `skip_recent` documents"""
+        count = len(self.documents)
+        limit = count - skip_recent
+        if limit <= 0:
+            return []
+
+        avg_length = self._total_length / count or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings:
+                if doc_id >= limit:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(((score, doc_id) for doc_id, score in scores.items()), reverse=True)[:k]
+
+class ChatRetriever:
+    """Per-user chat indexes, loaded from stored history on first use and synced with it on each retrieval"""
+
+    def __init__(
+        self,
+        top_k: int = 3,
+        max_documents: int = 500,
+        max_users: int = 2000,
+        recent_messages: int = 10,
+    ):
+        self.top_k = top_k
+        self.max_documents = max_documents
+        self.max_users = max_users
+        # Messages already sent verbatim as recent history; their exchanges are not retrieved
+        self.recent_messages = recent_messages
+        self._indexes: "OrderedDict[str, UserChatIndex]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+
+    @classmethod
+    def from_env(cls) -> "ChatRetriever":
+        return cls(
+            top_k=int(os.getenv("CHAT_RETRIEVAL_TOP_K", "3")),
+            max_documents=int(os.getenv("CHAT_RETRIEVAL_MAX_EXCHANGES", "500")),
+        )
+
+    async def retrieve(self, db, user_id: str, query: str) -> List[str]:
+        """Earlier exchanges most relevant to the query, best first"""
+        if self.top_k <= 0:
+            return []
+        try:
+            index = await self._index_for(db, user_id)
+        except Exception as e:
+            logger.error(f"Failed to load chat index for {user_id}: {str(e)}")
+            return []
+        skip = (self.recent_messages + 1) // 2
+        return [index.documents[doc_id] for _, doc_id in index.search(query, self.top_k, skip_recent=skip)]
+
+    def clear(self, user_id: str) -> None:
+        """Drop this worker's index; other workers notice the deletion on their next sync"""
+        self._indexes.pop(user_id, None)
+
+    async def _index_for(self, db, user_id: str) -> UserChatIndex:
+        index = self._indexes.get(user_id)
+        if index is not None:
+            self._indexes.move_to_end(user_id)
+            # Pick up messages saved since the last sync, by this worker or any other
+            rows, total = await asyncio.to_thread(self._fetch, db, user_id, index.synced_at)
+            if len(rows) >= self.max_documents * 2:
+                self._indexes.pop(user_id, None)
+            else:
+                expected = index.stored_count + index.add_rows(rows)
+                if total is not None and total < expected:
+                    # Messages were deleted (e.g. "clear chat" on another worker); they must not be retrieved
+                    logger.info(f"Chat history of {user_id} shrank from {expected} to {total} messages; rebuilding its index")
+                    self._indexes.pop(user_id, None)
+                else:
+                    index.stored_count = total if total is not None else expected
+                    if len(index) > self.max_documents * 1.25:
+                        index = self._indexes[user_id] = self._trimmed(index)
+                    return index
+
+        # Concurrent first requests share one history load
+        loading = self._loading.get(user_id)
+        if loading is not None:
+            return await asyncio.shield(loading)
+
+        loading = self._loading[user_id] = asyncio.get_running_loop().create_future()
+        try:
+            rows, total = await asyncio.to_thread(self._fetch, db, user_id, None)
+            index = UserChatIndex()
+            added = index.add_rows(rows)
+            index.stored_count = added if total is None else total
+            self._indexes[user_id] = index
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+            loading.set_result(index)
+            return index
+        except BaseException as e:
+            # Waiters fall back to no retrieval, even if this load was cancelled
+            loading.set_exception(e if isinstance(e, Exception) else RuntimeError("Chat history load was cancelled"))
+            # Mark retrieved so a load nobody else awaited does not log "never retrieved"
+            loading.exception()
+            raise
+        finally:
+            self._loading.pop(user_id, None)
+
+    def _fetch(self, db, user_id: str, since: Optional[datetime]) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Stored messages after since (the newest ones when None), oldest first, and the user's message count"""
+        limit = self.max_documents * 2
+        table = db.supabase.table("chat_messages")
+        if since is None:
+            result = (
+                table.select("id, sender, message, timestamp", count="exact")
+                .eq("user_id", user_id).order("timestamp", desc=True).limit(limit).execute()
+            )
+            rows = result.data or []
+            rows.reverse()
+            return rows, result.count
+        rows = (
+            table.select("id, sender, message, timestamp").eq("user_id", user_id)
+            .gte("timestamp", (since - SYNC_OVERLAP).isoformat()).order("timestamp").limit(limit).execute().data or []
+        )
+        # Counted after the rows, so a message saved in between can't look like a deletion
+        total = db.supabase.table("chat_messages").select("id", count="exact").eq("user_id", user_id).limit(1).execute().count
+        return rows, total
+
+    def _trimmed(self, index: UserChatIndex) -> UserChatIndex:
+        """Fresh index over the newest documents, keeping the sync position"""
+        rebuilt = self._rebuilt(index.documents[-self.max_documents:])
+        rebuilt._pending_user = index._pending_user
+        rebuilt.synced_at = index.synced_at
+        rebuilt._recent_ids = index._recent_ids
+        rebuilt.stored_count = index.stored_count
+        return rebuilt
+
+    @staticmethod
+    def _rebuilt(documents: List[str]) -> UserChatIndex:
+        """Fresh index over the newest documents, dropping the oldest"""
+        index = UserChatIndex()
+        for text in documents:
+            index._add_document(text)
+        return index
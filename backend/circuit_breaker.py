@@ -0,0 +1,201 @@
+"""
+Circuit breaker for SafeDoser model calls
+Tracks the error rate and latency of recent Gemini calls, opens after a threshold
+so requests fall back immediately instead of waiting on a degraded provider, and
+probes half-open before closing again. Also keeps the latency percentiles used to
+decide when to hedge a slow request.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from model_governor import ModelOverloaded
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpen(ModelOverloaded):
+    """Raised instead of calling the model while the breaker is open"""
+
+class CallRecord:
+    """Handle for one guarded call; streaming callers mark their first output"""
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.first_output: Optional[float] = None
+
+    def mark_first_output(self) -> None:
+        if self.first_output is None:
+            self.first_output = time.monotonic()
+
+    @property
+    def latency(self) -> float:
+        """Seconds until the first output, or until now if there was none"""
+        return (self.first_output or time.monotonic()) - self.started
+
+class CircuitBreaker:
+    """Rolling-window breaker over call failures and slow calls"""
+
+    def __init__(
+        self,
+        window_size: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 8.0,
+        slow_call_rate: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 1,
+        latency_samples: int = 200,
+    ):
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        # (failed, slow) per recent call
+        self._window: Deque[Tuple[bool, bool]] = deque(maxlen=window_size)
+        # Latencies of recent successful calls, for percentiles
+        self._latencies: Deque[float] = deque(maxlen=latency_samples)
+        self._sorted_latencies: Optional[list] = None
+
+        self.stats: Dict[str, int] = {
+            "calls": 0,
+            "failures": 0,
+            "slow_calls": 0,
+            "short_circuited": 0,
+            "opened": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        return cls(
+            window_size=int(os.getenv("GEMINI_BREAKER_WINDOW", "20")),
+            min_calls=int(os.getenv("GEMINI_BREAKER_MIN_CALLS", "5")),
+            failure_rate=float(os.getenv("GEMINI_BREAKER_FAILURE_RATE", "0.5")),
+            slow_call_seconds=float(os.getenv("GEMINI_BREAKER_SLOW_CALL_SECONDS", "8")),
+            slow_call_rate=float(os.getenv("GEMINI_BREAKER_SLOW_CALL_RATE", "0.8")),
+            open_seconds=float(os.getenv("GEMINI_BREAKER_OPEN_SECONDS", "30")),
+        )
+
+    def check(self) -> None:
+        """Fail fast while open, before a caller queues for a model slot"""
+        if self._current_state() == OPEN:
+            self.stats["short_circuited"] += 1
+            raise CircuitOpen("Model circuit is open")
+
+    @contextmanager
+    def guard(self):
+        """Run one model call under the breaker, or raise CircuitOpen"""
+        probe = self._admit()
+        call = CallRecord()
+        try:
+            yield call
+        except (asyncio.CancelledError, GeneratorExit):
+            # Abandoned (e.g. a hedge that lost), says nothing about the provider
+            self._release(probe)
+            raise
+        except BaseException:
+            self._record(False, call.latency, probe)
+            raise
+        else:
+            self._record(True, call.latency, probe)
+
+    def latency_percentile(self, pct: float, min_samples: int = 20) -> Optional[float]:
+        """Percentile of recent successful call latencies, None until there are enough samples"""
+        if len(self._latencies) < min_samples:
+            return None
+        if self._sorted_latencies is None:
+            self._sorted_latencies = sorted(self._latencies)
+        values = self._sorted_latencies
+        return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+    def get_stats(self) -> Dict[str, Any]:
+        calls = len(self._window)
+        return {
+            **self.stats,
+            "state": self._current_state(),
+            "window_failure_rate": round(sum(f for f, _ in self._window) / calls, 3) if calls else 0.0,
+            "window_slow_rate": round(sum(s for _, s in self._window) / calls, 3) if calls else 0.0,
+            "p50_seconds": self.latency_percentile(50, 1),
+            "p95_seconds": self.latency_percentile(95, 1),
+        }
+
+    def _current_state(self) -> str:
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+            self._probes = 0
+            logger.info("Model circuit half-open, probing provider")
+        return self.state
+
+    def _admit(self) -> bool:
+        """Let a call through; returns whether it is a half-open probe"""
+        state = self._current_state()
+        if state == CLOSED:
+            return False
+        if state == HALF_OPEN and self._probes < self.half_open_max_calls:
+            self._probes += 1
+            return True
+        self.stats["short_circuited"] += 1
+        raise CircuitOpen(f"Model circuit is {state}")
+
+    def _release(self, probe: bool) -> None:
+        if probe:
+            self._probes = max(0, self._probes - 1)
+
+    def _record(self, ok: bool, latency: float, probe: bool) -> None:
+        slow = latency >= self.slow_call_seconds
+        self.stats["calls"] += 1
+        if not ok:
+            self.stats["failures"] += 1
+        if slow:
+            self.stats["slow_calls"] += 1
+        if ok:
+            self._latencies.append(latency)
+            self._sorted_latencies = None
+
+        if probe:
+            self._release(probe)
+            if ok and not slow:
+                self._close()
+            else:
+                self._open(f"probe {'was slow' if ok else 'failed'}")
+            return
+        if self.state != CLOSED:
+            # A call admitted before the circuit opened
+            return
+
+        self._window.append((not ok, slow))
+        calls = len(self._window)
+        if calls < self.min_calls:
+            return
+        failures = sum(f for f, _ in self._window)
+        slow_calls = sum(s for _, s in self._window)
+        if failures / calls >= self.failure_rate:
+            self._open(f"{failures}/{calls} recent calls failed")
+        elif slow_calls / calls >= self.slow_call_rate:
+            self._open(f"{slow_calls}/{calls} recent calls took over {self.slow_call_seconds}s")
+
+    def _open(self, reason: str) -> None:
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self.stats["opened"] += 1
+        logger.warning(f"Model circuit opened for {self.open_seconds}s: {reason}")
+
+    def _close(self) -> None:
+        self.state = CLOSED
+        self._window.clear()
+        logger.info("Model circuit closed, provider recovered")
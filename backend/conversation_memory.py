@@ -0,0 +1,171 @@
+"""
+Conversation memory for SafeDoser AI assistant
+Maintains a compact rolling summary per user, updated in the background after
+each chat exchange and persisted to the chat_summaries table. Summaries are
+always read from the table, so every worker sees the latest one and a cleared
+history is gone everywhere. Updates start from the stored summary and only land
+if it is unchanged since it was read, so workers sharing the table never
+overwrite each other's exchanges.
+"""
+
+import os
+import re
+import random
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from prompt_builder import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Optimistic writes retried when another worker updated the summary first
+SUMMARY_WRITE_ATTEMPTS = 5
+
+# Postgres unique_violation: another worker inserted the user's summary row first
+UNIQUE_VIOLATION = "23505"
+
+SummarizeFn = Callable[[str, str, str, int], Awaitable[Optional[str]]]
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and SafeDoser Assistant, a supplement and medication helper.
+Keep facts that matter for later questions: the user's supplements, symptoms, concerns, preferences and advice already given. Drop greetings and small talk.
+Write at most {max_words} words as short bullet points.
+
+CURRENT SUMMARY:
+{summary}
+
+NEW EXCHANGE:
+User: {user_message}
+Assistant: {reply}
+
+UPDATED SUMMARY:"""
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+def _first_sentence(text: str, max_chars: int = 160) -> str:
+    sentence = _SENTENCE_END.split(text.strip(), 1)[0]
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars].rstrip() + "…"
+
+class ConversationMemory:
+    """Rolling per-user conversation summaries"""
+
+    def __init__(
+        self,
+        summarize: Optional[SummarizeFn] = None,
+        max_summary_tokens: int = 200,
+    ):
+        self.summarize = summarize
+        self.max_summary_tokens = max_summary_tokens
+        # user_id -> [lock, number of updates holding or waiting on it]
+        self._locks: Dict[str, List[Any]] = {}
+
+    @classmethod
+    def from_env(cls, summarize: Optional[SummarizeFn] = None) -> "ConversationMemory":
+        return cls(
+            summarize=summarize,
+            max_summary_tokens=int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "200")),
+        )
+
+    async def get_summary(self, db, user_id: str) -> str:
+        """Current stored summary for a user
+
+        Not cached: another worker may have updated or cleared it since.
+        """
+        try:
+            summary, _ = await self._load(db, user_id)
+        except Exception as e:
+            logger.error(f"Failed to load chat summary for {user_id}: {str(e)}")
+            return ""
+        return summary
+
+    async def record_exchange(self, db, user_id: str, user_message: str, reply: str) -> str:
+        """Fold a new exchange into the user's stored summary and persist it"""
+        entry = self._locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                summary = ""
+                for attempt in range(1, SUMMARY_WRITE_ATTEMPTS + 1):
+                    # Start from the stored summary, not this worker's copy, which
+                    # misses exchanges summarised by other workers
+                    try:
+                        previous, version = await self._load(db, user_id)
+                    except Exception as e:
+                        logger.error(f"Failed to load chat summary for {user_id}, not updating it: {str(e)}")
+                        return summary
+
+                    summary = await self._fold(user_id, previous, user_message, reply)
+                    try:
+                        stored = await asyncio.to_thread(self._store, db, user_id, summary, version)
+                    except Exception as e:
+                        # Not a conflict; retrying would only repeat the model call against a failing database
+                        logger.error(f"Failed to save chat summary for {user_id}: {str(e)}")
+                        return summary
+                    if stored:
+                        return summary
+                    logger.info(f"Chat summary for {user_id} changed while updating it (attempt {attempt})")
+                    # Jittered so racing workers don't collide again
+                    await asyncio.sleep(random.uniform(0, 0.05 * attempt))
+
+                logger.warning(f"Giving up updating chat summary for {user_id} after {SUMMARY_WRITE_ATTEMPTS} attempts")
+                return summary
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(user_id, None)
+
+    async def clear(self, db, user_id: str) -> None:
+        """Forget a user's summary, e.g. when their chat history is cleared"""
+        try:
+            await asyncio.to_thread(
+                lambda: db.supabase.table("chat_summaries").delete().eq("user_id", user_id).execute()
+            )
+        except Exception as e:
+            logger.error(f"Failed to clear chat summary for {user_id}: {str(e)}")
+
+    async def _fold(self, user_id: str, previous: str, user_message: str, reply: str) -> str:
+        summary = None
+        if self.summarize:
+            try:
+                summary = await self.summarize(previous, user_message, reply, self.max_summary_tokens)
+            except Exception as e:
+                logger.warning(f"Model summary failed for {user_id}, using extractive summary: {str(e)}")
+        if not summary or estimate_tokens(summary) > self.max_summary_tokens * 2:
+            summary = self._extractive_update(previous, user_message, reply)
+        return summary.strip()
+
+    def _extractive_update(self, previous: str, user_message: str, reply: str) -> str:
+        """Append a one-line digest of the exchange, dropping the oldest lines to fit"""
+        lines = [line for line in previous.split("\n") if line.strip()]
+        lines.append(f"- User asked: {_first_sentence(user_message)} Assistant: {_first_sentence(reply)}")
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.max_summary_tokens:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    async def _load(self, db, user_id: str) -> Tuple[str, Optional[str]]:
+        """Stored summary and its updated_at version ("" and None when there is none)"""
+        result = await asyncio.to_thread(
+            lambda: db.supabase.table("chat_summaries").select("summary, updated_at").eq("user_id", user_id).execute()
+        )
+        if not result.data:
+            return "", None
+        return result.data[0].get("summary") or "", result.data[0].get("updated_at")
+
+    def _store(self, db, user_id: str, summary: str, version: Optional[str]) -> bool:
+        """Write a summary unless another worker changed it since version was read
+
+        False means a conflict worth retrying; any other failure is raised.
+        """
+        row = {"user_id": user_id, "summary": summary, "updated_at": datetime.now(timezone.utc).isoformat()}
+        table = db.supabase.table("chat_summaries")
+        if version is None:
+            try:
+                table.insert(row).execute()
+            except Exception as e:
+                if getattr(e, "code", None) == UNIQUE_VIOLATION:
+                    return False
+                raise
+            return True
+        result = table.update(row).eq("user_id", user_id).eq("updated_at", version).execute()
+        return bool(result.data)
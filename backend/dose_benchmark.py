@@ -0,0 +1,95 @@
+"""
+Dose status benchmark for SafeDoser backend
+Times the vectorised DoseIndex pass over a synthetic population against calling
+utils.get_supplement_status dose by dose, after checking both agree on a sample.
+
+Usage:
+    python dose_benchmark.py --doses 10000 100000 1000000
+"""
+
+import time
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+import numpy as np
+
+from dose_index import DoseIndex
+from timeline import PERIODS
+from utils import get_supplement_status
+
+LEGACY_STATUS = {"due": "due", "missed": "missed", "upcoming": "upcoming"}
+
+def build_population(dose_count: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """Supplements of one to three doses each, spread over users of about five supplements"""
+    supplements = []
+    doses = 0
+    while doses < dose_count:
+        times = min(rng.randint(1, 3), dose_count - doses)
+        supplements.append({
+            "id": len(supplements) + 1,
+            "user_id": f"user-{len(supplements) // 5}",
+            "times_of_day": {
+                PERIODS[i]: [f"{rng.randrange(24):02d}:{rng.randrange(60):02d}"] for i in range(times)
+            },
+        })
+        doses += times
+    return supplements
+
+def legacy_statuses(supplements: List[Dict[str, Any]], now: datetime) -> Dict[str, int]:
+    """Counts from calling get_supplement_status once per dose"""
+    counts = {"due": 0, "missed": 0, "upcoming": 0}
+    for supplement in supplements:
+        for period, times in supplement["times_of_day"].items():
+            status = get_supplement_status({"times_of_day": {period: times}}, now)
+            counts[LEGACY_STATUS[status]] += 1
+    return counts
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark population dose status evaluation")
+    parser.add_argument("--doses", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--runs", type=int, default=20, help="Vectorised passes to average")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # Whole minute, so the per-second legacy check and per-minute index agree
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+
+    print(f"{'doses':>9}  {'load s':>7}  {'legacy ms':>10}  {'vectorised ms':>13}  {'speedup':>8}  counts")
+    for count in args.doses:
+        supplements = build_population(count, rng)
+
+        started = time.perf_counter()
+        index = DoseIndex()
+        for supplement in supplements:
+            index.set_supplement(supplement["user_id"], supplement)
+        load_s = time.perf_counter() - started
+
+        status = index.evaluate(now.timestamp())
+        sample = supplements[:2000]
+        expected = legacy_statuses(sample, now.replace(tzinfo=None))
+        sample_rows = np.flatnonzero(index.supplement[:index.count] <= sample[-1]["id"])
+        actual = {name: int(np.isin(getattr(status, name), sample_rows).sum()) for name in expected}
+        if expected != actual:
+            raise SystemExit(f"Mismatch on the first {len(sample)} supplements: legacy {expected}, vectorised {actual}")
+
+        # The legacy path is timed on a slice and scaled, it takes minutes at full size
+        legacy_slice = supplements[:max(1, min(len(supplements), 20_000))]
+        started = time.perf_counter()
+        legacy_statuses(legacy_slice, now.replace(tzinfo=None))
+        legacy_ms = (time.perf_counter() - started) * 1000 * len(supplements) / len(legacy_slice)
+
+        started = time.perf_counter()
+        for run in range(args.runs):
+            status = index.evaluate((now + timedelta(minutes=run)).timestamp())
+        vectorised_ms = (time.perf_counter() - started) * 1000 / args.runs
+
+        print(
+            f"{len(index):>9}  {load_s:>7.2f}  {legacy_ms:>10.1f}  {vectorised_ms:>13.2f}  "
+            f"{legacy_ms / vectorised_ms:>7.0f}x  {status.counts()}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Population dose index for SafeDoser backend
+Holds every scheduled dose of every user as NumPy columns (user index,
+supplement id, minute of day) with one UTC offset per user, so the due / missed
+/ upcoming status of the whole population is a single vectorised pass instead
+of a strptime loop per supplement. The pass runs once a minute and uses the
+same +/-30 minute window as the timeline.
+"""
+
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from timeline import DUE_WINDOW_MINUTES, MINUTES_PER_DAY, PERIODS, parse_dose_time
+
+logger = logging.getLogger(__name__)
+
+class DoseStatus:
+    """Row indexes of due, missed and upcoming doses at one instant"""
+
+    __slots__ = ("index", "evaluated_at", "due", "missed", "upcoming")
+
+    def __init__(self, index: "DoseIndex", evaluated_at: float, due: np.ndarray, missed: np.ndarray, upcoming: np.ndarray):
+        self.index = index
+        self.evaluated_at = evaluated_at
+        self.due = due
+        self.missed = missed
+        self.upcoming = upcoming
+
+    def counts(self) -> Dict[str, int]:
+        return {"due": len(self.due), "missed": len(self.missed), "upcoming": len(self.upcoming)}
+
+    def supplement_ids(self, rows: np.ndarray) -> np.ndarray:
+        return np.unique(self.index.supplement[rows])
+
+    def user_ids(self, rows: np.ndarray) -> List[str]:
+        return [self.index.user_ids[position] for position in np.unique(self.index.user[rows])]
+
+class DoseIndex:
+    """Columnar store of scheduled doses with per-user UTC offsets"""
+
+    def __init__(self, capacity: int = 1024, default_tz_offset: int = 0):
+        # Minutes east of UTC for users whose clients have not reported one
+        self.default_tz_offset = default_tz_offset
+        self.user = np.zeros(capacity, dtype=np.int32)
+        self.supplement = np.zeros(capacity, dtype=np.int64)
+        self.minute = np.zeros(capacity, dtype=np.int16)
+        self.active = np.zeros(capacity, dtype=bool)
+        # Rows in use, active or freed
+        self.count = 0
+        self._free: List[int] = []
+        self._rows: Dict[int, List[int]] = {}
+
+        self.user_ids: List[str] = []
+        self._user_positions: Dict[str, int] = {}
+        self._tz_offsets = np.zeros(64, dtype=np.int16)
+
+        self.latest: Optional[DoseStatus] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, Any] = {"evaluations": 0, "last_eval_ms": 0.0, "max_eval_ms": 0.0}
+
+    def __len__(self) -> int:
+        return self.count - len(self._free)
+
+    def _user_position(self, user_id: str) -> int:
+        position = self._user_positions.get(user_id)
+        if position is None:
+            position = self._user_positions[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+            if position == len(self._tz_offsets):
+                self._tz_offsets = np.concatenate([self._tz_offsets, np.zeros(len(self._tz_offsets), dtype=np.int16)])
+            self._tz_offsets[position] = self.default_tz_offset
+        return position
+
+    def _row(self) -> int:
+        if self._free:
+            return self._free.pop()
+        if self.count == len(self.active):
+            size = len(self.active)
+            self.user = np.concatenate([self.user, np.zeros(size, dtype=np.int32)])
+            self.supplement = np.concatenate([self.supplement, np.zeros(size, dtype=np.int64)])
+            self.minute = np.concatenate([self.minute, np.zeros(size, dtype=np.int16)])
+            self.active = np.concatenate([self.active, np.zeros(size, dtype=bool)])
+        self.count += 1
+        return self.count - 1
+
+    def set_supplement(self, user_id: str, supplement: Dict[str, Any]) -> None:
+        """Replace a supplement's doses with those in its current schedule"""
+        supplement_id = supplement["id"]
+        self.remove_supplement(supplement_id)
+        times_of_day = supplement.get("times_of_day") or {}
+        minutes = [
+            minute
+            for period in PERIODS
+            for minute in map(parse_dose_time, times_of_day.get(period) or [])
+            if minute is not None
+        ]
+        if not minutes:
+            return
+
+        position = self._user_position(user_id)
+        rows = []
+        for minute in minutes:
+            row = self._row()
+            self.user[row] = position
+            self.supplement[row] = supplement_id
+            self.minute[row] = minute
+            self.active[row] = True
+            rows.append(row)
+        self._rows[supplement_id] = rows
+
+    def remove_supplement(self, supplement_id: int) -> None:
+        rows = self._rows.pop(supplement_id, None)
+        if rows:
+            self.active[rows] = False
+            self._free.extend(rows)
+
+    def owner(self, supplement_id: int) -> Optional[str]:
+        """User a scheduled supplement belongs to, without a database read"""
+        rows = self._rows.get(supplement_id)
+        return self.user_ids[self.user[rows[0]]] if rows else None
+
+    def set_user_offset(self, user_id: str, tz_offset: int) -> None:
+        self._tz_offsets[self._user_position(user_id)] = tz_offset
+
+    def evaluate(self, now: Optional[float] = None) -> DoseStatus:
+        """Classify every dose against each user's local minute of day"""
+        now = time.time() if now is None else now
+        started = time.perf_counter()
+        count = self.count
+        utc_minute = int(now // 60) % MINUTES_PER_DAY
+
+        local_minute = (self._tz_offsets[self.user[:count]].astype(np.int32) + utc_minute) % MINUTES_PER_DAY
+        # Minutes until each dose today; negative once its time has passed
+        offsets = self.minute[:count] - local_minute
+        active = self.active[:count]
+
+        status = DoseStatus(
+            self,
+            now,
+            due=np.flatnonzero(active & (np.abs(offsets) <= DUE_WINDOW_MINUTES)),
+            missed=np.flatnonzero(active & (offsets < -DUE_WINDOW_MINUTES)),
+            upcoming=np.flatnonzero(active & (offsets > DUE_WINDOW_MINUTES)),
+        )
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stats["evaluations"] += 1
+        self.stats["last_eval_ms"] = round(elapsed_ms, 3)
+        self.stats["max_eval_ms"] = round(max(self.stats["max_eval_ms"], elapsed_ms), 3)
+        return status
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                self.latest = self.evaluate()
+            except Exception as e:
+                logger.error(f"Dose status evaluation failed: {str(e)}")
+            # Re-evaluate at the top of each minute
+            await asyncio.sleep(60 - time.time() % 60)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "doses": len(self),
+            "users": len(self.user_ids),
+            **(self.latest.counts() if self.latest else {}),
+        }
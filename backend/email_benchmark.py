@@ -0,0 +1,171 @@
+"""
+Email throughput benchmark for SafeDoser backend
+Drives EmailService against the local SMTP sink (or any SMTP server) at a target
+concurrency and reports messages/sec, p50/p99 latency and error codes.
+
+Usage:
+    python email_benchmark.py --messages 500 --concurrency 20 --flow mixed
+    python email_benchmark.py --host smtp.example.test --port 587 --no-sink
+"""
+
+import time
+import asyncio
+import logging
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any
+
+from email_service import EmailService, EmailDeliveryResult
+from smtp_sink import SMTPSink, FAILURE_REPLIES
+
+logger = logging.getLogger(__name__)
+
+FLOWS = ("send", "verification", "reset", "mixed")
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def build_email_service(
+    host: str,
+    port: int,
+    username: str,
+    password: str,
+    use_tls: bool
+) -> EmailService:
+    """Create an EmailService pointed at the benchmark target"""
+    service = EmailService()
+    service.smtp_server = host
+    service.smtp_port = port
+    service.smtp_username = username
+    service.smtp_password = password
+    service.smtp_use_tls = use_tls
+    service.from_email = "bench@safedoser.local"
+    service.is_configured = True
+    return service
+
+async def _send_one(service: EmailService, flow: str, index: int) -> EmailDeliveryResult:
+    email = f"user{index}@bench.safedoser.local"
+    token = service.generate_verification_token(email)
+    if flow == "mixed":
+        flow = ("send", "verification", "reset")[index % 3]
+    if flow == "verification":
+        return await service.send_verification_email(email, f"Bench User {index}", token)
+    if flow == "reset":
+        return await service.send_password_reset_email(email, f"Bench User {index}", token)
+    return await service._send_email(email, "SafeDoser benchmark", f"Benchmark message {index}", f"<p>Benchmark message {index}</p>")
+
+async def run_benchmark(
+    service: EmailService,
+    messages: int,
+    concurrency: int,
+    flow: str = "send"
+) -> Dict[str, Any]:
+    """Send `messages` emails with at most `concurrency` in flight"""
+    latencies: List[float] = []
+    error_codes: Counter = Counter()
+    queue: asyncio.Queue = asyncio.Queue()
+    for index in range(messages):
+        queue.put_nowait(index)
+
+    async def worker() -> None:
+        while True:
+            try:
+                index = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            result = await _send_one(service, flow, index)
+            latencies.append((time.perf_counter() - start) * 1000)
+            error_codes["OK" if result.success else (result.error_code or "UNKNOWN")] += 1
+
+    # SMTP sessions run on the loop's default executor; size it so it never caps concurrency
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="email-bench")
+    asyncio.get_running_loop().set_default_executor(executor)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "flow": flow,
+        "messages": messages,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "messages_per_sec": round(messages / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+        "error_codes": dict(error_codes),
+    }
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [
+        f"flow={report['flow']} messages={report['messages']} concurrency={report['concurrency']}",
+        f"  elapsed:    {report['elapsed_s']} s",
+        f"  throughput: {report['messages_per_sec']} msg/s",
+        f"  latency:    p50={report['p50_ms']} ms  p99={report['p99_ms']} ms  max={report['max_ms']} ms",
+        "  results:",
+    ]
+    for code, count in sorted(report["error_codes"].items(), key=lambda item: -item[1]):
+        lines.append(f"    {code:<28} {count}")
+    return "\n".join(lines)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark SafeDoser email delivery")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--flow", choices=FLOWS, default="send")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="Target port (0 picks a free port for the bundled sink)")
+    parser.add_argument("--no-sink", action="store_true", help="Target an existing server instead of starting the sink")
+    parser.add_argument("--starttls", action="store_true", help="Use STARTTLS (the sink advertises it too)")
+    # EmailService always logs in, so the sink always requires AUTH
+    parser.add_argument("--auth", default="bench:bench", help="USER:PASSWORD for AUTH")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Sink latency injection")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Sink latency jitter")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Sink failure injection rate")
+    parser.add_argument("--fail-stage", default="data", choices=sorted(FAILURE_REPLIES))
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    username, _, password = args.auth.partition(":")
+
+    sink = None
+    port = args.port
+    if not args.no_sink:
+        sink = SMTPSink(
+            host=args.host,
+            port=args.port,
+            starttls=args.starttls,
+            username=username,
+            password=password,
+            latency_ms=args.latency_ms,
+            jitter_ms=args.jitter_ms,
+            fail_rate=args.fail_rate,
+            fail_stage=args.fail_stage,
+            seed=args.seed,
+        ).start_in_thread()
+        port = sink.port
+
+    service = build_email_service(args.host, port, username, password, args.starttls)
+
+    try:
+        report = asyncio.run(run_benchmark(service, args.messages, args.concurrency, args.flow))
+    finally:
+        if sink:
+            sink.stop_thread()
+
+    print(format_report(report))
+    if sink:
+        print(f"  sink stats: {sink.stats}")
+
+if __name__ == "__main__":
+    main()
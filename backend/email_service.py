@@ -4,6 +4,7 @@ Handles email verification and password reset emails with real status reporting
 """
 
 import os
+import asyncio
 import logging
 import smtplib
 import secrets
@@ -33,6 +34,7 @@ class EmailService:
         self.smtp_port = int(os.getenv("SMTP_PORT", "587"))
         self.smtp_username = os.getenv("SMTP_USERNAME")
         self.smtp_password = os.getenv("SMTP_PASSWORD")
+        self.smtp_use_tls = os.getenv("SMTP_USE_TLS", "true").lower() != "false"
         self.from_email = os.getenv("FROM_EMAIL", self.smtp_username)
         self.app_name = "SafeDoser"
         self.frontend_url = os.getenv("FRONTEND_URL", "https://safedoser.netlify.app")
@@ -283,6 +285,11 @@ class EmailService:
             )
     
     async def _send_email(self, to_email: str, subject: str, text_body: str, html_body: str) -> EmailDeliveryResult:
+        """Send email using SMTP with detailed error reporting, off the event loop"""
+        # smtplib blocks for the whole SMTP session, so it runs on the default thread pool
+        return await asyncio.to_thread(self._send_email_sync, to_email, subject, text_body, html_body)
+
+    def _send_email_sync(self, to_email: str, subject: str, text_body: str, html_body: str) -> EmailDeliveryResult:
         """Send email using SMTP with detailed error reporting"""
         try:
             # Validate email configuration
@@ -313,14 +320,15 @@ class EmailService:
                     server.set_debuglevel(0)
                     
                     # Start TLS encryption
-                    try:
-                        server.starttls()
-                    except smtplib.SMTPException as e:
-                        return EmailDeliveryResult(
-                            success=False,
-                            message=f"Failed to start TLS encryption: {str(e)}",
-                            error_code="SMTP_TLS_FAILED"
-                        )
+                    if self.smtp_use_tls:
+                        try:
+                            server.starttls()
+                        except smtplib.SMTPException as e:
+                            return EmailDeliveryResult(
+                                success=False,
+                                message=f"Failed to start TLS encryption: {str(e)}",
+                                error_code="SMTP_TLS_FAILED"
+                            )
                     
                     # Authenticate
                     try:
@@ -411,7 +419,8 @@ class EmailService:
         try:
             with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
                 server.set_debuglevel(0)
-                server.starttls()
+                if self.smtp_use_tls:
+                    server.starttls()
                 if self.smtp_username is None or self.smtp_password is None:
                     return EmailDeliveryResult(
                         success=False,
@@ -0,0 +1,130 @@
+"""
+Fallback responder benchmark for SafeDoser backend
+Compares the FallbackMatcher path in AIService._generate_fallback_response
+against the original keyword-scan implementation, checking both give the same reply.
+
+Usage:
+    python fallback_benchmark.py --supplements 5 30 100 --iterations 2000
+"""
+
+import os
+import time
+import random
+import argparse
+from typing import Any, Callable, Dict, List
+
+from ai_service import AIService
+
+MESSAGES = [
+    "Hello there!",
+    "When should I take my {name}?",
+    "Can I combine {name} with coffee?",
+    "What is the right dosage for {name}",
+    "I have a weird reaction after breakfast",
+    "Is it ok to take these together at night?",
+    "how much water should I drink",
+    "What are the benefits of zinc for health?",
+    "Tell me something useful about my regimen please",
+    "Could this cause any side effects over a long time?",
+    "My doctor changed my schedule, what do I do with the {name}",
+    "Thanks, that was really useful",
+]
+
+SUPPLEMENT_NAMES = [
+    "Vitamin D3", "Vitamin D", "Magnesium Glycinate", "Magnesium", "Omega-3 Fish Oil", "Vitamin C",
+    "Probiotic Complex", "Melatonin", "Zinc", "Iron", "Calcium Citrate", "Vitamin B12", "Folate",
+    "Ashwagandha", "Turmeric", "CoQ10", "Biotin", "Collagen", "Creatine", "Elderberry",
+]
+
+def legacy_fallback_response(user_message: str, context: Dict[str, Any]) -> str:
+    """Reference copy of the keyword-scan fallback responder"""
+    user_name = context.get("user_name", "")
+    supplements = context.get("supplements", [])
+    lower_message = user_message.lower()
+
+    if any(word in lower_message for word in ['hello', 'hi', 'hey', 'good morning', 'good afternoon']):
+        greeting = "Hello! 👋" if not user_name else f"Hello {user_name}! 👋"
+        return f"{greeting} I'm here to help with questions about your medications and supplements. What would you like to know? 💊"
+
+    mentioned_supplement = None
+    for supp in supplements:
+        if supp.get('name', '').lower() in lower_message:
+            mentioned_supplement = supp
+            break
+
+    if mentioned_supplement:
+        name = mentioned_supplement.get('name', 'this supplement')
+        return f"I can help with {name}! What specifically would you like to know - timing, interactions, benefits, or side effects? For personalized dosing advice, always consult your healthcare provider. 💊"
+
+    if any(word in lower_message for word in ['interaction', 'interact', 'together', 'combine']):
+        if not supplements:
+            return "You don't have any supplements tracked yet. When you add them, I can help check for potential interactions! 🔍"
+        return "I can help with interaction information! Some supplements compete for absorption (like calcium and iron), while others work better together. For prescription drug interactions, always check with your pharmacist. What specific interaction concerns do you have?"
+
+    if any(word in lower_message for word in ['side effect', 'adverse', 'reaction', 'problem']):
+        return "Side effects are important to monitor. Common supplement side effects include digestive upset or headaches. If you're experiencing concerning symptoms, contact your healthcare provider immediately. What specific concerns do you have? ⚕️"
+
+    if any(word in lower_message for word in ['dose', 'dosage', 'how much', 'amount']):
+        return "Dosage questions are crucial for safety! I recommend confirming all dosages with your healthcare provider or pharmacist. Never adjust doses without medical supervision. What specific dosage question do you have? 📋"
+
+    if any(word in lower_message for word in ['when', 'time', 'timing', 'schedule']):
+        if not supplements:
+            return "You don't have supplements scheduled yet. When you add them, I can help optimize timing for best absorption! ⏰"
+        return "Great question about timing! Morning is best for energizing supplements (B vitamins), evening for relaxing ones (magnesium). Fat-soluble vitamins work better with meals. What timing question do you have? ⏰"
+
+    if any(word in lower_message for word in ['health', 'benefit', 'good for', 'help with']):
+        return "Supplements work best as part of a healthy lifestyle with proper diet and exercise. Each supplement has specific benefits - what particular health goal or supplement are you curious about? 🌟"
+
+    return "I can help with supplement information, interactions, timing, dosage guidance, and general health questions. What would you like to know? For personalized medical advice, always consult your healthcare provider."
+
+def build_cases(supplement_count: int, rng: random.Random) -> List[tuple]:
+    """Messages paired with a regimen of `supplement_count` items"""
+    names = [
+        SUPPLEMENT_NAMES[i] if i < len(SUPPLEMENT_NAMES) else f"Custom Blend {i}"
+        for i in range(supplement_count)
+    ]
+    rng.shuffle(names)
+    supplements = [{"name": name, "dosage_form": "Tablet", "frequency": "Daily"} for name in names]
+    context = {"user_id": f"bench-{supplement_count}", "user_name": "Bench", "supplements": supplements}
+
+    cases = []
+    for template in MESSAGES:
+        name = rng.choice(names) if names else "zinc"
+        cases.append((template.format(name=name), context))
+    return cases
+
+def time_calls(fn: Callable[[str, Dict[str, Any]], str], cases: List[tuple], iterations: int) -> float:
+    """Mean microseconds per call"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for message, context in cases:
+            fn(message, context)
+    return (time.perf_counter() - started) / (iterations * len(cases)) * 1e6
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the fallback responder")
+    parser.add_argument("--supplements", type=int, nargs="+", default=[0, 5, 30, 100])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    # The benchmark only exercises the offline path
+    os.environ.pop("GEMINI_API_KEY", None)
+    service = AIService()
+    rng = random.Random(args.seed)
+
+    print(f"{'supplements':>11}  {'legacy us/call':>14}  {'matcher us/call':>16}  {'speedup':>7}")
+    for count in args.supplements:
+        cases = build_cases(count, rng)
+        for message, context in cases:
+            expected = legacy_fallback_response(message, context)
+            actual = service._generate_fallback_response(message, context)
+            if expected != actual:
+                raise SystemExit(f"Mismatch for {message!r} with {count} supplements:\n  legacy:   {expected}\n  matcher:  {actual}")
+
+        legacy = time_calls(legacy_fallback_response, cases, args.iterations)
+        compiled = time_calls(service._generate_fallback_response, cases, args.iterations)
+        print(f"{count:>11}  {legacy:>14.2f}  {compiled:>16.2f}  {legacy / compiled:>6.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Supplement-name matching for the offline fallback responder
+Finds the first supplement a message mentions. Typical regimens are scanned
+name by name, which is fastest at that size; large ones (COMPILED_NAMES_MIN and
+up) use a trie regex compiled once per user regimen, so the message is scanned
+in one pass instead of once per name. The threshold comes from
+fallback_benchmark.py.
+"""
+
+import re
+import logging
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Regimen size from which the compiled name index beats scanning name by name
+COMPILED_NAMES_MIN = 48
+
+def _trie_pattern(terms: Iterable[str]) -> str:
+    """Regex alternation factored into a prefix trie, longest branch first.
+
+    CPython's re tries plain alternatives one by one at every position; sharing
+    prefixes lets it reject most positions after a single character.
+    """
+    trie: Dict[str, Any] = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # A term ending here is optional so longer terms win (greedy)
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+class KeywordScanner:
+    """Finds the best-ranked term occurring as a substring of a text in one regex pass.
+
+    A non-overlapping scan can hide a term that starts inside an earlier match, so
+    each term carries the terms it implies (proper prefixes, always present) and
+    the better-ranked terms that may overlap it (verified with a substring check).
+    """
+
+    def __init__(self, ranks: Dict[str, int]):
+        self.ranks = {term: rank for term, rank in ranks.items() if term}
+        terms = sorted(self.ranks)
+        self._pattern = re.compile(_trie_pattern(terms)) if terms else None
+
+        # term -> (rank, term) of the best-ranked term it guarantees
+        self._guaranteed: Dict[str, Tuple[int, str]] = {}
+        # term -> [(rank, term)] that may overlap an occurrence, best first
+        self._overlapping: Dict[str, List[Tuple[int, str]]] = {}
+        for term in terms:
+            implied = [term[:i] for i in range(1, len(term) + 1) if term[:i] in self.ranks]
+            self._guaranteed[term] = min((self.ranks[t], t) for t in implied)
+
+            overlapping: Set[str] = set()
+            for offset in range(1, len(term)):
+                suffix = term[offset:]
+                # Terms that fit inside the suffix, or that the suffix starts
+                overlapping.update(suffix[:i] for i in range(1, len(suffix) + 1) if suffix[:i] in self.ranks)
+                start = bisect_left(terms, suffix)
+                while start < len(terms) and terms[start].startswith(suffix):
+                    overlapping.add(terms[start])
+                    start += 1
+            self._overlapping[term] = sorted(
+                (self.ranks[t], t) for t in overlapping if self.ranks[t] < self._guaranteed[term][0]
+            )
+
+    def first(self, text: str) -> Optional[str]:
+        """Lowest-ranked term that occurs in text"""
+        if self._pattern is None:
+            return None
+        matches = self._pattern.findall(text)
+        if not matches:
+            return None
+
+        best = min(self._guaranteed[term] for term in matches)
+        for term in matches:
+            for rank, candidate in self._overlapping[term]:
+                if rank >= best[0]:
+                    break
+                if candidate in text:
+                    best = (rank, candidate)
+                    break
+        return best[1]
+
+class SupplementNameIndex:
+    """Compiled matcher over one user's supplement names"""
+
+    def __init__(self, names: List[str]):
+        self.size = len(names)
+        # First list position of each distinct lowercased name
+        positions: Dict[str, int] = {}
+        for position, name in enumerate(names):
+            if name and name not in positions:
+                positions[name] = position
+        self._scanner = KeywordScanner(positions)
+
+    def first_mentioned(self, lower_message: str) -> Optional[Tuple[int, str]]:
+        """(list index, name) of the first supplement, in list order, named in the message"""
+        name = self._scanner.first(lower_message)
+        return (self._scanner.ranks[name], name) if name is not None else None
+
+class FallbackMatcher:
+    """LRU of compiled supplement-name indexes for large regimens"""
+
+    def __init__(self, max_indexes: int = 4096, compiled_names_min: int = COMPILED_NAMES_MIN):
+        self.max_indexes = max_indexes
+        self.compiled_names_min = compiled_names_min
+        self._indexes: "OrderedDict[str, SupplementNameIndex]" = OrderedDict()
+
+    def first_mentioned(
+        self,
+        lower_message: str,
+        supplements: List[Dict[str, Any]],
+        user_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """First supplement, in list order, whose name occurs in the lowercased message
+
+        Meant for regimens of compiled_names_min and up; below that a plain scan is faster.
+        """
+        index = self._index_for(user_id, supplements)
+        found = index.first_mentioned(lower_message)
+        if found is not None:
+            position, name = found
+            # Guard against a regimen that changed without an invalidate() call
+            if (supplements[position].get("name") or "").lower() != name:
+                index = self._index_for(user_id, supplements, rebuild=True)
+                found = index.first_mentioned(lower_message)
+        return supplements[found[0]] if found is not None else None
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop a user's index after their supplements change"""
+        self._indexes.pop(user_id, None)
+
+    def _index_for(
+        self,
+        user_id: Optional[str],
+        supplements: List[Dict[str, Any]],
+        rebuild: bool = False
+    ) -> SupplementNameIndex:
+        names = None
+        key = user_id
+        if key is None:
+            # No user to key on: key by the regimen itself
+            names = [(supp.get("name") or "").lower() for supp in supplements]
+            key = "\0".join(names)
+
+        index = None if rebuild else self._indexes.get(key)
+        if index is None or index.size != len(supplements):
+            if names is None:
+                names = [(supp.get("name") or "").lower() for supp in supplements]
+            index = self._indexes[key] = SupplementNameIndex(names)
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+        else:
+            self._indexes.move_to_end(key)
+        return index
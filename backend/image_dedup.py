@@ -0,0 +1,178 @@
+"""
+Image deduplication for SafeDoser backend
+Indexes every stored upload by its owner, the SHA-256 of its original bytes and
+a 64-bit difference hash (dHash) of its pixels. A byte-identical re-upload
+reuses the existing blob without any image processing. Visually similar images
+(the same bottle photographed twice) are found by Hamming distance over a NumPy
+array of the owner's hashes. Avatars are not indexed at all.
+
+Scope: lookups never cross users, so one user's photos are never offered to
+another. This deliberately narrows the original goal of suggesting an existing
+catalog entry when users photograph the same retail product: near duplicates
+are only the uploader's own earlier images, and storage is only shared for
+byte-identical uploads, by the content-addressed blob store. Cross-user
+suggestions would need catalog metadata (a product name, not another user's
+photo URL), which the index does not hold.
+
+Workers share the JSON-lines file: each lookup first reads any lines other
+workers appended since the last one, so their uploads are matched too.
+"""
+
+import os
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from blob_store import DEFAULT_BLOB_DIR
+
+logger = logging.getLogger(__name__)
+
+def perceptual_hash(image: Image.Image) -> int:
+    """64-bit dHash: whether each pixel of a 9x8 grayscale thumbnail is brighter than its left neighbour"""
+    small = image.convert("L").resize((9, 8), Image.Resampling.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+class ImageHashIndex:
+    """Exact and perceptual hash index over stored images, persisted as JSON lines"""
+
+    def __init__(self, path: Optional[str] = None, max_distance: int = 6):
+        self.path = path
+        # Hamming distance at or below which two images count as near duplicates
+        self.max_distance = max_distance
+        # (owner, sha256) -> blob key
+        self._by_sha: Dict[Tuple[str, str], str] = {}
+        # owner -> blob keys and their perceptual hashes, in the same order
+        self._keys: Dict[str, List[str]] = {}
+        self._hashes: Dict[str, np.ndarray] = {}
+        self.indexed = 0
+        # Bytes of the index file already read
+        self._offset = 0
+        self.stats: Dict[str, int] = {"exact_hits": 0, "near_matches": 0}
+        if path:
+            self._load()
+
+    @classmethod
+    def from_env(cls) -> "ImageHashIndex":
+        return cls(
+            path=os.getenv(
+                "IMAGE_INDEX_PATH",
+                os.path.join(os.getenv("BLOB_STORE_DIR", DEFAULT_BLOB_DIR), "image_index.jsonl")
+            ),
+            max_distance=int(os.getenv("IMAGE_NEAR_DUPLICATE_DISTANCE", "6")),
+        )
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            unowned = self._read_new_lines()
+            logger.info(f"Loaded {self.indexed} image hashes from {self.path}, skipped {unowned} without an owner")
+        except Exception as e:
+            logger.error(f"Failed to load image hash index {self.path}: {str(e)}")
+
+    def _refresh(self) -> None:
+        """Index lines appended to the file, by any worker, since the last read"""
+        if not self.path:
+            return
+        try:
+            if os.path.getsize(self.path) > self._offset:
+                self._read_new_lines()
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to refresh image hash index {self.path}: {str(e)}")
+
+    def _read_new_lines(self) -> int:
+        """Index complete lines past the read offset; returns how many had no owner"""
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        # A line still being written by another worker is read next time
+        complete = data[:data.rfind(b"\n") + 1]
+        self._offset += len(complete)
+        unowned = 0
+        for line in complete.decode("utf-8").splitlines():
+            if line.strip():
+                entry = json.loads(line)
+                if not entry.get("owner"):
+                    # Written before entries carried an owner; they can't be matched safely
+                    unowned += 1
+                    continue
+                if (entry["owner"], entry["sha256"]) not in self._by_sha:
+                    self._insert(entry["owner"], entry["sha256"], entry["key"], int(entry["phash"], 16))
+        return unowned
+
+    def exact(self, owner: str, sha256: str) -> Optional[str]:
+        """Blob key of an earlier upload by the same owner with identical bytes"""
+        self._refresh()
+        key = self._by_sha.get((owner, sha256))
+        if key is not None:
+            self.stats["exact_hits"] += 1
+        return key
+
+    def similar(self, owner: str, phash: int, limit: int = 5, exclude: Optional[str] = None) -> List[Tuple[int, str]]:
+        """(distance, blob key) of the owner's closest near-duplicate images, best first"""
+        self._refresh()
+        keys = self._keys.get(owner)
+        if not keys:
+            return []
+        count = len(keys)
+        distances = _popcount(self._hashes[owner][:count] ^ np.uint64(phash))
+        candidates = np.flatnonzero(distances <= self.max_distance)
+        matches: List[Tuple[int, str]] = []
+        seen = {exclude}
+        for position in candidates[np.argsort(distances[candidates], kind="stable")]:
+            key = keys[position]
+            if key in seen:
+                continue
+            seen.add(key)
+            matches.append((int(distances[position]), key))
+            if len(matches) >= limit:
+                break
+        if matches:
+            self.stats["near_matches"] += 1
+        return matches
+
+    def add(self, owner: str, sha256: str, key: str, phash: int) -> None:
+        self._refresh()
+        if (owner, sha256) in self._by_sha:
+            return
+        self._insert(owner, sha256, key, phash)
+        if self.path:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"owner": owner, "sha256": sha256, "key": key, "phash": f"{phash:016x}"}) + "\n")
+            except Exception as e:
+                logger.error(f"Failed to persist image hash for {key}: {str(e)}")
+
+    def _insert(self, owner: str, sha256: str, key: str, phash: int) -> None:
+        self._by_sha[(owner, sha256)] = key
+        keys = self._keys.setdefault(owner, [])
+        hashes = self._hashes.get(owner)
+        if hashes is None or len(keys) == len(hashes):
+            grown = np.zeros(max(16, 2 * len(keys)), dtype=np.uint64)
+            if hashes is not None:
+                grown[:len(keys)] = hashes
+            hashes = self._hashes[owner] = grown
+        hashes[len(keys)] = phash
+        keys.append(key)
+        self.indexed += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "indexed": self.indexed,
+            "owners": len(self._keys),
+            "max_distance": self.max_distance,
+        }
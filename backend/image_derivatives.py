@@ -0,0 +1,157 @@
+"""
+Image derivatives for SafeDoser backend
+Renders downscaled WebP and JPEG copies of stored images on first request (card
+icons, list rows, detail views) and keeps them in an on-disk cache bounded by an
+LRU byte budget. Concurrent requests for the same derivative share one render.
+The budget and LRU order are tracked per worker process while the files are
+shared, so a worker may find one of its entries removed by another worker's
+eviction; it then renders the derivative again. With several workers the
+directory can hold up to workers x the budget.
+"""
+
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from blob_store import BlobStore, DEFAULT_BLOB_DIR
+from image_pipeline import ImagePipeline
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DERIVATIVE_DIR = os.path.join(DEFAULT_BLOB_DIR, "derivatives")
+
+DERIVATIVE_SIZES = (64, 256, 800)
+
+# query value -> (Pillow format, MIME type, extension)
+DERIVATIVE_FORMATS = {
+    "webp": ("WEBP", "image/webp", "webp"),
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+}
+
+def pick_size(requested: Optional[int]) -> int:
+    """Smallest standard size covering the request, or the largest one"""
+    if requested is None:
+        return DERIVATIVE_SIZES[-1]
+    for size in DERIVATIVE_SIZES:
+        if size >= requested:
+            return size
+    return DERIVATIVE_SIZES[-1]
+
+def pick_format(requested: Optional[str], accept: str) -> Optional[str]:
+    """Explicit format, else WebP when the client accepts it, else JPEG; None if unsupported"""
+    if requested:
+        requested = requested.lower()
+        requested = "jpeg" if requested == "jpg" else requested
+        return requested if requested in DERIVATIVE_FORMATS else None
+    return "webp" if "image/webp" in accept else "jpeg"
+
+class DerivativeCache:
+    """On-disk derivative files with least-recently-used eviction, budgeted per worker process"""
+
+    def __init__(self, root: str = DEFAULT_DERIVATIVE_DIR, max_bytes: int = 256 * 1024 * 1024, quality: int = 80):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.quality = quality
+        # file name -> size in bytes, oldest use first
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        self._rendering: Dict[str, asyncio.Future] = {}
+        self.stats: Dict[str, int] = {"hits": 0, "renders": 0, "evictions": 0, "failures": 0, "missing": 0}
+        self._load()
+
+    @classmethod
+    def from_env(cls) -> "DerivativeCache":
+        return cls(
+            root=os.getenv(
+                "DERIVATIVE_CACHE_DIR",
+                os.path.join(os.getenv("BLOB_STORE_DIR", DEFAULT_BLOB_DIR), "derivatives")
+            ),
+            max_bytes=int(os.getenv("DERIVATIVE_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+            quality=int(os.getenv("DERIVATIVE_QUALITY", "80")),
+        )
+
+    def _load(self) -> None:
+        """Index files left by a previous run, least recently modified first"""
+        if not os.path.isdir(self.root):
+            return
+        found = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                stat = os.stat(os.path.join(directory, name))
+                found.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self.total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def name_for(key: str, size: int, format: str) -> str:
+        return f"{key.split('.')[0]}-{size}.{DERIVATIVE_FORMATS[format][2]}"
+
+    def path_for(self, name: str) -> str:
+        return os.path.join(self.root, name[:2], name)
+
+    async def get(self, blob_store: BlobStore, pipeline: ImagePipeline, key: str, size: int, format: str) -> str:
+        """Path of a derivative, rendering it through the pipeline on a miss"""
+        name = self.name_for(key, size, format)
+        if name in self._entries:
+            if os.path.exists(self.path_for(name)):
+                self._entries.move_to_end(name)
+                self.stats["hits"] += 1
+                return self.path_for(name)
+            # Evicted by another worker sharing the directory; render it again
+            self.total_bytes -= self._entries.pop(name)
+            self.stats["missing"] += 1
+
+        rendering = self._rendering.get(name)
+        if rendering is not None:
+            return await asyncio.shield(rendering)
+
+        rendering = self._rendering[name] = asyncio.get_running_loop().create_future()
+        try:
+            path = self.path_for(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            result = await pipeline.render_derivative(
+                blob_store.path_for(key), path, size, DERIVATIVE_FORMATS[format][0], self.quality
+            )
+            self.stats["renders"] += 1
+            self._entries[name] = result["bytes"]
+            self.total_bytes += result["bytes"]
+            self._evict(keep=name)
+            rendering.set_result(path)
+            return path
+        except BaseException as e:
+            self.stats["failures"] += 1
+            rendering.set_exception(e if isinstance(e, Exception) else RuntimeError("Derivative render was cancelled"))
+            # Mark retrieved so a render nobody else awaited does not log "never retrieved"
+            rendering.exception()
+            raise
+        finally:
+            self._rendering.pop(name, None)
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        while self.total_bytes > self.max_bytes and self._entries:
+            name, size = next(iter(self._entries.items()))
+            if name == keep:
+                break
+            del self._entries[name]
+            self.total_bytes -= size
+            self.stats["evictions"] += 1
+            try:
+                os.unlink(self.path_for(name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Failed to remove derivative {name}: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,263 @@
+"""
+Image upload ingestion for SafeDoser backend
+Reads uploads in fixed-size chunks into a buffer that moves to a named temp file
+past a small in-memory threshold, so worker processes can read it by path.
+Oversized files are rejected as soon as the limit is crossed and non-images from
+their magic bytes, before anything is decoded.
+Inline base64 images get the same treatment: length first, then chunked decoding.
+"""
+
+import io
+import os
+import re
+import base64
+import binascii
+import logging
+import tempfile
+from typing import Any, BinaryIO, Dict, Optional, Union
+
+from fastapi import HTTPException, UploadFile, status
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+_WHITESPACE = re.compile(r"\s+")
+
+def sniff_image_type(header: bytes) -> Optional[str]:
+    """MIME type from an image's leading bytes, or None for unsupported content"""
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return mime_type
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+class InlineImage(str):
+    """A validated base64 image string that carries its decoded bytes"""
+
+    def __new__(cls, value: str, data: bytes, mime_type: str) -> "InlineImage":
+        image = super().__new__(cls, value)
+        image.data = data
+        image.mime_type = mime_type
+        return image
+
+def decode_base64_image(value: str, max_bytes: int, chunk_chars: int = 64 * 1024) -> InlineImage:
+    """Validate a base64 image or image data URL, decoding it at most once"""
+    start = 0
+    if value.startswith("data:"):
+        comma = value.find(",", 0, 256)
+        if not value.startswith("data:image/") or comma < 0 or not value[:comma].endswith(";base64"):
+            raise ValueError("Invalid base64 image data")
+        start = comma + 1
+
+    limit = 4 * ((max_bytes + 2) // 3)
+    if len(value) - start > 2 * limit:
+        # Far beyond the limit even for line-wrapped base64; rejected without a copy
+        raise ValueError(f"Image must be at most {max_bytes // (1024 * 1024)} MB")
+    payload = value[start:]
+    # Line-wrapped (MIME style) base64 is accepted, as b64decode always did
+    if _WHITESPACE.search(payload):
+        payload = _WHITESPACE.sub("", payload)
+    # Length alone bounds the decoded size, so oversized payloads are never decoded
+    if len(payload) > limit:
+        raise ValueError(f"Image must be at most {max_bytes // (1024 * 1024)} MB")
+    if not payload or len(payload) % 4 == 1:
+        raise ValueError("Invalid base64 image data")
+    # Unpadded input is padded rather than rejected
+    payload += "=" * (-len(payload) % 4)
+
+    chunk_chars -= chunk_chars % 4
+    decoded = bytearray()
+    mime_type = None
+    for offset in range(0, len(payload), chunk_chars):
+        try:
+            chunk = base64.b64decode(payload[offset:offset + chunk_chars], validate=True)
+        except binascii.Error:
+            raise ValueError("Invalid base64 image data")
+        if mime_type is None:
+            # Checked on the first chunk, before the rest is decoded
+            mime_type = sniff_image_type(chunk[:16])
+            if mime_type is None:
+                raise ValueError("Unsupported image type")
+        decoded += chunk
+    return InlineImage(value, bytes(decoded), mime_type)
+
+# An image as handed to worker processes: its bytes, or the path of a spooled file
+ImageSource = Union[bytes, str]
+
+def read_source(source: ImageSource) -> bytes:
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read()
+    return source
+
+def discard_source(source: Optional[ImageSource]) -> None:
+    """Delete a detached upload's spool file; bytes need no cleanup"""
+    if isinstance(source, str):
+        try:
+            os.unlink(source)
+        except OSError:
+            pass
+
+class IngestedUpload:
+    """An upload held in memory or, past the spool threshold, in a named temp file"""
+
+    def __init__(self, ingestor: "UploadIngestor", buffer: BinaryIO, path: Optional[str], mime_type: str, size: int):
+        self._ingestor = ingestor
+        self.buffer = buffer
+        # Set once the upload spilled to disk; worker processes open it by path
+        self.path = path
+        self.mime_type = mime_type
+        self.size = size
+        self._detached = False
+
+    @property
+    def in_memory(self) -> bool:
+        return self.path is None
+
+    def read(self) -> bytes:
+        self.buffer.seek(0)
+        return self.buffer.read()
+
+    def source(self) -> ImageSource:
+        """What to hand a worker process: small uploads as bytes, spooled ones by path"""
+        if self.in_memory:
+            return self.buffer.getvalue()
+        self.buffer.flush()
+        return self.path
+
+    def detach(self) -> ImageSource:
+        """Source that outlives this upload; the caller deletes it with discard_source"""
+        source = self.source()
+        self._detached = True
+        return source
+
+    def close(self) -> None:
+        if not self.buffer.closed:
+            self._ingestor._release(self.size if self.in_memory else 0)
+            self.buffer.close()
+            if self.path is not None and not self._detached:
+                discard_source(self.path)
+
+    def __enter__(self) -> "IngestedUpload":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+class UploadIngestor:
+    """Bounded, single-pass reader for image uploads"""
+
+    def __init__(
+        self,
+        max_bytes: int = 20 * 1024 * 1024,
+        chunk_bytes: int = 64 * 1024,
+        spool_bytes: int = 1024 * 1024,
+    ):
+        self.max_bytes = max_bytes
+        self.chunk_bytes = chunk_bytes
+        # Uploads larger than this are buffered on disk instead of in memory
+        self.spool_bytes = spool_bytes
+        self.stats: Dict[str, int] = {
+            "uploads": 0,
+            "rejected_too_large": 0,
+            "rejected_type": 0,
+            "spooled_to_disk": 0,
+        }
+        # Upload bytes held in memory right now, across concurrent uploads
+        self.buffered_bytes = 0
+        self.peak_buffered_bytes = 0
+        self.peak_upload_bytes = 0
+
+    @classmethod
+    def from_env(cls) -> "UploadIngestor":
+        return cls(
+            max_bytes=int(os.getenv("IMAGE_UPLOAD_MAX_BYTES", str(20 * 1024 * 1024))),
+            chunk_bytes=int(os.getenv("IMAGE_UPLOAD_CHUNK_BYTES", str(64 * 1024))),
+            spool_bytes=int(os.getenv("IMAGE_UPLOAD_SPOOL_BYTES", str(1024 * 1024))),
+        )
+
+    async def ingest(self, file: UploadFile) -> IngestedUpload:
+        """Read an upload once, enforcing the size limit and image signature as it arrives"""
+        # Multipart parsing already knows the size of most uploads
+        if file.size is not None and file.size > self.max_bytes:
+            self.stats["rejected_too_large"] += 1
+            raise self._too_large()
+
+        buffer: BinaryIO = io.BytesIO()
+        path: Optional[str] = None
+        size = 0
+        held = 0
+        mime_type = None
+        try:
+            while True:
+                chunk = await file.read(self.chunk_bytes)
+                if not chunk:
+                    break
+                if mime_type is None:
+                    mime_type = sniff_image_type(chunk[:16])
+                    if mime_type is None:
+                        self.stats["rejected_type"] += 1
+                        raise HTTPException(
+                            status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Unsupported image type"
+                        )
+                size += len(chunk)
+                if size > self.max_bytes:
+                    self.stats["rejected_too_large"] += 1
+                    raise self._too_large()
+                if path is None and size > self.spool_bytes:
+                    # Spill to a named file, so worker processes can read it by path
+                    spool = tempfile.NamedTemporaryFile(prefix="upload-", delete=False)
+                    path = spool.name
+                    spool.write(buffer.getvalue())
+                    buffer = spool
+                buffer.write(chunk)
+
+                in_memory = 0 if path is not None else size
+                self._hold(in_memory - held, in_memory + len(chunk))
+                held = in_memory
+        except BaseException:
+            self._release(held)
+            buffer.close()
+            discard_source(path)
+            raise
+
+        if size == 0:
+            buffer.close()
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty image file")
+
+        self.stats["uploads"] += 1
+        if not held:
+            self.stats["spooled_to_disk"] += 1
+        buffer.seek(0)
+        return IngestedUpload(self, buffer, path, mime_type, size)
+
+    def _too_large(self) -> HTTPException:
+        return HTTPException(
+            status_code=413,
+            detail=f"Image must be at most {self.max_bytes // (1024 * 1024)} MB"
+        )
+
+    def _hold(self, delta: int, upload_peak: int) -> None:
+        self.buffered_bytes += delta
+        self.peak_buffered_bytes = max(self.peak_buffered_bytes, self.buffered_bytes)
+        self.peak_upload_bytes = max(self.peak_upload_bytes, upload_peak)
+
+    def _release(self, held: int) -> None:
+        self.buffered_bytes -= held
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "max_bytes": self.max_bytes,
+            "buffered_bytes": self.buffered_bytes,
+            "peak_buffered_bytes": self.peak_buffered_bytes,
+            "peak_upload_bytes": self.peak_upload_bytes,
+        }
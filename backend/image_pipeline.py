@@ -0,0 +1,259 @@
+"""
+Image processing pipeline for SafeDoser backend
+Runs image verification, decoding, resizing and re-encoding in a bounded process
+pool so CPU-heavy Pillow work never blocks the event loop. JPEGs are decoded at
+reduced size when they will be shrunk anyway, EXIF orientation is baked into the
+pixels, uploads get a perceptual hash for deduplication, and each job reports
+per-stage timings.
+"""
+
+import io
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from image_dedup import perceptual_hash
+from image_ingest import ImageSource
+
+logger = logging.getLogger(__name__)
+
+FORMAT_MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "GIF": "image/gif",
+    "WEBP": "image/webp",
+}
+
+EXIF_ORIENTATION = 0x0112
+
+class InvalidImage(ValueError):
+    """Raised when image data cannot be decoded"""
+
+class ImagePipelineBusy(Exception):
+    """Raised when an image job is shed instead of queued"""
+
+def _open(source: ImageSource, timings: Dict[str, float]) -> Image.Image:
+    """Verify the image, then reopen it for decoding (verify leaves the image unusable)"""
+    started = time.perf_counter()
+    try:
+        with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as probe:
+            probe.verify()
+        image = Image.open(source if isinstance(source, str) else io.BytesIO(source))
+    except Exception as e:
+        raise InvalidImage(str(e))
+    timings["verify"] = (time.perf_counter() - started) * 1000
+    return image
+
+def _decode(image: Image.Image, max_size: Tuple[int, int], timings: Dict[str, float]) -> Image.Image:
+    """Decode at the smallest JPEG scale that still covers max_size, upright"""
+    started = time.perf_counter()
+    # MPO (multi-picture JPEG from phone cameras) decodes its first frame as JPEG
+    if image.format in ("JPEG", "MPO"):
+        image.draft("RGB", max_size)
+    image.load()
+    timings["decode"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    image = ImageOps.exif_transpose(image)
+    timings["orient"] = (time.perf_counter() - started) * 1000
+    return image
+
+def _resize(image: Image.Image, max_size: Tuple[int, int], timings: Dict[str, float]) -> None:
+    started = time.perf_counter()
+    if image.size[0] > max_size[0] or image.size[1] > max_size[1]:
+        image.thumbnail(max_size, Image.Resampling.LANCZOS)
+    timings["resize"] = (time.perf_counter() - started) * 1000
+
+def _encode(image: Image.Image, format: str, timings: Dict[str, float], **options: Any) -> bytes:
+    started = time.perf_counter()
+    output = io.BytesIO()
+    image.save(output, format=format, **options)
+    timings["encode"] = (time.perf_counter() - started) * 1000
+    return output.getvalue()
+
+def _hash(image: Image.Image, timings: Dict[str, float]) -> int:
+    started = time.perf_counter()
+    phash = perceptual_hash(image)
+    timings["hash"] = (time.perf_counter() - started) * 1000
+    return phash
+
+def prepare_upload(source: ImageSource, resize_over_bytes: int, max_size: Tuple[int, int], quality: int) -> Dict[str, Any]:
+    """Worker: verify an upload, shrinking large ones and fixing EXIF rotation, and hash its pixels
+
+    source is the upload's bytes or the path of its spooled file. The content is
+    None when the upload is stored as-is, so unchanged bytes never travel back.
+    """
+    started = time.time()
+    timings: Dict[str, float] = {}
+    size = os.path.getsize(source) if isinstance(source, str) else len(source)
+    image = _open(source, timings)
+    format = image.format or "JPEG"
+    rotated = image.getexif().get(EXIF_ORIENTATION, 1) != 1
+
+    content = None
+    if size > resize_over_bytes or rotated:
+        image = _decode(image, max_size if size > resize_over_bytes else image.size, timings)
+        if size > resize_over_bytes:
+            _resize(image, max_size, timings)
+        content = _encode(image, format, timings, quality=quality)
+    else:
+        # The upload is kept as-is; a tiny decode is enough for the hash
+        image = _decode(image, (64, 64), timings)
+
+    return {
+        "content": content,
+        "mime_type": FORMAT_MIME_TYPES.get(format, "image/jpeg"),
+        "phash": _hash(image, timings),
+        "started": started,
+        "timings": timings,
+    }
+
+def compress(data: bytes, max_size: Tuple[int, int], quality: int) -> Dict[str, Any]:
+    """Worker: upright, bounded, flattened JPEG"""
+    started = time.time()
+    timings: Dict[str, float] = {}
+    image = _decode(_open(data, timings), max_size, timings)
+
+    # Convert to RGB if necessary
+    if image.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    _resize(image, max_size, timings)
+    return {
+        "content": _encode(image, "JPEG", timings, quality=quality, optimize=True),
+        "mime_type": "image/jpeg",
+        "started": started,
+        "timings": timings,
+    }
+
+def render_derivative(source_path: str, dest_path: str, size: int, format: str, quality: int) -> Dict[str, Any]:
+    """Worker: write a downscaled copy of a stored image, atomically"""
+    started = time.time()
+    timings: Dict[str, float] = {}
+    with open(source_path, "rb") as f:
+        data = f.read()
+    image = _decode(_open(data, timings), (size, size), timings)
+
+    if format == "JPEG" and image.mode != "RGB":
+        if image.mode == "P":
+            image = image.convert("RGBA")
+        if image.mode in ("RGBA", "LA"):
+            # JPEG has no alpha; flatten onto white like compress()
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        else:
+            image = image.convert("RGB")
+    elif format == "WEBP" and image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+
+    _resize(image, (size, size), timings)
+    content = _encode(image, format, timings, quality=quality)
+
+    temp_path = f"{dest_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(content)
+    os.replace(temp_path, dest_path)
+    return {"bytes": len(content), "started": started, "timings": timings}
+
+class ImagePipeline:
+    """Bounded process pool for image jobs, shedding load once its queue is full"""
+
+    def __init__(self, workers: int = 2, max_pending: int = 8):
+        self.workers = workers
+        # Jobs running or waiting for a worker; beyond this uploads are refused
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.stats: Dict[str, int] = {"completed": 0, "failed": 0, "shed": 0, "pool_restarts": 0}
+        # Stage name -> [total milliseconds, count]
+        self._timings: Dict[str, list] = {}
+
+    @classmethod
+    def from_env(cls) -> "ImagePipeline":
+        return cls(
+            workers=int(os.getenv("IMAGE_PIPELINE_WORKERS", "2")),
+            max_pending=int(os.getenv("IMAGE_PIPELINE_MAX_PENDING", "8")),
+        )
+
+    async def prepare_upload(
+        self,
+        source: ImageSource,
+        resize_over_bytes: int = 5 * 1024 * 1024,
+        max_size: Tuple[int, int] = (800, 800),
+        quality: int = 85,
+    ) -> Dict[str, Any]:
+        """Verified upload's MIME type and hash, plus new bytes when it was resized or rotated"""
+        return await self._run(prepare_upload, source, resize_over_bytes, max_size, quality)
+
+    async def compress(self, data: bytes, max_size: Tuple[int, int] = (800, 800), quality: int = 85) -> Dict[str, Any]:
+        return await self._run(compress, data, max_size, quality)
+
+    async def render_derivative(self, source_path: str, dest_path: str, size: int, format: str, quality: int = 80) -> Dict[str, Any]:
+        return await self._run(render_derivative, source_path, dest_path, size, format, quality)
+
+    async def _run(self, job, *args: Any) -> Dict[str, Any]:
+        if self.pending >= self.max_pending:
+            self.stats["shed"] += 1
+            raise ImagePipelineBusy(f"Image pipeline is full ({self.pending} jobs pending)")
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        executor = self._executor
+        submitted = time.time()
+        self.pending += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(executor, job, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed on a decompression bomb) and took the
+            # pool with it. Not retried, as the same input may kill the next pool.
+            self.stats["failed"] += 1
+            self._restart(executor)
+            raise ImagePipelineBusy("Image worker exited unexpectedly; the pool was restarted")
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            self.pending -= 1
+
+        result["timings"]["queue"] = max(0.0, result.pop("started") - submitted) * 1000
+        for stage, ms in result["timings"].items():
+            total = self._timings.setdefault(stage, [0.0, 0])
+            total[0] += ms
+            total[1] += 1
+        self.stats["completed"] += 1
+        return result
+
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        """Drop a broken pool once; the next job starts a fresh one"""
+        if self._executor is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self.stats["pool_restarts"] += 1
+            logger.error("Image worker process died; restarting the image pipeline pool")
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "pending": self.pending,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "avg_stage_ms": {stage: round(total / count, 2) for stage, (total, count) in self._timings.items()},
+        }
@@ -0,0 +1,155 @@
+"""
+Interaction checking for SafeDoser backend
+Loads the interaction dataset once into an adjacency structure of integer bitsets
+over normalized ingredient ids, so a whole regimen is checked in one pass:
+OR the regimen's ingredient bits into a mask, then AND it with each row.
+"""
+
+import os
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Tuple
+
+from knowledge_base import AliasMatcher, normalize_name
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERACTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "interactions.json")
+
+SEVERITY_ORDER = {"major": 0, "moderate": 1, "minor": 2}
+
+class InteractionIndex:
+    """Ingredient interaction graph as one bitset row per ingredient"""
+
+    def __init__(
+        self,
+        ingredients: List[Dict[str, Any]],
+        interactions: List[Dict[str, Any]],
+        max_cached_names: int = 50000,
+    ):
+        self.ids: List[str] = []
+        self.names: List[str] = []
+        self._position: Dict[str, int] = {}
+        self._matcher = AliasMatcher()
+        for ingredient in ingredients:
+            ingredient_id = ingredient.get("id")
+            if not ingredient_id or ingredient_id in self._position:
+                continue
+            self._position[ingredient_id] = len(self.ids)
+            self.ids.append(ingredient_id)
+            self.names.append(ingredient.get("name") or ingredient_id)
+            for alias in [ingredient_id.replace("_", " "), ingredient.get("name", ""), *ingredient.get("aliases", [])]:
+                self._matcher.add(alias, ingredient_id)
+
+        # adjacency[i] has bit j set when ingredients i and j interact
+        self.adjacency: List[int] = [0] * len(self.ids)
+        self._details: Dict[Tuple[int, int], Tuple[str, str]] = {}
+        for interaction in interactions:
+            a = self._position.get(interaction.get("a"))
+            b = self._position.get(interaction.get("b"))
+            if a is None or b is None or a == b:
+                logger.warning(f"Skipping interaction with unknown ingredients: {interaction!r}")
+                continue
+            self.adjacency[a] |= 1 << b
+            self.adjacency[b] |= 1 << a
+            self._details[(min(a, b), max(a, b))] = (
+                interaction.get("severity", "moderate"),
+                interaction.get("message", ""),
+            )
+
+        # Normalized supplement name -> ingredient bitmask, shared across users for bulk re-checks
+        self.max_cached_names = max_cached_names
+        self._name_masks: "OrderedDict[str, int]" = OrderedDict()
+
+    @classmethod
+    def load(cls, path: str) -> "InteractionIndex":
+        """Load an interaction dataset; an unreadable file gives an empty index"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            index = cls(data.get("ingredients", []), data.get("interactions", []))
+            logger.info(f"Loaded {len(index.ids)} ingredients and {len(index._details)} interactions from {path}")
+            return index
+        except Exception as e:
+            logger.error(f"Failed to load interaction dataset {path}: {str(e)}")
+            return cls([], [])
+
+    @classmethod
+    def from_env(cls) -> "InteractionIndex":
+        return cls.load(os.getenv("INTERACTIONS_PATH", DEFAULT_INTERACTIONS_PATH))
+
+    def ingredient_mask(self, name: str) -> int:
+        """Bitmask of the known ingredients named in a supplement name"""
+        key = normalize_name(name)
+        mask = self._name_masks.get(key)
+        if mask is not None:
+            self._name_masks.move_to_end(key)
+            return mask
+
+        mask = 0
+        for ingredient_id in self._matcher.find(key):
+            mask |= 1 << self._position[ingredient_id]
+        self._name_masks[key] = mask
+        while len(self._name_masks) > self.max_cached_names:
+            self._name_masks.popitem(last=False)
+        return mask
+
+    def check(self, supplements: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Every interacting pair of supplements in a regimen, worst first"""
+        masks = [self.ingredient_mask(supp.get("name") or "") for supp in supplements]
+        regimen = 0
+        # ingredient position -> indexes of the supplements containing it
+        holders: Dict[int, List[int]] = {}
+        for item, mask in enumerate(masks):
+            regimen |= mask
+            for position in _bits(mask):
+                holders.setdefault(position, []).append(item)
+
+        found: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        for a in holders:
+            # Only partners that are present, and each pair once
+            for b in _bits(self.adjacency[a] & regimen & ~((1 << (a + 1)) - 1)):
+                severity, message = self._details[(a, b)]
+                for first in holders[a]:
+                    for second in holders[b]:
+                        if first == second:
+                            continue
+                        pair = (min(first, second), max(first, second))
+                        entry = found.setdefault(pair, {"supplements": pair, "matches": []})
+                        entry["matches"].append((severity, self.ids[a], self.ids[b], message))
+
+        results = []
+        for (first, second), entry in found.items():
+            matches = sorted(entry["matches"], key=lambda m: SEVERITY_ORDER.get(m[0], len(SEVERITY_ORDER)))
+            results.append({
+                "supplements": [supplements[first], supplements[second]],
+                "severity": matches[0][0],
+                "ingredients": sorted({ingredient for m in matches for ingredient in m[1:3]}),
+                "messages": [m[3] for m in matches],
+            })
+        results.sort(key=lambda r: SEVERITY_ORDER.get(r["severity"], len(SEVERITY_ORDER)))
+
+        return {
+            "interactions": results,
+            "unrecognized": [supp.get("name") for supp, mask in zip(supplements, masks) if not mask],
+        }
+
+    def check_many(self, regimens: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+        """Bulk re-check, e.g. for every user after the dataset changes"""
+        return {user_id: self.check(supplements) for user_id, supplements in regimens.items()}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "ingredients": len(self.ids),
+            "interactions": len(self._details),
+            "aliases": len(self._matcher),
+            "cached_names": len(self._name_masks),
+        }
+
+def _bits(mask: int) -> Iterable[int]:
+    """Positions of the set bits in a mask, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
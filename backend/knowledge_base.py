@@ -0,0 +1,180 @@
+"""
+Supplement knowledge base for SafeDoser AI assistant
+Loads supplement facts (summary, timing, interactions, benefits) from a JSON file,
+indexes them by normalized name and alias with typo-tolerant matching, and answers
+simple factual questions directly so the model is only called when needed.
+"""
+
+import os
+import re
+import json
+import logging
+from difflib import get_close_matches
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_base.json")
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+# Question kinds the knowledge base can answer, keyed to the entry field holding the answer
+QUESTION_KINDS: Tuple[Tuple[str, "re.Pattern[str]"], ...] = (
+    ("timing", re.compile(
+        r"\b(when|what time|timing|morning|evening|night|bedtime|before bed|with food|"
+        r"with (a )?meals?|empty stomach)\b"
+    )),
+    ("interactions", re.compile(r"\b(interact\w*|combin\w*|together|mix\w*)\b")),
+    ("benefits", re.compile(r"\b(benefits?|good for|help with|helps?|what does .+ do|why take)\b")),
+)
+
+# "What is X?" style questions, answered with the entry summary when nothing more specific is asked
+_SUMMARY_QUESTION = re.compile(r"^(what is|what s|what are|tell me about|info on|information on)\b")
+
+# Questions that need personal judgement or the conversation, never answered from the KB
+_NEEDS_GENERATION = re.compile(
+    r"\b(pregnan\w*|breastfeed\w*|nursing|child\w*|kids?|baby|babies|dose|dosage|doses|how much|"
+    r"mg|mcg|iu|overdose|too much|side effects?|symptoms?|pain|allerg\w*|prescri\w*|doctor|"
+    r"you said|you mentioned|earlier|instead)\b"
+)
+
+MAX_INSTANT_WORDS = 20
+FUZZY_MIN_LENGTH = 6
+FUZZY_CUTOFF = 0.85
+
+TEMPLATES = {
+    "summary": "{summary} 💊",
+    "timing": "{name} timing: {timing} ⏰",
+    "interactions": "{name} interactions: {interactions} For prescription drug interactions, always check with your pharmacist. 🔍",
+    "benefits": "{name} is commonly taken for: {benefits} It works best as part of a balanced diet and healthy lifestyle. 🌟",
+}
+
+def normalize_name(text: str) -> str:
+    """Lowercase and reduce to space-separated alphanumeric words"""
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+class AliasMatcher:
+    """Maps normalized text to the keys of the aliases it names, longest alias first"""
+
+    def __init__(self) -> None:
+        self._aliases: Dict[str, str] = {}
+        # First two letters -> single-word aliases, to keep fuzzy matching cheap
+        self._fuzzy_candidates: Dict[str, List[str]] = {}
+        self._fuzzy_memo: Dict[str, Optional[str]] = {}
+        self.max_alias_words = 1
+
+    def __len__(self) -> int:
+        return len(self._aliases)
+
+    def add(self, alias: str, key: str) -> None:
+        alias = normalize_name(alias)
+        if not alias or alias in self._aliases:
+            return
+        self._aliases[alias] = key
+        words = alias.split(" ")
+        self.max_alias_words = max(self.max_alias_words, len(words))
+        if len(words) == 1 and len(alias) >= FUZZY_MIN_LENGTH:
+            self._fuzzy_candidates.setdefault(alias[:2], []).append(alias)
+
+    def find(self, normalized_text: str) -> List[str]:
+        """Keys of the distinct aliases named in normalized text, in order of appearance"""
+        words = normalized_text.split(" ") if normalized_text else []
+        found: List[str] = []
+        i = 0
+        while i < len(words):
+            matched = 0
+            for size in range(min(self.max_alias_words, len(words) - i), 0, -1):
+                key = self._aliases.get(" ".join(words[i:i + size]))
+                if key is None and size == 1:
+                    key = self._fuzzy_key(words[i])
+                if key is not None:
+                    if key not in found:
+                        found.append(key)
+                    matched = size
+                    break
+            i += matched or 1
+        return found
+
+    def _fuzzy_key(self, word: str) -> Optional[str]:
+        """Key for a misspelt single-word alias, e.g. "magnesum" """
+        if len(word) < FUZZY_MIN_LENGTH:
+            return None
+        if word in self._fuzzy_memo:
+            return self._fuzzy_memo[word]
+
+        candidates = self._fuzzy_candidates.get(word[:2], [])
+        close = get_close_matches(word, candidates, n=1, cutoff=FUZZY_CUTOFF) if candidates else []
+        key = self._aliases[close[0]] if close else None
+        if len(self._fuzzy_memo) < 10000:
+            self._fuzzy_memo[word] = key
+        return key
+
+class KnowledgeBase:
+    """Supplement facts indexed by normalized name and alias"""
+
+    def __init__(self, entries: List[Dict[str, Any]]):
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._matcher = AliasMatcher()
+        self.stats: Dict[str, int] = {"instant_answers": 0, "declined": 0}
+
+        for entry in entries:
+            key = entry.get("key")
+            if not key or not entry.get("name"):
+                logger.warning(f"Skipping knowledge base entry without key or name: {entry!r}")
+                continue
+            self.entries[key] = entry
+            for alias in [entry["name"], *entry.get("aliases", [])]:
+                self._matcher.add(alias, key)
+
+    @classmethod
+    def load(cls, path: str) -> "KnowledgeBase":
+        """Load a knowledge base file; an unreadable file gives an empty knowledge base"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            kb = cls(data.get("supplements", []))
+            logger.info(f"Loaded {len(kb.entries)} supplements from knowledge base {path}")
+            return kb
+        except Exception as e:
+            logger.error(f"Failed to load knowledge base {path}: {str(e)}")
+            return cls([])
+
+    @classmethod
+    def from_env(cls) -> "KnowledgeBase":
+        return cls.load(os.getenv("SUPPLEMENT_KB_PATH", DEFAULT_KB_PATH))
+
+    def lookup(self, name: str) -> Optional[Dict[str, Any]]:
+        """Entry for a supplement name such as "Vitamin D3 2000 IU", or None if unknown or ambiguous"""
+        keys = self.find_mentions(normalize_name(name))
+        return self.entries[keys[0]] if len(keys) == 1 else None
+
+    def find_mentions(self, normalized_text: str) -> List[str]:
+        """Keys of the distinct entries named in normalized text, longest alias first"""
+        return self._matcher.find(normalized_text)
+
+    def answer(self, user_message: str) -> Optional[str]:
+        """Direct answer to a simple factual question about one supplement, else None"""
+        text = normalize_name(user_message)
+        if not text or len(text.split(" ")) > MAX_INSTANT_WORDS or _NEEDS_GENERATION.search(text):
+            return None
+
+        # Exactly one supplement and one kind of question, or the model handles it
+        mentions = self.find_mentions(text)
+        kinds = [kind for kind, pattern in QUESTION_KINDS if pattern.search(text)]
+        if not kinds and _SUMMARY_QUESTION.search(text):
+            kinds = ["summary"]
+        if len(mentions) != 1 or len(kinds) != 1:
+            self.stats["declined"] += 1
+            return None
+
+        kind = kinds[0]
+        entry = self.entries[mentions[0]]
+        if not entry.get(kind):
+            self.stats["declined"] += 1
+            return None
+
+        self.stats["instant_answers"] += 1
+        return TEMPLATES[kind].format(name=entry["name"], **{kind: entry[kind]})
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"entries": len(self.entries), "aliases": len(self._matcher), **self.stats}
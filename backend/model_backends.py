@@ -0,0 +1,363 @@
+"""
+Model backends for SafeDoser AI assistant
+AIService talks to the language model through a small backend interface: the
+Gemini backend for production, and a deterministic local stand-in with
+configurable latency, streaming and error rates for load tests and development.
+The static system instruction is sent separately from the per-request prompt so
+Gemini can cache it, explicitly through a context cache once it is large enough.
+"""
+
+import os
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, Optional
+
+from google import genai
+from google.genai import errors, types
+
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL = "gemini-2.5-flash"
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal")
+
+LOCAL_REPLIES = (
+    "Take it consistently at the same time each day, ideally with a meal. Check with your pharmacist if you also take prescription medication.",
+    "Most supplements are best absorbed with food. If you notice stomach upset, try taking it with a larger meal or at a different time of day.",
+    "Spacing supplements that compete for absorption a couple of hours apart helps. Your healthcare provider can confirm what suits your regimen.",
+    "That combination is generally well tolerated, but individual needs vary. Talk to your healthcare provider before changing your routine.",
+)
+
+class ModelError(Exception):
+    """Raised by a backend when the model call fails"""
+
+class ModelBackend(ABC):
+    """Interface AIService uses to generate text"""
+
+    name = "base"
+
+    @abstractmethod
+    async def generate(
+        self,
+        prompt: str,
+        max_output_tokens: Optional[int] = None,
+        system_instruction: Optional[str] = None,
+    ) -> Optional[str]:
+        """Full reply text for a prompt"""
+
+    @abstractmethod
+    def stream(
+        self,
+        prompt: str,
+        max_output_tokens: Optional[int] = None,
+        system_instruction: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """Reply text chunks as they are generated"""
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"name": self.name}
+
+class GeminiContextCache:
+    """Explicit Gemini context cache for the system instruction, created and kept alive in the background"""
+
+    def __init__(
+        self,
+        client: genai.Client,
+        model: str,
+        ttl_seconds: int = 3600,
+        refresh_margin_seconds: int = 300,
+        retry_seconds: int = 600,
+        min_tokens: int = 1024,
+    ):
+        self.client = client
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.retry_seconds = retry_seconds
+        # Gemini rejects caches below a model-specific size; smaller instructions are sent inline
+        self.min_tokens = min_tokens
+        # (system instruction, cache name, monotonic expiry)
+        self._entry: Optional[tuple] = None
+        self._task: Optional[asyncio.Task] = None
+        self._retry_at = 0.0
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "inline": 0, "created": 0, "refreshed": 0, "failures": 0}
+
+    @classmethod
+    def from_env(cls, client: genai.Client, model: str) -> "GeminiContextCache":
+        return cls(
+            client,
+            model,
+            ttl_seconds=int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600")),
+            refresh_margin_seconds=int(os.getenv("GEMINI_CONTEXT_CACHE_REFRESH_SECONDS", "300")),
+            retry_seconds=int(os.getenv("GEMINI_CONTEXT_CACHE_RETRY_SECONDS", "600")),
+            min_tokens=int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "1024")),
+        )
+
+    def lookup(self, system_instruction: str) -> Optional[str]:
+        """Cache name to use for this instruction, or None to send it inline"""
+        if len(system_instruction) // 4 < self.min_tokens:
+            self.stats["inline"] += 1
+            return None
+
+        now = time.monotonic()
+        entry = self._entry
+        if entry and entry[0] == system_instruction and now < entry[2]:
+            if entry[2] - now < self.refresh_margin_seconds:
+                self._spawn(self._refresh(entry))
+            self.stats["hits"] += 1
+            return entry[1]
+
+        # Never block a request on cache creation; this one goes inline
+        self.stats["misses"] += 1
+        self._spawn(self._create(system_instruction))
+        return None
+
+    def invalidate(self, name: str) -> None:
+        """Stop using a cache the API no longer accepts"""
+        if self._entry and self._entry[1] == name:
+            logger.warning(f"Dropping Gemini context cache {name}")
+            self._entry = None
+
+    def _spawn(self, coro) -> None:
+        if (self._task and not self._task.done()) or time.monotonic() < self._retry_at:
+            coro.close()
+            return
+        self._task = asyncio.ensure_future(coro)
+
+    async def _create(self, system_instruction: str) -> None:
+        try:
+            cached = await self.client.aio.caches.create(
+                model=self.model,
+                config=types.CreateCachedContentConfig(
+                    display_name="safedoser-system-instruction",
+                    system_instruction=system_instruction,
+                    ttl=f"{self.ttl_seconds}s",
+                ),
+            )
+            self._entry = (system_instruction, cached.name, time.monotonic() + self.ttl_seconds)
+            self.stats["created"] += 1
+            logger.info(f"Created Gemini context cache {cached.name}")
+        except Exception as e:
+            self._failed("create", e)
+
+    async def _refresh(self, entry: tuple) -> None:
+        system_instruction, name, _ = entry
+        try:
+            await self.client.aio.caches.update(
+                name=name,
+                config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s"),
+            )
+            if self._entry and self._entry[1] == name:
+                self._entry = (system_instruction, name, time.monotonic() + self.ttl_seconds)
+            self.stats["refreshed"] += 1
+        except Exception as e:
+            self._failed("refresh", e)
+
+    def _failed(self, action: str, error: Exception) -> None:
+        self.stats["failures"] += 1
+        self._retry_at = time.monotonic() + self.retry_seconds
+        logger.warning(f"Failed to {action} Gemini context cache, sending the system instruction inline: {str(error)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        entry = self._entry
+        return {
+            **self.stats,
+            "active": entry[1] if entry and time.monotonic() < entry[2] else None,
+        }
+
+class GeminiBackend(ModelBackend):
+    """Google Gemini through the native async client"""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str, model: str = GEMINI_MODEL):
+        self.client = genai.Client(api_key=api_key)
+        self.model = model
+        self.context_cache = (
+            GeminiContextCache.from_env(self.client, model)
+            if os.getenv("GEMINI_CONTEXT_CACHE_ENABLED", "true").lower() == "true"
+            else None
+        )
+
+    def _cached_content(self, system_instruction: Optional[str]) -> Optional[str]:
+        if not system_instruction or self.context_cache is None:
+            return None
+        return self.context_cache.lookup(system_instruction)
+
+    def _config(
+        self,
+        max_output_tokens: Optional[int] = None,
+        system_instruction: Optional[str] = None,
+        cached_content: Optional[str] = None,
+    ) -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(
+            thinking_config=types.ThinkingConfig(thinking_budget=0),
+            max_output_tokens=max_output_tokens,
+            # A stable leading instruction also benefits from Gemini's implicit prefix caching
+            system_instruction=None if cached_content else system_instruction,
+            cached_content=cached_content,
+        )
+
+    def _cache_rejected(self, cached_content: Optional[str], error: Exception) -> None:
+        """Stop using a cache that expired or was deleted behind our back"""
+        if cached_content and isinstance(error, errors.ClientError) and error.code in (400, 403, 404):
+            self.context_cache.invalidate(cached_content)
+
+    async def generate(
+        self,
+        prompt: str,
+        max_output_tokens: Optional[int] = None,
+        system_instruction: Optional[str] = None,
+    ) -> Optional[str]:
+        cached_content = self._cached_content(system_instruction)
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=self.model,
+                contents=prompt,
+                config=self._config(max_output_tokens, system_instruction, cached_content),
+            )
+        except Exception as e:
+            self._cache_rejected(cached_content, e)
+            raise
+        return response.text
+
+    async def stream(
+        self,
+        prompt: str,
+        max_output_tokens: Optional[int] = None,
+        system_instruction: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        cached_content = self._cached_content(system_instruction)
+        try:
+            stream = await self.client.aio.models.generate_content_stream(
+                model=self.model,
+                contents=prompt,
+                config=self._config(max_output_tokens, system_instruction, cached_content),
+            )
+        except Exception as e:
+            self._cache_rejected(cached_content, e)
+            raise
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "model": self.model,
+            "context_cache": self.context_cache.get_stats() if self.context_cache else {"enabled": False},
+        }
+
+class LocalModelBackend(ModelBackend):
+    """Deterministic stand-in for load tests: simulated latency, streaming and failures"""
+
+    name = "local"
+
+    def __init__(
+        self,
+        latency_ms: float = 800.0,
+        distribution: str = "lognormal",
+        spread: float = 0.5,
+        chunk_delay_ms: float = 30.0,
+        words_per_chunk: int = 4,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution {distribution!r}, expected one of {LATENCY_DISTRIBUTIONS}")
+        self.latency_ms = latency_ms
+        self.distribution = distribution
+        self.spread = spread
+        self.chunk_delay_ms = chunk_delay_ms
+        self.words_per_chunk = words_per_chunk
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls) -> "LocalModelBackend":
+        return cls(
+            latency_ms=float(os.getenv("LOCAL_MODEL_LATENCY_MS", "800")),
+            distribution=os.getenv("LOCAL_MODEL_LATENCY_DIST", "lognormal"),
+            spread=float(os.getenv("LOCAL_MODEL_LATENCY_SPREAD", "0.5")),
+            chunk_delay_ms=float(os.getenv("LOCAL_MODEL_CHUNK_DELAY_MS", "30")),
+            error_rate=float(os.getenv("LOCAL_MODEL_ERROR_RATE", "0")),
+            seed=int(os.getenv("LOCAL_MODEL_SEED", "0")),
+        )
+
+    def sample_latency(self) -> float:
+        """Seconds until the first token for one call"""
+        mean = self.latency_ms / 1000
+        if self.distribution == "fixed":
+            latency = mean
+        elif self.distribution == "uniform":
+            latency = self._rng.uniform(mean * (1 - self.spread), mean * (1 + self.spread))
+        elif self.distribution == "normal":
+            latency = self._rng.gauss(mean, mean * self.spread)
+        else:
+            # Median at `mean`, with the long right tail real providers show
+            latency = self._rng.lognormvariate(0, self.spread) * mean
+        return max(0.0, latency)
+
+    def reply_for(self, prompt: str) -> str:
+        """Same prompt, same reply"""
+        digest = hashlib.sha256(prompt.encode()).digest()
+        return LOCAL_REPLIES[digest[0] % len(LOCAL_REPLIES)]
+
+    async def _start_call(self) -> None:
+        self.calls += 1
+        await asyncio.sleep(self.sample_latency())
+        if self.error_rate and self._rng.random() < self.error_rate:
+            raise ModelError("Simulated model failure")
+
+    async def generate(
+        self,
+        prompt: str,
+        max_output_tokens: Optional[int] = None,
+        system_instruction: Optional[str] = None,
+    ) -> Optional[str]:
+        await self._start_call()
+        words = len(self.reply_for(prompt).split(" "))
+        # A blocking call returns once the whole reply has been "generated"
+        await asyncio.sleep(self.chunk_delay_ms / 1000 * max(0, words // self.words_per_chunk))
+        return self.reply_for(prompt)
+
+    async def stream(
+        self,
+        prompt: str,
+        max_output_tokens: Optional[int] = None,
+        system_instruction: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        await self._start_call()
+        words = self.reply_for(prompt).split(" ")
+        for i in range(0, len(words), self.words_per_chunk):
+            if i:
+                await asyncio.sleep(self.chunk_delay_ms / 1000)
+            last = i + self.words_per_chunk >= len(words)
+            yield " ".join(words[i:i + self.words_per_chunk]) + ("" if last else " ")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "calls": self.calls}
+
+def backend_from_env() -> Optional[ModelBackend]:
+    """Backend selected by MODEL_BACKEND ("gemini" or "local"), or None for fallback-only mode"""
+    choice = os.getenv("MODEL_BACKEND", "gemini").lower()
+    if choice == "local":
+        logger.info("Using local model backend")
+        return LocalModelBackend.from_env()
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        logger.warning("No GEMINI_API_KEY provided — using fallback responses")
+        return None
+    try:
+        backend = GeminiBackend(api_key)
+        logger.info("Gemini client initialized successfully")
+        return backend
+    except Exception as e:
+        logger.error(f"Failed to initialize Gemini client: {e}")
+        return None
@@ -0,0 +1,124 @@
+"""
+Concurrency governor for SafeDoser model calls
+Bounds in-flight Gemini requests globally and per user, queues the rest with a
+deadline, and sheds load once the queue is over budget.
+"""
+
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class ModelOverloaded(Exception):
+    """Raised when a model call is shed instead of queued"""
+
+class ModelGovernor:
+    """Global and per-user semaphores with a bounded, deadline-limited wait queue"""
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        max_per_user: int = 2,
+        max_queue: int = 32,
+        queue_timeout: float = 10.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._global = asyncio.Semaphore(max_concurrency)
+        # user_id -> [semaphore, number of callers holding or waiting on it]
+        self._per_user: Dict[str, List[Any]] = {}
+
+        self.waiting = 0
+        self.in_flight = 0
+        self.stats: Dict[str, int] = {
+            "admitted": 0,
+            "shed_queue_full": 0,
+            "shed_timeout": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "ModelGovernor":
+        return cls(
+            max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")),
+            max_per_user=int(os.getenv("GEMINI_MAX_CONCURRENCY_PER_USER", "2")),
+            max_queue=int(os.getenv("GEMINI_MAX_QUEUE", "32")),
+            queue_timeout=float(os.getenv("GEMINI_QUEUE_TIMEOUT_SECONDS", "10")),
+        )
+
+    @asynccontextmanager
+    async def slot(self, user_id: Optional[str] = None):
+        """Hold a model slot for the duration of the block, or raise ModelOverloaded"""
+        user_entry = self._checkout_user(user_id)
+        would_wait = self._global.locked() or (user_entry is not None and user_entry[0].locked())
+        if would_wait and self.waiting >= self.max_queue:
+            self._checkin_user(user_id, user_entry)
+            self.stats["shed_queue_full"] += 1
+            raise ModelOverloaded(f"Model queue is full ({self.waiting} waiting)")
+
+        holds_user = holds_global = False
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+
+        if would_wait:
+            self.waiting += 1
+        try:
+            if user_entry is not None:
+                await asyncio.wait_for(user_entry[0].acquire(), self.queue_timeout)
+                holds_user = True
+            await asyncio.wait_for(self._global.acquire(), max(0.0, deadline - loop.time()))
+            holds_global = True
+        except asyncio.TimeoutError:
+            self.stats["shed_timeout"] += 1
+            raise ModelOverloaded(f"Timed out after {self.queue_timeout}s waiting for a model slot")
+        finally:
+            if would_wait:
+                self.waiting -= 1
+            if not holds_global:
+                if holds_user:
+                    user_entry[0].release()
+                self._checkin_user(user_id, user_entry)
+
+        self.in_flight += 1
+        self.stats["admitted"] += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._global.release()
+            if user_entry is not None:
+                user_entry[0].release()
+            self._checkin_user(user_id, user_entry)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_per_user": self.max_per_user,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+        }
+
+    def _checkout_user(self, user_id: Optional[str]) -> Optional[List[Any]]:
+        if not user_id or self.max_per_user <= 0:
+            return None
+        entry = self._per_user.get(user_id)
+        if entry is None:
+            entry = self._per_user[user_id] = [asyncio.Semaphore(self.max_per_user), 0]
+        entry[1] += 1
+        return entry
+
+    def _checkin_user(self, user_id: Optional[str], entry: Optional[List[Any]]) -> None:
+        if entry is None:
+            return
+        entry[1] -= 1
+        # Drop idle users so the map only holds active callers
+        if entry[1] == 0 and self._per_user.get(user_id) is entry:
+            del self._per_user[user_id]
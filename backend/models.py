@@ -1,8 +1,14 @@
+import os
 from datetime import datetime, date
 from typing import Optional, List, Dict, Any
+from enum import Enum
 from pydantic import BaseModel, EmailStr, Field, field_validator
 import re
-import base64
+
+from image_ingest import decode_base64_image
+
+# Largest decoded inline image (e.g. an avatar) accepted in a JSON body
+INLINE_IMAGE_MAX_BYTES = int(os.getenv("INLINE_IMAGE_MAX_BYTES", str(5 * 1024 * 1024)))
 
 # Base models
 class TimestampMixin(BaseModel):
@@ -18,24 +24,10 @@ class UserBase(BaseModel):
     age: int = Field(..., ge=13, le=120)
 
 def validate_base64_image(v: Optional[str]) -> Optional[str]:
-    """Validate base64 encoded image"""
+    """Validate base64 encoded image (data URL or raw base64), keeping the decoded bytes"""
     if v is None:
         return v
-    # Check if it's a data URL
-    if v.startswith("data:image/"):
-        try:
-            header, data = v.split(",", 1)
-            base64.b64decode(data)
-            return v
-        except Exception:
-            raise ValueError("Invalid base64 image data")
-    else:
-        # Assume raw base64
-        try:
-            base64.b64decode(v)
-            return v
-        except Exception:
-            raise ValueError("Invalid base64 image data")
+    return decode_base64_image(v, INLINE_IMAGE_MAX_BYTES)
 
 class UserCreate(UserBase):
     """User creation model"""
@@ -150,10 +142,38 @@ class SupplementResponse(BaseModel):
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
+# Interaction models
+class SupplementAlert(BaseModel):
+    """Supplement alert, same shape as SupplementAlert in the frontend schema (json.py)"""
+    message: str
+    type: str
+
+    @field_validator("type")
+    @classmethod
+    def validate_type(cls, v: str) -> str:
+        if v not in ["interaction", "recall"]:
+            raise ValueError("type must be 'interaction' or 'recall'")
+        return v
+
+class SupplementInteraction(BaseModel):
+    """An interacting pair of supplements in a regimen"""
+    supplement_ids: List[int]
+    supplement_names: List[str]
+    ingredients: List[str]
+    severity: str  # 'major', 'moderate' or 'minor'
+    alert: SupplementAlert
+
+class InteractionCheckResponse(BaseModel):
+    """Interaction check response model"""
+    interactions: List[SupplementInteraction]
+    alerts: Dict[int, List[SupplementAlert]]  # supplement id -> its alerts
+    unrecognized: List[str]
+
 # Chat models
 class ChatMessage(BaseModel):
     """Chat message model"""
     message: str = Field(..., min_length=1, max_length=2000)
+    bypass_cache: bool = False  # Skip the shared response cache for personalised follow-ups
 
 class ChatMessageInDB(BaseModel):
     """Chat message as stored in database"""
@@ -179,6 +199,8 @@ class SupplementLogBase(BaseModel):
     scheduled_time: str  # Time in HH:MM format
     status: str = Field(default="pending", pattern="^(pending|taken|missed|skipped)$")
     notes: Optional[str] = None
+    # Day the dose belongs to; defaults to the client's today
+    log_date: Optional[date] = None
 
     @field_validator("scheduled_time")
     @classmethod
@@ -192,6 +214,13 @@ class SupplementLogCreate(SupplementLogBase):
     """Supplement log creation model"""
     pass
 
+class SupplementLogBatchCreate(BaseModel):
+    """Mark many of the day's doses at once, e.g. every morning dose taken"""
+    status: str = Field(default="taken", pattern="^(pending|taken|missed|skipped)$")
+    period: Optional[str] = Field(None, pattern="^(Morning|Afternoon|Evening)$")
+    supplement_ids: Optional[List[int]] = None
+    log_date: Optional[date] = None
+
 class SupplementLogUpdate(BaseModel):
     """Supplement log update model"""
     status: Optional[str] = Field(None, pattern="^(pending|taken|missed|skipped)$")
@@ -209,6 +238,7 @@ class SupplementLogResponse(BaseModel):
     id: str
     user_id: str
     supplement_id: int
+    log_date: Optional[date] = None
     scheduled_time: str
     taken_at: Optional[datetime] = None
     status: str
@@ -216,6 +246,82 @@ class SupplementLogResponse(BaseModel):
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
+# Timeline models, same shapes as SupplementType, SupplementStatus and SupplementItem in json.py
+class SupplementType(str, Enum):
+    DEFAULT = "default"
+    GUMMY = "gummy"
+    LIQUID = "liquid"
+    POWDER = "powder"
+    SOFTGEL = "softgel"
+    TABLET = "tablet"
+
+class SupplementStatus(str, Enum):
+    COMPLETED = "completed"
+    MISSED = "missed"
+    CURRENT = "current"
+    DEFAULT = "default"
+
+class SupplementItem(BaseModel):
+    """One dose on the day's timeline"""
+    id: int
+    time: str
+    name: str
+    muted: bool
+    tags: List[str]
+    alerts: Optional[List[SupplementAlert]] = None
+    type: SupplementType
+    status: SupplementStatus
+
+    @field_validator("time")
+    @classmethod
+    def validate_time(cls, v: str) -> str:
+        if not re.match(r"^([01]\d|2[0-3]):[0-5]\d$", v):
+            raise ValueError("time must be in HH:mm format (e.g., '08:00', '13:20')")
+        return v
+
+class TimelineItem(SupplementItem):
+    """Timeline dose with the fields the app needs to log it"""
+    period: str
+    supplement_id: int
+    log_id: Optional[str] = None
+
+class TimelineResponse(BaseModel):
+    """A user's doses for one day, in time order"""
+    date: date
+    items: List[TimelineItem]
+
+class AdherenceBucket(BaseModel):
+    """Dose totals for one day, week or month"""
+    start: date
+    expected: int
+    taken: int
+    skipped: int
+    missed: int
+    rate: Optional[float] = None
+
+class SupplementAdherence(BaseModel):
+    """One supplement's adherence over the requested range"""
+    supplement_id: int
+    name: str
+    expected: int
+    taken: int
+    rate: Optional[float] = None
+    current_streak: int
+    longest_streak: int
+
+class AdherenceResponse(BaseModel):
+    """Adherence rate, streaks and per-period totals for a date range"""
+    start: date
+    end: date
+    bucket: str
+    expected: int
+    taken: int
+    rate: Optional[float] = None
+    current_streak: int
+    longest_streak: int
+    buckets: List[AdherenceBucket]
+    supplements: List[SupplementAdherence]
+
 # Health check model
 class HealthResponse(BaseModel):
     """Health check response model"""
@@ -245,6 +351,21 @@ class TokenData(BaseModel):
 class ImageUploadResponse(BaseModel):
     """Image upload response model"""
     image_url: str
+    # True when identical bytes were uploaded before and their image was reused
+    duplicate: bool = False
+    # The uploader's own visually similar stored images, closest first, e.g. the same bottle photographed twice
+    similar_images: List[str] = []
+
+# Scan models
+class ScanJobResponse(BaseModel):
+    """Scan job status; draft holds SupplementCreate fields read from the label once done"""
+    job_id: str
+    status: str
+    draft: Optional[Dict[str, Any]] = None
+    # Findings that are not supplement fields, e.g. the barcode or raw label text
+    evidence: Dict[str, Any] = {}
+    stages: List[Dict[str, Any]] = []
+    error: Optional[str] = None
 
 # Email delivery models
 class EmailStatusResponse(BaseModel):
@@ -0,0 +1,161 @@
+"""
+Prompt assembly for SafeDoser AI assistant
+Builds the per-request medical prompt within a fixed token budget from the
+rolling conversation summary, relevant earlier exchanges, the most recent turns
+and a ranked supplement list. The static guidelines travel separately as the
+model's system instruction.
+"""
+
+import os
+import re
+from typing import Any, Dict, List
+
+# Rough chars-per-token ratio for English text; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+SYSTEM_GUIDELINES = """You are SafeDoser Assistant, a helpful medical AI for supplement and medication guidance.
+
+GUIDELINES:
+- Be concise and helpful (2-3 sentences max for simple questions)
+- Only mention user's name/age when directly relevant to the medical advice
+- Prioritize safety - recommend healthcare providers for serious concerns
+- Provide evidence-based information
+- Never diagnose conditions"""
+
+CLOSING_INSTRUCTION = "Provide a helpful, concise response. Use the user's name sparingly and only when it adds value to the response."
+
+# Identical on every request, so the provider can cache it
+SYSTEM_INSTRUCTION = f"{SYSTEM_GUIDELINES}\n\n{CLOSING_INSTRUCTION}"
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used for prompt budgeting"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, marking the cut"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max(0, max_chars - 1)].rstrip() + "…"
+
+def rank_supplements(supplements: List[Dict[str, Any]], user_message: str) -> List[Dict[str, Any]]:
+    """Order supplements by relevance to the question; ties keep their original order"""
+    message = user_message.lower()
+    message_words = set(_WORD.findall(message))
+
+    def score(item) -> tuple:
+        index, supp = item
+        name = (supp.get("name") or "").lower()
+        form = (supp.get("dosage_form") or "").lower()
+        mentioned = 1 if name and name in message else 0
+        overlap = len(message_words & set(_WORD.findall(f"{name} {form}")))
+        return (-mentioned, -overlap, index)
+
+    return [supp for _, supp in sorted(enumerate(supplements), key=score)]
+
+def format_supplement(supp: Dict[str, Any]) -> str:
+    name = supp.get('name', 'Unknown')
+    form = supp.get('dosage_form', '')
+    freq = supp.get('frequency', '')
+    return f"{name} ({form}, {freq})"
+
+class PromptBuilder:
+    """Assembles prompts that, with the system instruction, never exceed a configured token budget"""
+
+    def __init__(self, token_budget: int = 1000, max_turn_chars: int = 400):
+        self.token_budget = token_budget
+        self.max_turn_chars = max_turn_chars
+        self.system_instruction = SYSTEM_INSTRUCTION
+
+    @classmethod
+    def from_env(cls) -> "PromptBuilder":
+        return cls(
+            token_budget=int(os.getenv("CHAT_PROMPT_TOKEN_BUDGET", "1000")),
+            max_turn_chars=int(os.getenv("CHAT_PROMPT_MAX_TURN_CHARS", "400")),
+        )
+
+    def build(
+        self,
+        user_message: str,
+        context: Dict[str, Any],
+        chat_history: List[Dict[str, Any]]
+    ) -> str:
+        """Build the per-request prompt from fixed parts, then fill the remaining budget by priority"""
+        user_name = context.get("user_name", "")
+        user_age = context.get("user_age", "")
+        summary = (context.get("conversation_summary") or "").strip()
+        relevant = context.get("relevant_history") or []
+
+        user_line = f"User: {user_name}, {user_age} years old"
+        question = f"USER QUESTION: {user_message}"
+        fixed = [self.system_instruction, "CONTEXT:", user_line, question]
+        remaining = self.token_budget - sum(estimate_tokens(part) + 1 for part in fixed)
+
+        # 1. Supplements the question is about, 2. summary, 3. relevant earlier exchanges,
+        # 4. recent turns, 5. other supplements
+        ranked = rank_supplements(context.get("supplements", []) or [], user_message)
+        lower_message = user_message.lower()
+        mentioned = [s for s in ranked if (s.get("name") or "").lower() and (s.get("name") or "").lower() in lower_message]
+        others = ranked[len(mentioned):]
+
+        supplement_parts: List[str] = []
+        for supp in mentioned:
+            entry = format_supplement(supp)
+            cost = estimate_tokens(entry) + 1
+            if cost > remaining:
+                break
+            supplement_parts.append(entry)
+            remaining -= cost
+
+        summary_context = ""
+        if summary and remaining > 0:
+            summary_context = "Conversation summary: " + truncate_to_tokens(summary, max(0, remaining // 2))
+            remaining -= estimate_tokens(summary_context) + 1
+
+        # Retrieved exchanges get at most a third of what is left, so recent turns still fit
+        relevant_parts: List[str] = []
+        relevant_budget = remaining // 3
+        for exchange in relevant:
+            text = " / ".join(line[:self.max_turn_chars] for line in exchange.split("\n"))
+            cost = estimate_tokens(text) + 1
+            if cost > relevant_budget:
+                break
+            relevant_parts.append(text)
+            relevant_budget -= cost
+            remaining -= cost
+
+        history_parts: List[str] = []
+        for msg in reversed(chat_history or []):
+            sender = "User" if msg.get('sender') == 'user' else "Assistant"
+            text = (msg.get('message') or '')[:self.max_turn_chars]
+            turn = f"{sender}: {text}"
+            cost = estimate_tokens(turn) + 1
+            if cost > remaining:
+                break
+            history_parts.insert(0, turn)
+            remaining -= cost
+
+        for supp in others:
+            entry = format_supplement(supp)
+            cost = estimate_tokens(entry) + 1
+            if cost > remaining:
+                break
+            supplement_parts.append(entry)
+            remaining -= cost
+
+        supplement_context = ""
+        if supplement_parts:
+            supplement_context = f"Current supplements: {', '.join(supplement_parts)}"
+            omitted = len(ranked) - len(supplement_parts)
+            if omitted > 0:
+                supplement_context += f" and {omitted} more"
+
+        history_context = f"Recent conversation: {' | '.join(history_parts)}" if history_parts else ""
+        relevant_context = f"Relevant earlier conversation: {' | '.join(relevant_parts)}" if relevant_parts else ""
+
+        sections = ["CONTEXT:", user_line]
+        sections.extend(part for part in (supplement_context, summary_context, relevant_context, history_context) if part)
+        sections.extend(["", question])
+        return "\n".join(sections)
@@ -0,0 +1,387 @@
+"""
+Dose reminder scheduler for SafeDoser backend
+Every pending reminder lives in one hierarchical timing wheel held in flat
+arrays (about 32 bytes per reminder) instead of an asyncio task per callback.
+Scheduling, cancelling and rescheduling are O(1) list operations; a single
+loop advances the wheel once per tick and hands due reminders, in batches, to
+a small pool of delivery workers. Doses recur daily and re-arm when they fire.
+"""
+
+import os
+import math
+import time
+import asyncio
+import logging
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from timeline import PERIODS, MINUTES_PER_DAY, format_minute, parse_dose_time
+
+logger = logging.getLogger(__name__)
+
+# Slots per level as powers of two: 256 ticks, then 64x each level above (2^32 ticks in all)
+LEVEL_BITS = (8, 6, 6, 6, 6)
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+_INDEX_MASK = 0xFFFFFFFF
+
+class TimingWheel:
+    """Cascading timing wheel over parallel arrays with generation-checked handles"""
+
+    def __init__(self, tick_seconds: float = 1.0, start: Optional[float] = None, capacity: int = 1024):
+        self.tick_seconds = tick_seconds
+        self.origin = time.time() if start is None else start
+        # Next tick to process
+        self.current = 0
+        self.size = 0
+
+        self._level_offsets: List[int] = []
+        self._level_shifts: List[int] = []
+        slots = shift = 0
+        for bits in LEVEL_BITS:
+            self._level_offsets.append(slots)
+            self._level_shifts.append(shift)
+            slots += 1 << bits
+            shift += bits
+        self._max_delta = (1 << shift) - 1
+        # First entry of each slot's doubly linked list, -1 when empty
+        self._heads = array("i", [-1]) * slots
+
+        # Per-entry columns; _slot is -1 for free entries
+        self._next = array("i")
+        self._prev = array("i")
+        self._slot = array("i")
+        self._generation = array("I")
+        self._due = array("q")
+        self._payload = array("q")
+        self._free = array("i")
+        self._grow(capacity)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _grow(self, count: int) -> None:
+        start = len(self._slot)
+        self._next.extend([-1] * count)
+        self._prev.extend([-1] * count)
+        self._slot.extend([-1] * count)
+        self._generation.extend([0] * count)
+        self._due.extend([0] * count)
+        self._payload.extend([0] * count)
+        # Hand out low indexes first
+        self._free.extend(range(start + count - 1, start - 1, -1))
+
+    def tick_for(self, when: float) -> int:
+        return math.ceil((when - self.origin) / self.tick_seconds)
+
+    def schedule(self, when: float, payload: int) -> int:
+        """Arm a timer for an epoch time; returns its handle"""
+        if not self._free:
+            self._grow(len(self._slot))
+        index = self._free.pop()
+        self._due[index] = self.tick_for(when)
+        self._payload[index] = payload
+        self._add(index)
+        self.size += 1
+        return (self._generation[index] << 32) | index
+
+    def cancel(self, handle: int) -> bool:
+        index = self._live_index(handle)
+        if index is None:
+            return False
+        self._unlink(index)
+        self._release(index)
+        return True
+
+    def reschedule(self, handle: int, when: float) -> bool:
+        """Move a pending timer; the handle stays valid"""
+        index = self._live_index(handle)
+        if index is None:
+            return False
+        self._unlink(index)
+        self._due[index] = self.tick_for(when)
+        self._add(index)
+        return True
+
+    def advance(self, now: float) -> List[int]:
+        """Payloads of every timer due at or before `now`, in firing order"""
+        target = math.floor((now - self.origin) / self.tick_seconds)
+        fired: List[int] = []
+        level0_mask = (1 << LEVEL_BITS[0]) - 1
+        while self.current <= target:
+            slot = self.current & level0_mask
+            if slot == 0:
+                # Level 0 wrapped: pull the next stretch of timers down from the levels above
+                for level in range(1, len(LEVEL_BITS)):
+                    index = (self.current >> self._level_shifts[level]) & ((1 << LEVEL_BITS[level]) - 1)
+                    self._cascade(self._level_offsets[level] + index)
+                    if index != 0:
+                        break
+            entry = self._heads[slot]
+            self._heads[slot] = -1
+            while entry != -1:
+                following = self._next[entry]
+                fired.append(self._payload[entry])
+                self._release(entry)
+                entry = following
+            self.current += 1
+        return fired
+
+    def _live_index(self, handle: int) -> Optional[int]:
+        index = handle & _INDEX_MASK
+        if index >= len(self._slot) or self._slot[index] == -1 or self._generation[index] != handle >> 32:
+            return None
+        return index
+
+    def _add(self, index: int) -> None:
+        due = self._due[index]
+        delta = due - self.current
+        if delta < 0:
+            # Already due: fire on the next tick processed
+            due = self.current
+            delta = 0
+        elif delta > self._max_delta:
+            due = self.current + self._max_delta
+            delta = self._max_delta
+        for level, bits in enumerate(LEVEL_BITS):
+            shift = self._level_shifts[level]
+            if delta < 1 << (shift + bits):
+                self._link(index, self._level_offsets[level] + ((due >> shift) & ((1 << bits) - 1)))
+                return
+
+    def _cascade(self, slot: int) -> None:
+        entry = self._heads[slot]
+        self._heads[slot] = -1
+        while entry != -1:
+            following = self._next[entry]
+            self._add(entry)
+            entry = following
+
+    def _link(self, index: int, slot: int) -> None:
+        head = self._heads[slot]
+        self._next[index] = head
+        self._prev[index] = -1
+        if head != -1:
+            self._prev[head] = index
+        self._heads[slot] = index
+        self._slot[index] = slot
+
+    def _unlink(self, index: int) -> None:
+        previous, following = self._prev[index], self._next[index]
+        if previous != -1:
+            self._next[previous] = following
+        else:
+            self._heads[self._slot[index]] = following
+        if following != -1:
+            self._prev[following] = previous
+
+    def _release(self, index: int) -> None:
+        self._slot[index] = -1
+        # Old handles to this entry stop working once it is reused
+        self._generation[index] = (self._generation[index] + 1) & _INDEX_MASK
+        self._free.append(index)
+        self.size -= 1
+
+class ReminderFeed:
+    """Fans delivered reminders out to each user's open event streams"""
+
+    def __init__(self, max_queued: int = 100):
+        self.max_queued = max_queued
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.stats: Dict[str, int] = {"delivered": 0, "unsubscribed": 0, "overflowed": 0}
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queued)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    async def deliver(self, batch: List[Dict[str, Any]]) -> None:
+        for reminder in batch:
+            queues = self._subscribers.get(reminder["user_id"])
+            if not queues:
+                self.stats["unsubscribed"] += 1
+                continue
+            for queue in queues:
+                if queue.full():
+                    # A stalled client loses its oldest reminder, not the newest
+                    queue.get_nowait()
+                    self.stats["overflowed"] += 1
+                queue.put_nowait(reminder)
+            self.stats["delivered"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "subscribers": sum(len(queues) for queues in self._subscribers.values())}
+
+class ReminderScheduler:
+    """Daily dose reminders for every supplement with reminders on"""
+
+    def __init__(
+        self,
+        deliver: Callable[[List[Dict[str, Any]]], Awaitable[None]],
+        tick_seconds: float = 1.0,
+        batch_size: int = 500,
+        delivery_workers: int = 4,
+        max_pending_batches: int = 64,
+        default_tz_offset: int = 0,
+    ):
+        self.deliver = deliver
+        self.wheel = TimingWheel(tick_seconds)
+        self.batch_size = batch_size
+        self.delivery_workers = delivery_workers
+        self.max_pending_batches = max_pending_batches
+        # Minutes east of UTC for users whose clients have not reported one
+        self.default_tz_offset = default_tz_offset
+        # supplement id -> user_id, name and {minute of day: wheel handle}
+        self._supplements: Dict[int, Dict[str, Any]] = {}
+        self._user_supplements: Dict[str, Set[int]] = {}
+        self._tz_offsets: Dict[str, int] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.stats: Dict[str, int] = {"fired": 0, "delivered": 0, "failed": 0, "batches": 0, "max_lag_ms": 0}
+
+    @classmethod
+    def from_env(cls, deliver: Callable[[List[Dict[str, Any]]], Awaitable[None]]) -> "ReminderScheduler":
+        return cls(
+            deliver,
+            tick_seconds=float(os.getenv("REMINDER_TICK_SECONDS", "1")),
+            batch_size=int(os.getenv("REMINDER_BATCH_SIZE", "500")),
+            delivery_workers=int(os.getenv("REMINDER_DELIVERY_WORKERS", "4")),
+            max_pending_batches=int(os.getenv("REMINDER_MAX_PENDING_BATCHES", "64")),
+            default_tz_offset=int(os.getenv("REMINDER_DEFAULT_TZ_OFFSET", "0")),
+        )
+
+    def _next_occurrence(self, user_id: str, minute: int, now: float) -> float:
+        """Epoch time of the next dose at a local minute of day"""
+        offset = self._tz_offsets.get(user_id, self.default_tz_offset) * 60
+        local = now + offset
+        due = local - local % SECONDS_PER_DAY + minute * 60
+        if due <= local:
+            due += SECONDS_PER_DAY
+        return due - offset
+
+    def set_supplement(self, user_id: str, supplement: Dict[str, Any]) -> None:
+        """Arm (or re-arm) a supplement's daily reminders from its current schedule"""
+        supplement_id = supplement["id"]
+        self.remove_supplement(supplement_id)
+        if not supplement.get("remind_me", True):
+            return
+        times_of_day = supplement.get("times_of_day") or {}
+        minutes = {
+            minute
+            for period in PERIODS
+            for minute in map(parse_dose_time, times_of_day.get(period) or [])
+            if minute is not None
+        }
+        if not minutes:
+            return
+
+        now = time.time()
+        self._supplements[supplement_id] = {
+            "user_id": user_id,
+            "name": supplement.get("name", ""),
+            "handles": {
+                minute: self.wheel.schedule(self._next_occurrence(user_id, minute, now), supplement_id * MINUTES_PER_DAY + minute)
+                for minute in minutes
+            },
+        }
+        self._user_supplements.setdefault(user_id, set()).add(supplement_id)
+
+    def remove_supplement(self, supplement_id: int) -> None:
+        entry = self._supplements.pop(supplement_id, None)
+        if entry is None:
+            return
+        for handle in entry["handles"].values():
+            self.wheel.cancel(handle)
+        supplements = self._user_supplements.get(entry["user_id"])
+        if supplements is not None:
+            supplements.discard(supplement_id)
+            if not supplements:
+                del self._user_supplements[entry["user_id"]]
+
+    def set_user_offset(self, user_id: str, tz_offset: int) -> None:
+        """Record a user's UTC offset in minutes, moving their pending reminders if it changed"""
+        if self._tz_offsets.get(user_id, self.default_tz_offset) == tz_offset:
+            return
+        self._tz_offsets[user_id] = tz_offset
+        now = time.time()
+        for supplement_id in self._user_supplements.get(user_id, ()):
+            for minute, handle in self._supplements[supplement_id]["handles"].items():
+                self.wheel.reschedule(handle, self._next_occurrence(user_id, minute, now))
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_pending_batches)
+        self._tasks = [asyncio.create_task(self._run())]
+        self._tasks += [asyncio.create_task(self._deliver_batches()) for _ in range(self.delivery_workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self) -> None:
+        tick = self.wheel.tick_seconds
+        while True:
+            now = time.time()
+            fired = self.wheel.advance(now)
+            if fired:
+                await self._dispatch(fired, now)
+            # Sleep to the next tick boundary rather than a fixed interval, so ticks do not drift
+            await asyncio.sleep(tick - (time.time() - self.wheel.origin) % tick)
+
+    async def _dispatch(self, fired: List[int], now: float) -> None:
+        reminders: List[Dict[str, Any]] = []
+        for payload in fired:
+            supplement_id, minute = divmod(payload, MINUTES_PER_DAY)
+            entry = self._supplements.get(supplement_id)
+            if entry is None:
+                continue
+            # Re-arm for tomorrow before delivering today's
+            entry["handles"][minute] = self.wheel.schedule(
+                self._next_occurrence(entry["user_id"], minute, now), payload
+            )
+            reminders.append({
+                "user_id": entry["user_id"],
+                "supplement_id": supplement_id,
+                "name": entry["name"],
+                "time": format_minute(minute),
+                "sent_at": datetime.fromtimestamp(now, timezone.utc).isoformat(),
+            })
+        self.stats["fired"] += len(reminders)
+
+        for start in range(0, len(reminders), self.batch_size):
+            # A full queue holds the tick loop back; the wheel catches up on the next advance
+            await self._queue.put(reminders[start:start + self.batch_size])
+        lag_ms = int((time.time() - now) * 1000)
+        self.stats["max_lag_ms"] = max(self.stats["max_lag_ms"], lag_ms)
+
+    async def _deliver_batches(self) -> None:
+        while True:
+            batch = await self._queue.get()
+            try:
+                await self.deliver(batch)
+                self.stats["delivered"] += len(batch)
+                self.stats["batches"] += 1
+            except Exception as e:
+                logger.error(f"Reminder delivery failed for {len(batch)} reminders: {str(e)}")
+                self.stats["failed"] += len(batch)
+            finally:
+                self._queue.task_done()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "pending": len(self.wheel),
+            "supplements": len(self._supplements),
+            "queued_batches": self._queue.qsize() if self._queue else 0,
+            "tick_seconds": self.wheel.tick_seconds,
+        }
@@ -0,0 +1,241 @@
+"""
+Response cache for SafeDoser AI assistant
+Caches model replies keyed by the normalized question plus a fingerprint of the
+prompt context, with LRU+TTL eviction in memory and an optional SQLite disk tier.
+Disk reads and writes run in worker threads; the disk tier is purged of expired
+rows on startup and every few hundred stores, and capped at max_disk_entries.
+"""
+
+import os
+import re
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+# Phrases that point back at earlier turns, so the answer depends on history
+_FOLLOW_UP = re.compile(
+    r"\b(you said|you mentioned|earlier|before that|above|last time|previous|again|"
+    r"what about|and (it|that|this|those)|(it|that|this|those|them|they)\b\s*\??$)",
+    re.IGNORECASE,
+)
+
+AGE_BUCKETS = ((18, "teen"), (30, "18-29"), (50, "30-49"), (65, "50-64"))
+
+def normalize_question(message: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace"""
+    text = _PUNCTUATION.sub(" ", message.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+def age_bucket(age: Any) -> str:
+    """Coarse age band so nearby ages share cache entries"""
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        return "unknown"
+    for upper, label in AGE_BUCKETS:
+        if age < upper:
+            return label
+    return "65+"
+
+def context_fingerprint(context: Dict[str, Any]) -> str:
+    """Fingerprint of the supplement names/forms and age band used in the prompt"""
+    supplements = sorted(
+        (
+            (supp.get("name") or "").strip().lower(),
+            (supp.get("dosage_form") or "").strip().lower(),
+        )
+        for supp in context.get("supplements", []) or []
+    )
+    parts = [age_bucket(context.get("user_age"))]
+    parts.extend(f"{name}:{form}" for name, form in supplements)
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()[:16]
+
+def is_personalised_follow_up(message: str) -> bool:
+    """Whether a question refers back to the conversation and must not be served from cache"""
+    return bool(_FOLLOW_UP.search(message.strip()))
+
+class ResponseCache:
+    """LRU+TTL cache of assistant replies with an optional on-disk tier"""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 6 * 3600,
+        disk_path: Optional[str] = None,
+        max_disk_entries: int = 50000,
+        purge_every: int = 256,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        # Disk stores between purges of expired and surplus rows
+        self.purge_every = purge_every
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # SQLite work runs in worker threads; this lock guards only the connection,
+        # so memory lookups on the event loop never wait behind disk I/O
+        self._disk_lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+        self._stores_since_purge = 0
+        self.stats: Dict[str, int] = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "bypasses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "disk_purged": 0,
+        }
+
+        if disk_path:
+            try:
+                self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+                self._disk.execute(
+                    "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires_at REAL, reply TEXT)"
+                )
+                self._disk.execute("CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)")
+                self._disk.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to open response cache at {disk_path}: {e}")
+                self._disk = None
+            else:
+                # Rows left by earlier runs expire while the app is down
+                self._purge_disk()
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """Build the cache from environment settings, or None when disabled"""
+        if os.getenv("CHAT_CACHE_ENABLED", "true").lower() == "false":
+            return None
+        return cls(
+            max_entries=int(os.getenv("CHAT_CACHE_SIZE", "1024")),
+            ttl_seconds=float(os.getenv("CHAT_CACHE_TTL_SECONDS", str(6 * 3600))),
+            disk_path=os.getenv("CHAT_CACHE_PATH") or None,
+            max_disk_entries=int(os.getenv("CHAT_CACHE_DISK_SIZE", "50000")),
+        )
+
+    @staticmethod
+    def make_key(message: str, context: Dict[str, Any]) -> str:
+        return f"{context_fingerprint(context)}:{normalize_question(message)}"
+
+    async def get(self, key: str) -> Optional[str]:
+        """Look up a reply, falling through to the disk tier on a memory miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, reply = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return reply
+                del self._entries[key]
+
+        row = await asyncio.to_thread(self._read_disk, key) if self._disk is not None else None
+        with self._lock:
+            if row and row[0] > now:
+                self._remember(key, row[0], row[1])
+                self.stats["hits"] += 1
+                self.stats["disk_hits"] += 1
+                return row[1]
+            self.stats["misses"] += 1
+            return None
+
+    async def set(self, key: str, reply: str) -> None:
+        """Store a reply in memory and, if configured, on disk"""
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, expires_at, reply)
+            self.stats["stores"] += 1
+        if self._disk is not None:
+            await asyncio.to_thread(self._write_disk, key, expires_at, reply)
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self.stats["bypasses"] += 1
+
+    def purge_expired(self) -> int:
+        """Drop expired entries from both tiers; blocks on disk I/O"""
+        now = time.time()
+        with self._lock:
+            expired: List[str] = [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]
+            for key in expired:
+                del self._entries[key]
+        self._purge_disk()
+        return len(expired)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_enabled": self._disk is not None,
+                "max_disk_entries": self.max_disk_entries,
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+    def _remember(self, key: str, expires_at: float, reply: str) -> None:
+        self._entries[key] = (expires_at, reply)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _read_disk(self, key: str) -> Optional[Tuple[float, str]]:
+        with self._disk_lock:
+            try:
+                return self._disk.execute(
+                    "SELECT expires_at, reply FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Response cache disk read error: {e}")
+                return None
+
+    def _write_disk(self, key: str, expires_at: float, reply: str) -> None:
+        with self._disk_lock:
+            try:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO responses (key, expires_at, reply) VALUES (?, ?, ?)",
+                    (key, expires_at, reply),
+                )
+                self._disk.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Response cache disk write error: {e}")
+                return
+            self._stores_since_purge += 1
+            if self._stores_since_purge < self.purge_every:
+                return
+        self._purge_disk()
+
+    def _purge_disk(self) -> None:
+        """Delete expired rows, then the soonest-expiring ones beyond max_disk_entries"""
+        if self._disk is None:
+            return
+        with self._disk_lock:
+            self._stores_since_purge = 0
+            try:
+                purged = self._disk.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),)).rowcount
+                purged += self._disk.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,),
+                ).rowcount
+                self._disk.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Response cache disk purge error: {e}")
+                return
+        with self._lock:
+            self.stats["disk_purged"] += purged
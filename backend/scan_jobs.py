@@ -0,0 +1,192 @@
+"""
+Scan job queue for SafeDoser backend
+POST /scan hands the label photo to this queue and returns a job id right away.
+A few asyncio workers feed queued jobs to a process pool running the recognizer
+chain, so OCR never blocks the event loop. Clients poll the job or wait on its
+event stream for the SupplementCreate draft. Jobs live in memory and expire a
+while after they finish.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+
+from image_ingest import ImageSource, discard_source
+from scan_recognizers import recognizer_names, run_chain
+
+logger = logging.getLogger(__name__)
+
+class ScanQueueFull(Exception):
+    """Raised when a scan is refused because the queue is full"""
+
+class ScanJob:
+    """One scan request and its result"""
+
+    def __init__(self, user_id: str, image: ImageSource):
+        self.id = str(uuid.uuid4())
+        self.user_id = user_id
+        # Photo bytes or the path of its spooled upload, owned by the job until it runs
+        self.image: Optional[ImageSource] = image
+        self.status = "queued"
+        self.draft: Optional[Dict[str, Any]] = None
+        self.evidence: Dict[str, Any] = {}
+        self.stages: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.finished = asyncio.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "draft": self.draft,
+            "evidence": self.evidence,
+            "stages": self.stages,
+            "error": self.error,
+        }
+
+class ScanJobQueue:
+    """Bounded in-process queue of scan jobs"""
+
+    def __init__(
+        self,
+        recognizers: List[str],
+        workers: int = 2,
+        process_workers: int = 2,
+        max_queue: int = 32,
+        job_ttl_seconds: int = 600,
+    ):
+        self.recognizers = recognizers
+        self.workers = workers
+        self.process_workers = process_workers
+        self.max_queue = max_queue
+        # How long a finished job stays available to poll
+        self.job_ttl_seconds = job_ttl_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, ScanJob] = {}
+        self.stats: Dict[str, int] = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "pool_restarts": 0}
+        # Stage name -> [total milliseconds, count]
+        self._timings: Dict[str, list] = {}
+
+    @classmethod
+    def from_env(cls) -> "ScanJobQueue":
+        return cls(
+            recognizers=recognizer_names(os.getenv("SCAN_RECOGNIZERS", "barcode,label_text,catalog")),
+            workers=int(os.getenv("SCAN_WORKERS", "2")),
+            process_workers=int(os.getenv("SCAN_PROCESS_WORKERS", "2")),
+            max_queue=int(os.getenv("SCAN_MAX_QUEUE", "32")),
+            job_ttl_seconds=int(os.getenv("SCAN_JOB_TTL_SECONDS", "600")),
+        )
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._executor = ProcessPoolExecutor(max_workers=self.process_workers)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Scan queue started with recognizers {self.recognizers}")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Spooled photos of jobs that never ran
+        while self._queue is not None and not self._queue.empty():
+            discard_source(self._queue.get_nowait().image)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, user_id: str, image: ImageSource) -> ScanJob:
+        """Queue a scan, or raise ScanQueueFull; the job owns the image from here on"""
+        self._prune()
+        job = ScanJob(user_id, image)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            discard_source(image)
+            self.stats["rejected"] += 1
+            raise ScanQueueFull(f"Scan queue is full ({self.max_queue} jobs waiting)")
+        self._jobs[job.id] = job
+        self.stats["submitted"] += 1
+        return job
+
+    def get(self, job_id: str, user_id: str) -> Optional[ScanJob]:
+        """A user's own job, or None"""
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.job_ttl_seconds
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            submitted = job.created_at
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.process_workers)
+            executor = self._executor
+            try:
+                result = await loop.run_in_executor(executor, run_chain, self.recognizers, job.image)
+                job.draft = result["draft"]
+                job.evidence = result["evidence"]
+                job.stages = [{"name": "queue", "ms": round(max(0.0, result["started"] - submitted) * 1000, 2)}, *result["stages"]]
+                job.status = "done"
+                self.stats["completed"] += 1
+                for stage in job.stages:
+                    total = self._timings.setdefault(stage["name"], [0.0, 0])
+                    total[0] += stage["ms"]
+                    total[1] += 1
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "Scan was cancelled"
+                raise
+            except BrokenProcessPool:
+                # A recognizer process died and took the pool with it; the job is not
+                # retried, as the same photo may kill the next pool
+                job.status = "failed"
+                job.error = "Scan worker exited unexpectedly"
+                self.stats["failed"] += 1
+                self._restart(executor)
+            except Exception as e:
+                logger.error(f"Scan job {job.id} failed: {str(e)}")
+                job.status = "failed"
+                job.error = "Scan processing failed"
+                self.stats["failed"] += 1
+            finally:
+                discard_source(job.image)
+                job.image = None
+                job.finished_at = time.time()
+                job.finished.set()
+                self._queue.task_done()
+
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        """Drop a broken pool once; the next job starts a fresh one"""
+        if self._executor is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self.stats["pool_restarts"] += 1
+            logger.error("Scan worker process died; restarting the scan pool")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "jobs": len(self._jobs),
+            "recognizers": self.recognizers,
+            "avg_stage_ms": {stage: round(total / count, 2) for stage, (total, count) in self._timings.items()},
+        }
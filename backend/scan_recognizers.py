@@ -0,0 +1,193 @@
+"""
+Scan recognizers for SafeDoser backend
+A scan runs a chain of recognizers over a label photo, each adding what it can
+to a supplement draft: barcode decoding, label text extraction and a catalog
+match against the supplement knowledge base. The chain runs inside a worker
+process, so recognizers are plain classes looked up by name. Barcode and OCR
+support depend on optional packages (pyzbar, pytesseract) and report themselves
+unavailable without them. The stub recognizer is deterministic, for tests and
+local development.
+"""
+
+import io
+import re
+import time
+import hashlib
+from typing import Any, Dict, List
+
+from PIL import Image, ImageOps
+
+from image_ingest import ImageSource, read_source
+from knowledge_base import KnowledgeBase, normalize_name
+
+try:
+    from pyzbar import pyzbar
+except ImportError:
+    pyzbar = None
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+# Draft keys that map onto SupplementCreate fields; the rest is evidence
+DRAFT_FIELDS = ("name", "brand", "dosage_form", "dose_quantity", "dose_unit", "quantity")
+
+DOSAGE_FORMS = {
+    "softgel": "Softgel",
+    "capsule": "Capsule",
+    "vcap": "Capsule",
+    "tablet": "Tablet",
+    "caplet": "Tablet",
+    "chewable": "Chewable",
+    "gummy": "Gummy",
+    "gummie": "Gummy",
+    "liquid": "Liquid",
+    "drop": "Liquid",
+    "powder": "Powder",
+}
+
+DOSE_UNITS = {"mg": "mg", "mcg": "mcg", "µg": "mcg", "ug": "mcg", "iu": "IU", "g": "g", "ml": "mL"}
+
+_DOSE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(mg|mcg|µg|ug|iu|g|ml)\b", re.IGNORECASE)
+_COUNT = re.compile(r"(\d+)\s*(?:count|ct|softgels?|capsules?|vcaps?|tablets?|caplets?|gumm(?:y|ies)|chewables?)\b", re.IGNORECASE)
+_FORM = re.compile(r"\b(" + "|".join(DOSAGE_FORMS) + r")s?\b", re.IGNORECASE)
+
+STUB_PRODUCTS = (
+    {"name": "Vitamin D3", "brand": "Nature Plus", "dosage_form": "Softgel", "dose_quantity": "5000", "dose_unit": "IU", "quantity": "120", "barcode": "0123456789012"},
+    {"name": "Magnesium Glycinate", "brand": "Pure Source", "dosage_form": "Capsule", "dose_quantity": "200", "dose_unit": "mg", "quantity": "90", "barcode": "0123456789029"},
+    {"name": "Omega-3", "brand": "Ocean Health", "dosage_form": "Softgel", "dose_quantity": "1000", "dose_unit": "mg", "quantity": "60", "barcode": "0123456789036"},
+    {"name": "Vitamin B12", "brand": "Daily Basics", "dosage_form": "Tablet", "dose_quantity": "1000", "dose_unit": "mcg", "quantity": "100", "barcode": "0123456789043"},
+)
+
+class RecognizerUnavailable(Exception):
+    """Raised when a recognizer's optional dependency is not installed"""
+
+def parse_label_text(text: str) -> Dict[str, Any]:
+    """Dose, dosage form and count from label text"""
+    found: Dict[str, Any] = {}
+    dose = _DOSE.search(text)
+    if dose:
+        found["dose_quantity"] = dose.group(1).replace(",", "")
+        found["dose_unit"] = DOSE_UNITS[dose.group(2).lower()]
+    form = _FORM.search(text)
+    if form:
+        found["dosage_form"] = DOSAGE_FORMS[form.group(1).lower()]
+    count = _COUNT.search(text)
+    if count:
+        found["quantity"] = count.group(1)
+    lines = [line.strip() for line in text.splitlines() if re.search(r"[A-Za-z]{3}", line)]
+    if lines:
+        # Brands usually lead the front label
+        found["brand"] = lines[0][:255]
+    return found
+
+def _grayscale(image: bytes) -> Image.Image:
+    with Image.open(io.BytesIO(image)) as source:
+        source.draft("L", (1600, 1600))
+        return ImageOps.exif_transpose(source).convert("L")
+
+class Recognizer:
+    """One step of the scan chain"""
+
+    name = "base"
+
+    def recognize(self, image: bytes, draft: Dict[str, Any]) -> Dict[str, Any]:
+        """Values found in the image; earlier steps' findings are in `draft`"""
+        raise NotImplementedError
+
+class BarcodeRecognizer(Recognizer):
+    name = "barcode"
+
+    def recognize(self, image: bytes, draft: Dict[str, Any]) -> Dict[str, Any]:
+        if pyzbar is None:
+            raise RecognizerUnavailable("pyzbar is not installed")
+        for symbol in pyzbar.decode(_grayscale(image)):
+            if symbol.type in ("EAN13", "UPCA", "EAN8", "UPCE"):
+                return {"barcode": symbol.data.decode("ascii", "ignore")}
+        return {}
+
+class LabelTextRecognizer(Recognizer):
+    name = "label_text"
+
+    def recognize(self, image: bytes, draft: Dict[str, Any]) -> Dict[str, Any]:
+        if pytesseract is None:
+            raise RecognizerUnavailable("pytesseract is not installed")
+        text = pytesseract.image_to_string(_grayscale(image))
+        if not text.strip():
+            return {}
+        return {"label_text": text, **parse_label_text(text)}
+
+class CatalogMatchRecognizer(Recognizer):
+    name = "catalog"
+
+    def __init__(self) -> None:
+        self.knowledge_base = KnowledgeBase.from_env()
+
+    def recognize(self, image: bytes, draft: Dict[str, Any]) -> Dict[str, Any]:
+        text = draft.get("label_text") or draft.get("name") or ""
+        keys = self.knowledge_base.find_mentions(normalize_name(text))
+        if not keys:
+            return {}
+        # Longest alias first, so "vitamin d3" beats a bare "d3" on the same label
+        return {"name": self.knowledge_base.entries[keys[0]]["name"], "catalog_key": keys[0]}
+
+class StubRecognizer(Recognizer):
+    """Same image, same product; no optional dependencies"""
+
+    name = "stub"
+
+    def recognize(self, image: bytes, draft: Dict[str, Any]) -> Dict[str, Any]:
+        digest = hashlib.sha256(image).digest()
+        return dict(STUB_PRODUCTS[digest[0] % len(STUB_PRODUCTS)])
+
+RECOGNIZERS = {
+    recognizer.name: recognizer
+    for recognizer in (BarcodeRecognizer, LabelTextRecognizer, CatalogMatchRecognizer, StubRecognizer)
+}
+
+# Instances live for the life of the worker process, so setup such as loading the catalog happens once
+_instances: Dict[str, Recognizer] = {}
+
+def run_chain(names: List[str], image: ImageSource) -> Dict[str, Any]:
+    """Worker: run the named recognizers in order, merging what each finds into one draft"""
+    started = time.time()
+    # Spooled uploads arrive as a path and are read here, in the worker process
+    image = read_source(image)
+    found: Dict[str, Any] = {}
+    stages: List[Dict[str, Any]] = []
+    for name in names:
+        stage_started = time.perf_counter()
+        stage: Dict[str, Any] = {"name": name}
+        try:
+            recognizer = _instances.get(name)
+            if recognizer is None:
+                recognizer = _instances[name] = RECOGNIZERS[name]()
+            values = recognizer.recognize(image, found)
+            # Earlier, more specific recognizers win
+            for key, value in values.items():
+                found.setdefault(key, value)
+            stage["status"] = "matched" if values else "no_match"
+        except RecognizerUnavailable as e:
+            stage["status"] = "unavailable"
+            stage["error"] = str(e)
+        except Exception as e:
+            stage["status"] = "failed"
+            stage["error"] = str(e)
+        stage["ms"] = round((time.perf_counter() - stage_started) * 1000, 2)
+        stages.append(stage)
+
+    return {
+        "draft": {key: found[key] for key in DRAFT_FIELDS if key in found},
+        "evidence": {key: value for key, value in found.items() if key not in DRAFT_FIELDS},
+        "stages": stages,
+        "started": started,
+    }
+
+def recognizer_names(spec: str) -> List[str]:
+    """Validated recognizer chain from a comma-separated spec"""
+    names = [name.strip() for name in spec.split(",") if name.strip()]
+    unknown = [name for name in names if name not in RECOGNIZERS]
+    if unknown:
+        raise ValueError(f"Unknown scan recognizers {unknown}, expected some of {list(RECOGNIZERS)}")
+    return names
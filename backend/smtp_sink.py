@@ -0,0 +1,358 @@
+"""
+Local SMTP sink for SafeDoser backend
+Accepts and discards mail so EmailService can be exercised without a real provider.
+Supports optional STARTTLS and AUTH, plus latency and failure injection.
+
+Usage:
+    python smtp_sink.py --port 1025 --starttls --auth user:secret --latency-ms 20 --fail-rate 0.05
+"""
+
+import os
+import ssl
+import base64
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from typing import Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+# SMTP reply used for each injectable failure stage. The codes are chosen so that
+# smtplib raises the exception EmailService maps to the matching error_code.
+FAILURE_REPLIES = {
+    "connect": "421 Service not available, closing transmission channel",  # SMTP_CONNECT_FAILED
+    "auth": "535 Authentication credentials invalid",                      # SMTP_AUTH_FAILED
+    "mail": "451 Requested action aborted: local error",                   # SENDER_REFUSED
+    "rcpt": "550 Mailbox unavailable",                                     # RECIPIENTS_REFUSED
+    "data": "554 Transaction failed",                                      # SMTP_DATA_ERROR
+}
+
+def generate_self_signed_cert(directory: Optional[str] = None) -> Tuple[str, str]:
+    """Generate a throwaway self-signed certificate with openssl for STARTTLS"""
+    directory = directory or tempfile.mkdtemp(prefix="smtp-sink-")
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    try:
+        subprocess.run(
+            [
+                "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+                "-keyout", keyfile, "-out", certfile, "-days", "1",
+                "-subj", "/CN=localhost",
+            ],
+            check=True,
+            capture_output=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise RuntimeError(f"Could not generate a self-signed certificate (pass --certfile/--keyfile): {e}")
+    return certfile, keyfile
+
+class SMTPSink:
+    """Minimal asyncio SMTP server that accepts and drops every message"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 1025,
+        starttls: bool = False,
+        certfile: Optional[str] = None,
+        keyfile: Optional[str] = None,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        fail_rate: float = 0.0,
+        fail_stage: str = "data",
+        seed: Optional[int] = None,
+    ):
+        if fail_stage not in FAILURE_REPLIES:
+            raise ValueError(f"fail_stage must be one of {', '.join(FAILURE_REPLIES)}")
+
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.fail_rate = fail_rate
+        self.fail_stage = fail_stage
+        self._random = random.Random(seed)
+
+        self.ssl_context: Optional[ssl.SSLContext] = None
+        if starttls:
+            if not certfile or not keyfile:
+                certfile, keyfile = generate_self_signed_cert()
+            self.ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self.ssl_context.load_cert_chain(certfile, keyfile)
+
+        self.stats: Dict[str, int] = {
+            "connections": 0,
+            "messages": 0,
+            "bytes": 0,
+            "injected_failures": 0,
+        }
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def requires_auth(self) -> bool:
+        return bool(self.username and self.password)
+
+    async def start(self) -> None:
+        """Start listening on the configured address"""
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        # Pick up the real port when started with port=0
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"SMTP sink listening on {self.host}:{self.port}")
+
+    async def stop(self) -> None:
+        """Stop accepting connections"""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def start_in_thread(self) -> "SMTPSink":
+        """Run the sink on its own event loop in a daemon thread"""
+        started = threading.Event()
+
+        def run() -> None:
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="smtp-sink", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop_thread(self) -> None:
+        """Stop a sink started with start_in_thread"""
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join()
+        self._loop = None
+        self._thread = None
+
+    def _should_fail(self, stage: str) -> bool:
+        if stage != self.fail_stage or self.fail_rate <= 0:
+            return False
+        if self._random.random() < self.fail_rate:
+            self.stats["injected_failures"] += 1
+            return True
+        return False
+
+    async def _delay(self) -> None:
+        delay = self.latency_ms
+        if self.jitter_ms:
+            delay += self._random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Run one SMTP session"""
+        self.stats["connections"] += 1
+
+        async def reply(line: str) -> None:
+            writer.write(f"{line}\r\n".encode())
+            await writer.drain()
+
+        session: Dict[str, Any] = {"tls": False, "authenticated": False, "mail_from": None, "rcpt": []}
+
+        try:
+            await self._delay()
+            if self._should_fail("connect"):
+                await reply(FAILURE_REPLIES["connect"])
+                return
+            await reply(f"220 {self.host} SafeDoser SMTP sink ready")
+
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                command, _, arg = line.decode(errors="replace").rstrip("\r\n").partition(" ")
+                command = command.upper()
+
+                if command in ("EHLO", "HELO"):
+                    if command == "HELO":
+                        await reply(f"250 {self.host}")
+                        continue
+                    capabilities = [self.host, "8BITMIME", "SIZE 10485760"]
+                    if self.ssl_context and not session["tls"]:
+                        capabilities.append("STARTTLS")
+                    if self.requires_auth:
+                        capabilities.append("AUTH PLAIN LOGIN")
+                    for capability in capabilities[:-1]:
+                        await reply(f"250-{capability}")
+                    await reply(f"250 {capabilities[-1]}")
+
+                elif command == "STARTTLS":
+                    if not self.ssl_context or session["tls"]:
+                        await reply("454 TLS not available")
+                        continue
+                    await reply("220 Ready to start TLS")
+                    await writer.start_tls(self.ssl_context)
+                    session.update(tls=True, authenticated=False, mail_from=None, rcpt=[])
+
+                elif command == "AUTH":
+                    if not self.requires_auth:
+                        await reply("503 AUTH not advertised")
+                        continue
+                    username, password = await self._read_auth(arg, reader, reply)
+                    await self._delay()
+                    if (
+                        username == self.username
+                        and password == self.password
+                        and not self._should_fail("auth")
+                    ):
+                        session["authenticated"] = True
+                        await reply("235 Authentication successful")
+                    else:
+                        await reply(FAILURE_REPLIES["auth"])
+
+                elif command == "MAIL":
+                    if self.requires_auth and not session["authenticated"]:
+                        await reply("530 Authentication required")
+                        continue
+                    if self._should_fail("mail"):
+                        await reply(FAILURE_REPLIES["mail"])
+                        continue
+                    session["mail_from"] = arg
+                    session["rcpt"] = []
+                    await reply("250 OK")
+
+                elif command == "RCPT":
+                    if session["mail_from"] is None:
+                        await reply("503 Need MAIL command")
+                        continue
+                    if self._should_fail("rcpt"):
+                        await reply(FAILURE_REPLIES["rcpt"])
+                        continue
+                    session["rcpt"].append(arg)
+                    await reply("250 OK")
+
+                elif command == "DATA":
+                    if not session["rcpt"]:
+                        await reply("503 Need RCPT command")
+                        continue
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    size = 0
+                    while True:
+                        data_line = await reader.readline()
+                        if not data_line or data_line in (b".\r\n", b".\n"):
+                            break
+                        size += len(data_line)
+                    await self._delay()
+                    session["mail_from"] = None
+                    session["rcpt"] = []
+                    if self._should_fail("data"):
+                        await reply(FAILURE_REPLIES["data"])
+                        continue
+                    self.stats["messages"] += 1
+                    self.stats["bytes"] += size
+                    await reply("250 OK: message accepted")
+
+                elif command == "RSET":
+                    session["mail_from"] = None
+                    session["rcpt"] = []
+                    await reply("250 OK")
+
+                elif command == "NOOP":
+                    await reply("250 OK")
+
+                elif command == "QUIT":
+                    await reply("221 Bye")
+                    return
+
+                else:
+                    await reply("502 Command not implemented")
+
+        except (ConnectionError, asyncio.IncompleteReadError, ssl.SSLError):
+            pass
+        except Exception as e:
+            logger.error(f"SMTP sink session error: {e}")
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _read_auth(self, arg: str, reader: asyncio.StreamReader, reply) -> Tuple[Optional[str], Optional[str]]:
+        """Read AUTH PLAIN or AUTH LOGIN credentials"""
+        mechanism, _, initial = arg.partition(" ")
+        mechanism = mechanism.upper()
+
+        async def prompt(challenge: str) -> str:
+            await reply(f"334 {challenge}")
+            return (await reader.readline()).decode().strip()
+
+        try:
+            if mechanism == "PLAIN":
+                response = initial or await prompt("")
+                _, username, password = base64.b64decode(response).decode().split("\0", 2)
+                return username, password
+            if mechanism == "LOGIN":
+                username = base64.b64decode(initial or await prompt("VXNlcm5hbWU6")).decode()
+                password = base64.b64decode(await prompt("UGFzc3dvcmQ6")).decode()
+                return username, password
+        except Exception:
+            pass
+        return None, None
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a local SMTP sink for SafeDoser email testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--starttls", action="store_true", help="Advertise STARTTLS (self-signed cert if none given)")
+    parser.add_argument("--certfile")
+    parser.add_argument("--keyfile")
+    parser.add_argument("--auth", help="Require AUTH with USER:PASSWORD")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Fixed delay added to greeting, AUTH and DATA")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform random delay added on top of --latency-ms")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Probability of an injected failure")
+    parser.add_argument("--fail-stage", default="data", choices=sorted(FAILURE_REPLIES))
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    username, password = (args.auth.split(":", 1) if args.auth else (None, None))
+    sink = SMTPSink(
+        host=args.host,
+        port=args.port,
+        starttls=args.starttls,
+        certfile=args.certfile,
+        keyfile=args.keyfile,
+        username=username,
+        password=password,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        fail_rate=args.fail_rate,
+        fail_stage=args.fail_stage,
+        seed=args.seed,
+    )
+
+    async def serve() -> None:
+        await sink.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await sink.stop()
+            logger.info(f"SMTP sink stats: {sink.stats}")
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+from datetime import date
+
+import numpy as np
+
+from adherence import AdherenceRange, doses_per_day, streak_lengths
+
+def test_streak_lengths():
+    hit = np.array([
+        [1, 1, 0, 1, 1, 1],
+        [1, 1, 1, 1, 1, 0],
+        [0, 0, 0, 0, 0, 0],
+    ], dtype=bool)
+    due = np.ones_like(hit)
+    current, longest = streak_lengths(hit, due)
+    # Row 1's last day is still open, so its run up to the day before counts
+    assert current.tolist() == [3, 5, 0]
+    assert longest.tolist() == [3, 5, 0]
+
+def test_days_without_doses_bridge_streaks():
+    hit = np.array([[1, 1, 1, 1]], dtype=bool)
+    due = np.array([[1, 0, 0, 1]], dtype=bool)
+    current, longest = streak_lengths(hit, due)
+    assert current.tolist() == [2]
+    assert longest.tolist() == [2]
+
+def test_streak_lengths_of_empty_range():
+    current, longest = streak_lengths(np.zeros((2, 0), dtype=bool), np.zeros((2, 0), dtype=bool))
+    assert current.tolist() == [0, 0]
+    assert longest.tolist() == [0, 0]
+
+def test_doses_per_day_counts_valid_times():
+    supplement = {"times_of_day": {"Morning": ["08:00", "bad"], "Evening": ["21:30"], "Afternoon": "12:00"}}
+    assert doses_per_day(supplement) == 2
+
+def test_range_summary_and_buckets():
+    supplements = [
+        {"id": 1, "name": "Zinc", "times_of_day": {"Morning": ["08:00"], "Evening": ["20:00"]}},
+        {"id": 2, "name": "Iron", "times_of_day": {"Morning": ["08:00"]}, "created_at": "2025-07-02T10:00:00Z"},
+    ]
+    rollups = [
+        {"supplement_id": 1, "log_date": "2025-07-01", "taken": 2},
+        {"supplement_id": 1, "log_date": "2025-07-02", "taken": 3, "skipped": 0},
+        {"supplement_id": 1, "log_date": "2025-07-03", "taken": 1, "missed": 1},
+        {"supplement_id": 2, "log_date": "2025-07-02", "taken": 1},
+        {"supplement_id": 2, "log_date": "2025-07-03", "taken": 1},
+        # Outside the range or for an unknown supplement
+        {"supplement_id": 1, "log_date": "2025-07-09", "taken": 2},
+        {"supplement_id": 9, "log_date": "2025-07-01", "taken": 2},
+    ]
+    adherence = AdherenceRange(date(2025, 7, 1), date(2025, 7, 3), supplements, rollups)
+
+    days = adherence.buckets("day")
+    assert [day["expected"] for day in days] == [2, 3, 3]
+    # A third zinc dose on the 2nd does not count beyond its schedule
+    assert [day["taken"] for day in days] == [2, 3, 2]
+    assert days[2]["missed"] == 1
+
+    summary = adherence.summary()
+    assert summary["expected"] == 8
+    assert summary["taken"] == 7
+    assert summary["rate"] == 0.875
+    assert summary["current_streak"] == 2
+    assert summary["longest_streak"] == 2
+    zinc, iron = summary["supplements"]
+    assert (zinc["current_streak"], zinc["longest_streak"]) == (2, 2)
+    assert (iron["current_streak"], iron["longest_streak"], iron["rate"]) == (2, 2, 1.0)
+
+def test_week_and_month_buckets():
+    supplements = [{"id": 1, "times_of_day": {"Morning": ["08:00"]}}]
+    adherence = AdherenceRange(date(2025, 6, 29), date(2025, 7, 8), supplements, [])
+    # 2025-06-29 is a Sunday
+    assert [bucket["start"] for bucket in adherence.buckets("week")] == [
+        date(2025, 6, 29), date(2025, 6, 30), date(2025, 7, 7)
+    ]
+    assert [bucket["expected"] for bucket in adherence.buckets("month")] == [2, 8]
@@ -0,0 +1,45 @@
+from chat_retrieval import UserChatIndex, tokenize
+
+def test_tokenize_drops_stopwords_and_plurals():
+    assert tokenize("What are the side effects of my Vitamins?") == ["side", "effect", "vitamin"]
+    assert tokenize("Glass") == ["glass"]
+
+def test_user_and_reply_form_one_document():
+    index = UserChatIndex()
+    index.add_message("user", "Can I take iron with coffee?")
+    index.add_message("assistant", "Better to wait an hour.")
+    index.add_message("user", "What about zinc?")
+    assert index.documents == ["User: Can I take iron with coffee?\nAssistant: Better to wait an hour."]
+
+def test_search_ranks_matching_exchange_first():
+    index = UserChatIndex()
+    for question, answer in (
+        ("Is magnesium good for sleep?", "Magnesium glycinate can help with sleep."),
+        ("Can I take iron with coffee?", "Coffee reduces iron absorption."),
+        ("Any tips for fish oil?", "Take fish oil with food."),
+    ):
+        index.add_message("user", question)
+        index.add_message("assistant", answer)
+
+    results = index.search("iron and coffee", k=2)
+    assert [doc_id for _, doc_id in results] == [1]
+    assert index.search("vitamin") == []
+
+def test_search_skips_recent_documents():
+    index = UserChatIndex()
+    for answer in ("iron first", "iron second"):
+        index.add_message("user", "iron?")
+        index.add_message("assistant", answer)
+    assert [doc_id for _, doc_id in index.search("iron", skip_recent=1)] == [0]
+    assert index.search("iron", skip_recent=2) == []
+
+def test_add_rows_skips_rows_already_indexed():
+    index = UserChatIndex()
+    rows = [
+        {"id": 1, "sender": "user", "message": "iron?", "timestamp": "2025-07-01T08:00:00"},
+        {"id": 2, "sender": "assistant", "message": "with food", "timestamp": "2025-07-01T08:00:01"},
+    ]
+    assert index.add_rows(rows) == 2
+    assert index.add_rows(rows) == 0
+    assert len(index) == 1
+    assert index.synced_at.isoformat() == "2025-07-01T08:00:01"
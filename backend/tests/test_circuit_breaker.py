@@ -0,0 +1,70 @@
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: now[0])
+    return now
+
+def call(breaker, fail=False, seconds=0.0, clock=None):
+    with breaker.guard():
+        if clock is not None:
+            clock[0] += seconds
+        if fail:
+            raise RuntimeError("provider error")
+
+def fail(breaker):
+    with pytest.raises(RuntimeError):
+        call(breaker, fail=True)
+
+def test_opens_once_failure_rate_is_reached(clock):
+    breaker = CircuitBreaker(window_size=4, min_calls=4, failure_rate=0.5, open_seconds=30)
+    call(breaker)
+    call(breaker)
+    fail(breaker)
+    assert breaker.state == CLOSED
+    fail(breaker)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+    with pytest.raises(CircuitOpen):
+        call(breaker)
+    assert breaker.get_stats()["short_circuited"] == 2
+
+def test_opens_on_slow_calls(clock):
+    breaker = CircuitBreaker(window_size=2, min_calls=2, slow_call_seconds=5, slow_call_rate=1.0)
+    call(breaker, seconds=6, clock=clock)
+    call(breaker, seconds=6, clock=clock)
+    assert breaker.state == OPEN
+
+def test_half_open_probe_success_closes(clock):
+    breaker = CircuitBreaker(window_size=2, min_calls=2, open_seconds=30)
+    fail(breaker)
+    fail(breaker)
+    clock[0] += 30
+    assert breaker.get_stats()["state"] == HALF_OPEN
+    with breaker.guard():
+        # Only one probe at a time
+        with pytest.raises(CircuitOpen):
+            call(breaker)
+    assert breaker.state == CLOSED
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = CircuitBreaker(window_size=2, min_calls=2, open_seconds=30)
+    fail(breaker)
+    fail(breaker)
+    clock[0] += 30
+    fail(breaker)
+    assert breaker.state == OPEN
+    clock[0] += 29
+    assert breaker.get_stats()["state"] == OPEN
+
+def test_latency_percentile_needs_samples(clock):
+    breaker = CircuitBreaker()
+    for seconds in (1, 2, 3, 4):
+        call(breaker, seconds=seconds, clock=clock)
+    assert breaker.latency_percentile(50) is None
+    assert breaker.latency_percentile(50, min_samples=4) == 3
@@ -0,0 +1,50 @@
+import base64
+
+import pytest
+
+from image_ingest import decode_base64_image, sniff_image_type
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(40))
+JPEG = b"\xff\xd8\xff\xe0" + bytes(200)
+
+def encode(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+def test_sniff_image_type():
+    assert sniff_image_type(PNG[:16]) == "image/png"
+    assert sniff_image_type(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+    assert sniff_image_type(b"%PDF-1.7") is None
+
+def test_plain_and_data_url_payloads():
+    image = decode_base64_image(encode(PNG), max_bytes=1024)
+    assert image.data == PNG
+    assert image.mime_type == "image/png"
+
+    value = "data:image/jpeg;base64," + encode(JPEG)
+    image = decode_base64_image(value, max_bytes=1024)
+    # The validated string is kept as given
+    assert image == value
+    assert image.data == JPEG
+
+def test_wrapped_unpadded_and_chunked_payloads_decode():
+    payload = encode(JPEG)
+    wrapped = "\n".join(payload[i:i + 76] for i in range(0, len(payload), 76))
+    assert decode_base64_image(wrapped, max_bytes=1024).data == JPEG
+    assert decode_base64_image(payload.rstrip("="), max_bytes=1024).data == JPEG
+    assert decode_base64_image(payload, max_bytes=1024, chunk_chars=10).data == JPEG
+
+@pytest.mark.parametrize("value, message", [
+    ("data:text/plain;base64,aGVsbG8=", "Invalid base64"),
+    ("data:image/png,rawbytes", "Invalid base64"),
+    ("", "Invalid base64"),
+    ("not base64!", "Invalid base64"),
+    ("abcde", "Invalid base64"),
+    (encode(b"%PDF-1.7 not an image"), "Unsupported image type"),
+])
+def test_invalid_payloads_are_rejected(value, message):
+    with pytest.raises(ValueError, match=message):
+        decode_base64_image(value, max_bytes=1024)
+
+def test_oversized_payloads_are_rejected_before_decoding():
+    with pytest.raises(ValueError, match="at most"):
+        decode_base64_image(encode(PNG + bytes(2 * 1024 * 1024)), max_bytes=1024 * 1024)
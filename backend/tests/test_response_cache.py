@@ -0,0 +1,53 @@
+import asyncio
+
+import response_cache
+from response_cache import ResponseCache, is_personalised_follow_up, normalize_question
+
+def test_normalize_question():
+    assert normalize_question("  Can I take  Zinc?? ") == "can i take zinc"
+
+def test_follow_up_questions_are_detected():
+    assert is_personalised_follow_up("What about that?")
+    assert not is_personalised_follow_up("Can I take zinc with iron")
+
+def test_key_depends_on_context():
+    young = ResponseCache.make_key("Zinc?", {"user_age": 25, "supplements": [{"name": "Zinc"}]})
+    assert young == ResponseCache.make_key("zinc", {"user_age": 27, "supplements": [{"name": "zinc"}]})
+    assert young != ResponseCache.make_key("zinc", {"user_age": 70, "supplements": [{"name": "zinc"}]})
+
+def test_least_recently_used_entry_is_evicted():
+    async def scenario():
+        cache = ResponseCache(max_entries=2)
+        await cache.set("a", "A")
+        await cache.set("b", "B")
+        assert await cache.get("a") == "A"
+        await cache.set("c", "C")
+        return [await cache.get(key) for key in ("a", "b", "c")], cache.get_stats()
+
+    values, stats = asyncio.run(scenario())
+    assert values == ["A", None, "C"]
+    assert stats["evictions"] == 1
+
+def test_expired_entries_miss(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache = ResponseCache(ttl_seconds=10)
+    asyncio.run(cache.set("a", "A"))
+    now[0] += 5
+    assert asyncio.run(cache.get("a")) == "A"
+    now[0] += 10
+    assert asyncio.run(cache.get("a")) is None
+
+def test_disk_tier_survives_restart_and_is_bounded(tmp_path):
+    path = str(tmp_path / "cache.db")
+
+    async def fill():
+        cache = ResponseCache(max_entries=1, disk_path=path, max_disk_entries=3, purge_every=1)
+        for index in range(5):
+            await cache.set(f"k{index}", f"reply {index}")
+
+    asyncio.run(fill())
+    cache = ResponseCache(max_entries=1, disk_path=path, max_disk_entries=3)
+    assert asyncio.run(cache.get("k4")) == "reply 4"
+    assert asyncio.run(cache.get("k0")) is None
+    assert cache.get_stats()["disk_hits"] == 1
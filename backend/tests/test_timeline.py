@@ -0,0 +1,22 @@
+import pytest
+
+from timeline import format_minute, parse_dose_time
+
+@pytest.mark.parametrize("value, minute", [
+    ("08:00", 480),
+    ("7:05", 425),
+    ("23:59:59", 1439),
+    (" 12:30 ", 750),
+    # ISO timestamps show their clock time as stored, without a time zone shift
+    ("2025-06-28T07:00:00.000Z", 420),
+    ("2025-06-28T21:15:00+02:00", 1275),
+])
+def test_parse_dose_time(value, minute):
+    assert parse_dose_time(value) == minute
+
+@pytest.mark.parametrize("value", ["24:00", "12:60", "noon", "", "2025-06-28", None, 480])
+def test_parse_dose_time_rejects_invalid_values(value):
+    assert parse_dose_time(value) is None
+
+def test_format_minute_round_trips():
+    assert format_minute(parse_dose_time("06:05")) == "06:05"
@@ -0,0 +1,51 @@
+from reminder_scheduler import TimingWheel
+
+def test_timers_fire_in_order_once_due():
+    wheel = TimingWheel(tick_seconds=1.0, start=0.0)
+    wheel.schedule(5, 50)
+    wheel.schedule(2, 20)
+    wheel.schedule(2.5, 30)
+    assert wheel.advance(1) == []
+    assert wheel.advance(3) == [20, 30]
+    assert wheel.advance(10) == [50]
+    assert len(wheel) == 0
+
+def test_far_timers_cascade_down_from_upper_levels():
+    wheel = TimingWheel(tick_seconds=1.0, start=0.0)
+    wheel.schedule(300, 1)
+    wheel.schedule(20000, 2)
+    assert wheel.advance(299) == []
+    assert wheel.advance(300) == [1]
+    assert wheel.advance(19999) == []
+    assert wheel.advance(20000) == [2]
+
+def test_past_timers_fire_on_next_advance():
+    wheel = TimingWheel(tick_seconds=1.0, start=0.0)
+    wheel.advance(10)
+    wheel.schedule(3, 7)
+    assert wheel.advance(11) == [7]
+
+def test_cancel_and_reschedule():
+    wheel = TimingWheel(tick_seconds=1.0, start=0.0)
+    cancelled = wheel.schedule(5, 1)
+    moved = wheel.schedule(5, 2)
+    assert wheel.cancel(cancelled)
+    assert not wheel.cancel(cancelled)
+    assert wheel.reschedule(moved, 8)
+    assert wheel.advance(7) == []
+    assert wheel.advance(8) == [2]
+
+def test_stale_handles_do_not_touch_reused_entries():
+    wheel = TimingWheel(tick_seconds=1.0, start=0.0, capacity=1)
+    fired = wheel.schedule(1, 1)
+    assert wheel.advance(1) == [1]
+    wheel.schedule(5, 2)
+    assert not wheel.cancel(fired)
+    assert wheel.advance(5) == [2]
+
+def test_grows_past_capacity():
+    wheel = TimingWheel(tick_seconds=1.0, start=0.0, capacity=2)
+    for payload in range(10):
+        wheel.schedule(1, payload)
+    assert len(wheel) == 10
+    assert sorted(wheel.advance(1)) == list(range(10))
@@ -0,0 +1,237 @@
+"""
+Dose timeline engine for SafeDoser backend
+Builds a user's day of doses (the SupplementItem rows of the frontend schema in
+json.py) on the server. Each regimen is compiled once into dose rows sorted by
+minute of day, cached per user per day until the supplements change, and every
+request only computes statuses: one vectorised comparison against the current
+minute plus the day's taken logs. Cached timelines carry the version of the
+supplements they were built from, so a change made through another worker
+process is noticed on the next request there.
+"""
+
+import re
+import logging
+from collections import OrderedDict
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ("Morning", "Afternoon", "Evening")
+
+# A dose is current from 30 minutes before its time until 30 minutes after, then missed
+DUE_WINDOW_MINUTES = 30
+
+MINUTES_PER_DAY = 24 * 60
+
+_CLOCK = re.compile(r"(\d{1,2}):(\d{2})")
+
+@lru_cache(maxsize=4096)
+def parse_dose_time(value: str) -> Optional[int]:
+    """Minute of day for "HH:MM", "HH:MM:SS" or an ISO timestamp's time part, as the app displays it"""
+    if not isinstance(value, str):
+        return None
+    # ISO values such as "2025-06-28T07:00:00.000Z" show their clock time unconverted
+    match = _CLOCK.match(value.split("T", 1)[1] if "T" in value else value.strip())
+    if not match:
+        return None
+    hours, minutes = int(match.group(1)), int(match.group(2))
+    if hours > 23 or minutes > 59:
+        return None
+    return hours * 60 + minutes
+
+def format_minute(minute: int) -> str:
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+def supplement_type(dosage_form: Optional[str]) -> str:
+    """SupplementType for a dosage form, matching the frontend's mapping"""
+    form = (dosage_form or "").lower()
+    for keyword, kind in (("gummy", "gummy"), ("liquid", "liquid"), ("powder", "powder"), ("softgel", "softgel"), ("tablet", "tablet"), ("pill", "tablet")):
+        if keyword in form:
+            return kind
+    return "default"
+
+def supplement_tags(supplement: Dict[str, Any]) -> List[str]:
+    """Frequency and instruction hashtags shown on a timeline card"""
+    tags = []
+    if supplement.get("frequency"):
+        tags.append("#" + re.sub(r"\s+", "", supplement["frequency"]))
+    for instruction in supplement.get("interactions") or []:
+        tag = re.sub(r"[^a-zA-Z0-9]", "", str(instruction))
+        if tag:
+            tags.append(f"#{tag}")
+    return tags
+
+def created_on(supplement: Dict[str, Any]) -> Optional[date]:
+    created_at = supplement.get("created_at")
+    if isinstance(created_at, datetime):
+        return created_at.date()
+    if isinstance(created_at, str):
+        try:
+            return datetime.fromisoformat(created_at.replace("Z", "+00:00")).date()
+        except ValueError:
+            return None
+    return None
+
+async def iter_supplement_pages(db, batch_size: int = 1000) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Every supplement's schedule fields, a page at a time in id order"""
+    last_id = None
+    while True:
+        query = db.supabase.table("supplements").select("id, user_id, name, times_of_day, remind_me")
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.order("id").limit(batch_size).execute().data or []
+        if not rows:
+            return
+        last_id = rows[-1]["id"]
+        yield rows
+
+class CompiledTimeline:
+    """One user's doses for one day, sorted by minute of day"""
+
+    __slots__ = ("minutes", "supplement_ids", "items", "_positions")
+
+    def __init__(self, doses: List[Tuple[int, Dict[str, Any]]]):
+        doses.sort(key=lambda dose: dose[0])
+        self.minutes = np.fromiter((minute for minute, _ in doses), dtype=np.int16, count=len(doses))
+        self.supplement_ids = np.fromiter((item["supplement_id"] for _, item in doses), dtype=np.int64, count=len(doses))
+        self.items = [item for _, item in doses]
+        # (supplement id, minute) -> row, for applying logs
+        self._positions = {(item["supplement_id"], minute): position for position, (minute, item) in enumerate(doses)}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def statuses(self, minutes_from_now: int, logs: Iterable[Dict[str, Any]] = ()) -> np.ndarray:
+        """SupplementStatus value per row; minutes_from_now is how far the day's midnight is from now"""
+        offsets = self.minutes.astype(np.int32) + minutes_from_now
+        statuses = np.where(
+            offsets < -DUE_WINDOW_MINUTES, "missed",
+            np.where(offsets <= DUE_WINDOW_MINUTES, "current", "default")
+        ).astype(object)
+        for log in logs:
+            minute = parse_dose_time(log.get("scheduled_time"))
+            position = self._positions.get((log.get("supplement_id"), minute))
+            if position is None:
+                continue
+            if log.get("status") == "taken":
+                statuses[position] = "completed"
+            elif log.get("status") == "missed":
+                statuses[position] = "missed"
+        return statuses
+
+    def rows(self, minutes_from_now: int, logs: Iterable[Dict[str, Any]] = ()) -> List[Dict[str, Any]]:
+        logs = list(logs)
+        log_ids = {(log.get("supplement_id"), parse_dose_time(log.get("scheduled_time"))): log.get("id") for log in logs}
+        return [
+            {**item, "status": status, "log_id": log_ids.get((item["supplement_id"], minute))}
+            for item, minute, status in zip(self.items, self.minutes.tolist(), self.statuses(minutes_from_now, logs))
+        ]
+
+def compile_timeline(
+    supplements: List[Dict[str, Any]],
+    day: date,
+    alerts: Optional[Dict[int, List[Dict[str, Any]]]] = None
+) -> CompiledTimeline:
+    """Expand every supplement's times of day into dose rows for one day"""
+    alerts = alerts or {}
+    doses: List[Tuple[int, Dict[str, Any]]] = []
+    for supplement in supplements:
+        created = created_on(supplement)
+        if created is not None and created > day:
+            continue
+        times_of_day = supplement.get("times_of_day") or {}
+        tags = supplement_tags(supplement)
+        kind = supplement_type(supplement.get("dosage_form"))
+        for period in PERIODS:
+            times = times_of_day.get(period)
+            if not isinstance(times, list):
+                continue
+            for index, value in enumerate(times):
+                minute = parse_dose_time(value)
+                if minute is None:
+                    continue
+                doses.append((minute, {
+                    # Same per-slot id the app has always generated
+                    "id": int(f"{supplement['id']}{ord(period[0])}{index}"),
+                    "time": format_minute(minute),
+                    "name": supplement.get("name", ""),
+                    "muted": not supplement.get("remind_me", True),
+                    "tags": tags,
+                    "alerts": alerts.get(supplement["id"]) or None,
+                    "type": kind,
+                    "period": period,
+                    "supplement_id": supplement["id"],
+                }))
+    return CompiledTimeline(doses)
+
+# Identifies a user's set of supplements: (row count, latest updated_at)
+SupplementsVersion = Tuple[int, Optional[str]]
+
+class TimelineEngine:
+    """Compiled timelines cached per user per day, least recently used users evicted first"""
+
+    def __init__(self, max_users: int = 10000, max_days_per_user: int = 3):
+        self.max_users = max_users
+        self.max_days_per_user = max_days_per_user
+        self._timelines: "OrderedDict[str, OrderedDict[date, CompiledTimeline]]" = OrderedDict()
+        self._versions: Dict[str, Optional[SupplementsVersion]] = {}
+        self.stats: Dict[str, int] = {"hits": 0, "compiles": 0, "invalidations": 0, "stale": 0}
+
+    def cached(self, user_id: str, day: date, version: Optional[SupplementsVersion] = None) -> Optional[CompiledTimeline]:
+        """A cached timeline, unless the user's supplements changed since it was compiled"""
+        days = self._timelines.get(user_id)
+        if days is not None and version is not None and self._versions.get(user_id) != version:
+            # Changed through another worker, which invalidated only its own cache
+            self._drop(user_id)
+            self.stats["stale"] += 1
+            return None
+        if days is None or day not in days:
+            return None
+        self._timelines.move_to_end(user_id)
+        days.move_to_end(day)
+        self.stats["hits"] += 1
+        return days[day]
+
+    def compile(
+        self,
+        user_id: str,
+        day: date,
+        supplements: List[Dict[str, Any]],
+        alerts: Optional[Dict[int, List[Dict[str, Any]]]] = None,
+        version: Optional[SupplementsVersion] = None
+    ) -> CompiledTimeline:
+        timeline = compile_timeline(supplements, day, alerts)
+        self.stats["compiles"] += 1
+        if self._versions.get(user_id) != version:
+            # Days compiled from other supplements must not be served next to this one
+            self._drop(user_id)
+        days = self._timelines.setdefault(user_id, OrderedDict())
+        self._versions[user_id] = version
+        days[day] = timeline
+        self._timelines.move_to_end(user_id)
+        while len(days) > self.max_days_per_user:
+            days.popitem(last=False)
+        while len(self._timelines) > self.max_users:
+            evicted, _ = self._timelines.popitem(last=False)
+            self._versions.pop(evicted, None)
+        return timeline
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop a user's timelines after their supplements change"""
+        if self._drop(user_id):
+            self.stats["invalidations"] += 1
+
+    def _drop(self, user_id: str) -> bool:
+        self._versions.pop(user_id, None)
+        return self._timelines.pop(user_id, None) is not None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "users": len(self._timelines),
+            "timelines": sum(len(days) for days in self._timelines.values()),
+        }
@@ -4,15 +4,22 @@ Utility functions for SafeDoser backend
 
 import os
 import logging
-import base64
 import uuid
-from typing import Optional
-from datetime import datetime
+import time
+import hashlib
+from typing import Any, Optional, Dict
+from datetime import datetime, timedelta
+from contextlib import contextmanager
 import asyncio
 
 from fastapi import UploadFile, HTTPException
-from PIL import Image
-import io
+
+from image_ingest import ImageSource, InlineImage, UploadIngestor, decode_base64_image
+from blob_store import BlobStore, file_sha256
+from image_dedup import ImageHashIndex
+from image_pipeline import ImagePipeline, ImagePipelineBusy, InvalidImage, compress
+from models import INLINE_IMAGE_MAX_BYTES
+from timeline import DUE_WINDOW_MINUTES, parse_dose_time
 
 def setup_logging():
     """Setup logging configuration"""
@@ -25,50 +32,139 @@ def setup_logging():
         ]
     )
 
-async def handle_image_upload(file: UploadFile, user_id: str) -> str:
-    """Handle image upload and return URL"""
-    try:
-        # Read file content
-        content = await file.read()
-        
-        # Validate image
+class StageTimer:
+    """Collects per-stage wall-clock timings for a single request"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as stage `name` (in milliseconds)"""
+        start = time.perf_counter()
         try:
-            image = Image.open(io.BytesIO(content))
-            image.verify()
-        except Exception:
-            raise HTTPException(status_code=400, detail="Invalid image file")
-        
-        # Reset file pointer
-        await file.seek(0)
-        content = await file.read()
-        
-        # Resize image if too large
-        if len(content) > 5 * 1024 * 1024:  # 5MB limit
-            image = Image.open(io.BytesIO(content))
-            
-            # Calculate new size maintaining aspect ratio
-            max_size = (800, 800)
-            image.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
-            # Save resized image
-            output = io.BytesIO()
-            format = image.format or 'JPEG'
-            image.save(output, format=format, quality=85)
-            content = output.getvalue()
-        
-        # In a real implementation, you would upload to cloud storage
-        # For now, we'll return a base64 data URL
-        base64_content = base64.b64encode(content).decode('utf-8')
-        mime_type = file.content_type or 'image/jpeg'
-        
-        return f"data:{mime_type};base64,{base64_content}"
-        
+            yield
+        finally:
+            self.stages[name] = (time.perf_counter() - start) * 1000
+
+    @property
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def server_timing_header(self) -> str:
+        """Format stages as a Server-Timing header value"""
+        parts = [f"{name};dur={ms:.1f}" for name, ms in self.stages.items()]
+        parts.append(f"total;dur={self.total_ms:.1f}")
+        return ", ".join(parts)
+
+    def summary(self) -> str:
+        """Format stages for log lines"""
+        parts = [f"{name}={ms:.1f}ms" for name, ms in self.stages.items()]
+        parts.append(f"total={self.total_ms:.1f}ms")
+        return " ".join(parts)
+
+async def handle_image_upload(
+    file: UploadFile,
+    user_id: str,
+    ingestor: UploadIngestor,
+    pipeline: ImagePipeline,
+    blob_store: BlobStore,
+    hash_index: ImageHashIndex
+) -> Dict[str, Any]:
+    """Handle image upload and return its URL and any near duplicates among the user's images"""
+    try:
+        # Single bounded read; type and size are checked before anything is decoded
+        with await ingestor.ingest(file) as upload:
+            # Spooled uploads go to the workers by path, never read whole here
+            return await store_image(upload.source(), user_id, pipeline, blob_store, hash_index)
+
     except HTTPException:
         raise
     except Exception as e:
         logging.error(f"Image upload error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to upload image")
 
+async def handle_inline_image(
+    value: Optional[str],
+    user_id: str,
+    pipeline: ImagePipeline,
+    blob_store: BlobStore,
+    hash_index: Optional[ImageHashIndex] = None
+) -> Optional[str]:
+    """Store a validated inline base64 image and return its URL; other values pass through
+
+    Without a hash index (avatars) the image is neither deduplicated nor indexed.
+    """
+    if not isinstance(value, InlineImage):
+        return value
+    # The validator already decoded the payload; reuse its bytes
+    stored = await store_image(value.data, user_id, pipeline, blob_store, hash_index)
+    return stored["image_url"]
+
+async def handle_image_url(
+    value: Optional[str],
+    user_id: str,
+    pipeline: ImagePipeline,
+    blob_store: BlobStore,
+    hash_index: Optional[ImageHashIndex] = None
+) -> Optional[str]:
+    """Store an inline image data URL like an upload and return its URL; plain URLs pass through"""
+    if not isinstance(value, str) or not value.startswith("data:"):
+        return value
+    # Bounded, chunked decode off the event loop; the pipeline then verifies and resizes it
+    try:
+        image = await asyncio.to_thread(decode_base64_image, value, INLINE_IMAGE_MAX_BYTES)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await handle_inline_image(image, user_id, pipeline, blob_store, hash_index)
+
+async def store_image(
+    source: ImageSource,
+    user_id: str,
+    pipeline: ImagePipeline,
+    blob_store: BlobStore,
+    hash_index: Optional[ImageHashIndex] = None
+) -> Dict[str, Any]:
+    """Process image bytes (or a spooled upload's path) and store them, returning the image URL and any near duplicates
+
+    Duplicates are only looked up among the same user's indexed images.
+    """
+    # Byte-identical re-uploads reuse the stored blob with no image processing
+    if isinstance(source, str):
+        sha256 = await asyncio.to_thread(file_sha256, source)
+    else:
+        sha256 = await asyncio.to_thread(lambda: hashlib.sha256(source).hexdigest())
+    key = hash_index.exact(user_id, sha256) if hash_index is not None else None
+    if key is not None and blob_store.exists(key):
+        return {"image_url": blob_store.public_url(key), "duplicate": True, "similar_images": []}
+
+    # Verify, resize large images and fix EXIF rotation off the event loop
+    try:
+        result = await pipeline.prepare_upload(source)
+    except InvalidImage:
+        raise HTTPException(status_code=400, detail="Invalid image file")
+    except ImagePipelineBusy:
+        raise HTTPException(status_code=503, detail="Image processing is busy, please try again shortly")
+    logging.info(f"Processed image for {user_id}: " + " ".join(f"{k}={v:.1f}ms" for k, v in result["timings"].items()))
+
+    # Content-addressed, so re-uploading the same image reuses its blob
+    if result["content"] is not None:
+        key = await blob_store.put(result["content"], result["mime_type"])
+    elif isinstance(source, str):
+        key = await blob_store.put_file(source, result["mime_type"])
+    else:
+        key = await blob_store.put(source, result["mime_type"])
+    similar = []
+    if hash_index is not None:
+        similar = hash_index.similar(user_id, result["phash"], exclude=key)
+        hash_index.add(user_id, sha256, key, result["phash"])
+    return {
+        "image_url": blob_store.public_url(key),
+        "duplicate": False,
+        "similar_images": [blob_store.public_url(similar_key) for _, similar_key in similar],
+    }
+
 def generate_unique_filename(original_filename: str) -> str:
     """Generate unique filename for uploads"""
     ext = os.path.splitext(original_filename)[1]
@@ -98,29 +194,20 @@ def sanitize_filename(filename: str) -> str:
     sanitized = sanitized.strip('_')
     return sanitized
 
-async def compress_image(image_data: bytes, max_size: tuple = (800, 800), quality: int = 85) -> bytes:
+async def compress_image(
+    image_data: bytes,
+    max_size: tuple = (800, 800),
+    quality: int = 85,
+    pipeline: Optional[ImagePipeline] = None
+) -> bytes:
     """Compress image to reduce file size"""
     try:
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Convert to RGB if necessary
-        if image.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            if image.mode == 'P':
-                image = image.convert('RGBA')
-            background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-            image = background
-        
-        # Resize if larger than max_size
-        if image.size[0] > max_size[0] or image.size[1] > max_size[1]:
-            image.thumbnail(max_size, Image.Resampling.LANCZOS)
-        
-        # Save compressed image
-        output = io.BytesIO()
-        image.save(output, format='JPEG', quality=quality, optimize=True)
-        
-        return output.getvalue()
-        
+        if pipeline is not None:
+            result = await pipeline.compress(image_data, max_size, quality)
+        else:
+            result = await asyncio.to_thread(compress, image_data, max_size, quality)
+        return result["content"]
+
     except Exception as e:
         logging.error(f"Image compression error: {str(e)}")
         return image_data  # Return original if compression fails
@@ -160,21 +247,21 @@ def calculate_next_dose_time(supplement_data: dict) -> Optional[datetime]:
     try:
         times_of_day = supplement_data.get('times_of_day', {})
         current_time = datetime.now()
+        midnight = datetime.combine(current_time.date(), datetime.min.time())
         
         all_times = []
         for period, times in times_of_day.items():
             for time_str in times:
-                try:
-                    time_obj = datetime.strptime(time_str, '%H:%M').time()
-                    next_dose = datetime.combine(current_time.date(), time_obj)
-                    
-                    # If time has passed today, schedule for tomorrow
-                    if next_dose <= current_time:
-                        next_dose = next_dose.replace(day=next_dose.day + 1)
-                    
-                    all_times.append(next_dose)
-                except ValueError:
+                minute = parse_dose_time(time_str)
+                if minute is None:
                     continue
+                next_dose = midnight + timedelta(minutes=minute)
+                
+                # If time has passed today, schedule for tomorrow
+                if next_dose <= current_time:
+                    next_dose += timedelta(days=1)
+                
+                all_times.append(next_dose)
         
         return min(all_times) if all_times else None
         
@@ -188,66 +275,25 @@ def get_supplement_status(supplement_data: dict, current_time: datetime = None)
     
     try:
         times_of_day = supplement_data.get('times_of_day', {})
+        now_minute = current_time.hour * 60 + current_time.minute + current_time.second / 60
         
         for period, times in times_of_day.items():
             for time_str in times:
-                try:
-                    time_obj = datetime.strptime(time_str, '%H:%M').time()
-                    dose_time = datetime.combine(current_time.date(), time_obj)
-                    
-                    # Check if dose is due (within 30 minutes)
-                    time_diff = (dose_time - current_time).total_seconds() / 60
-                    
-                    if -30 <= time_diff <= 30:
-                        return 'due'
-                    elif time_diff < -30:
-                        return 'missed'
-                    elif time_diff > 30:
-                        return 'upcoming'
-                        
-                except ValueError:
+                minute = parse_dose_time(time_str)
+                if minute is None:
                     continue
+                
+                # Check if dose is due (within 30 minutes)
+                time_diff = minute - now_minute
+                
+                if -DUE_WINDOW_MINUTES <= time_diff <= DUE_WINDOW_MINUTES:
+                    return 'due'
+                elif time_diff < -DUE_WINDOW_MINUTES:
+                    return 'missed'
+                else:
+                    return 'upcoming'
         
         return 'scheduled'
         
     except Exception:
         return 'unknown'
-
-class AsyncTimer:
-    """Async timer utility for scheduling tasks"""
-    
-    def __init__(self):
-        self.tasks = {}
-    
-    async def schedule_task(self, task_id: str, delay: float, callback, *args, **kwargs):
-        """Schedule a task to run after delay seconds"""
-        async def run_task():
-            await asyncio.sleep(delay)
-            await callback(*args, **kwargs)
-            self.tasks.pop(task_id, None)
-        
-        # Cancel existing task if any
-        if task_id in self.tasks:
-            self.tasks[task_id].cancel()
-        
-        # Schedule new task
-        self.tasks[task_id] = asyncio.create_task(run_task())
-    
-    def cancel_task(self, task_id: str):
-        """Cancel a scheduled task"""
-        if task_id in self.tasks:
-            self.tasks[task_id].cancel()
-            self.tasks.pop(task_id, None)
-    
-    def cancel_all_tasks(self):
-        """Cancel all scheduled tasks"""
-        for task in self.tasks.values():
-            task.cancel()
-        self.tasks.clear()
-
-# Global timer instance
-timer = AsyncTimer()
-
-def get_timer() -> AsyncTimer:
-    """Get global timer instance"""
-    return timer
\ No newline at end of file
@@ -26,6 +26,7 @@ export const API_ENDPOINTS = {
   SUPPLEMENTS: {
     BASE: '/supplements',
     BY_ID: (id: number) => `/supplements/${id}`,
+    INTERACTIONS: '/supplements/interactions',
   },
   
   // Supplement logs
@@ -34,15 +35,35 @@ export const API_ENDPOINTS = {
     BY_ID: (id: string) => `/supplement-logs/${id}`,
     MARK_COMPLETED: '/supplement-logs/mark-completed',
     TODAY: '/supplement-logs/today',
+    BATCH: '/supplement-logs/batch',
   },
   
   // Chat
   CHAT: {
     SEND: '/chat',
+    STREAM: '/chat/stream',
     HISTORY: '/chat/history',
     CLEAR: '/chat/clear',
   },
   
+  // Daily dose timeline
+  TIMELINE: '/timeline',
+
+  // Adherence dashboard
+  ADHERENCE: '/adherence',
+  
+  // Dose reminders (Server-Sent Events)
+  REMINDERS: {
+    EVENTS: '/reminders/events',
+  },
+  
+  // Label scanning
+  SCAN: {
+    BASE: '/scan',
+    BY_ID: (id: string) => `/scan/${id}`,
+    EVENTS: (id: string) => `/scan/${id}/events`,
+  },
+  
   // Health check
   HEALTH: '/health',
   
@@ -254,6 +275,9 @@ export const supplementsAPI = {
       method: HTTP_METHODS.DELETE,
       token,
     }),
+
+  checkInteractions: (token: string) =>
+    apiRequest(API_ENDPOINTS.SUPPLEMENTS.INTERACTIONS, { token }),
 };
 
 export const supplementLogsAPI = {
@@ -280,6 +304,17 @@ export const supplementLogsAPI = {
     body: updateData,
     token,
   }),
+
+  markBatch: (token: string, batch: {
+    status?: 'pending' | 'taken' | 'missed' | 'skipped';
+    period?: 'Morning' | 'Afternoon' | 'Evening';
+    supplement_ids?: number[];
+    log_date?: string;
+  }) => apiRequest(API_ENDPOINTS.SUPPLEMENT_LOGS.BATCH, {
+    method: HTTP_METHODS.POST,
+    body: batch,
+    token,
+  }),
 };
 
 export const chatAPI = {
@@ -305,6 +340,31 @@ export const chatAPI = {
     }),
 };
 
+export const timelineAPI = {
+  // date is YYYY-MM-DD; the offset lets the server use the device's clock
+  getDay: (token: string, date?: string) => {
+    const params = new URLSearchParams({ tz_offset: String(-new Date().getTimezoneOffset()) });
+    if (date) params.set('date', date);
+    return apiRequest(`${API_ENDPOINTS.TIMELINE}?${params}`, { token });
+  },
+};
+
+export const adherenceAPI = {
+  // start/end are YYYY-MM-DD; defaults to the last 30 days
+  getRange: (token: string, options: { start?: string; end?: string; bucket?: 'day' | 'week' | 'month' } = {}) => {
+    const params = new URLSearchParams({ tz_offset: String(-new Date().getTimezoneOffset()) });
+    if (options.start) params.set('start', options.start);
+    if (options.end) params.set('end', options.end);
+    if (options.bucket) params.set('bucket', options.bucket);
+    return apiRequest(`${API_ENDPOINTS.ADHERENCE}?${params}`, { token });
+  },
+};
+
+export const scanAPI = {
+  getJob: (token: string, jobId: string) =>
+    apiRequest(API_ENDPOINTS.SCAN.BY_ID(jobId), { token }),
+};
+
 // Health check
 export const healthCheck = () => apiRequest(API_ENDPOINTS.HEALTH);
 
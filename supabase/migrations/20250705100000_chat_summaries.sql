@@ -0,0 +1,27 @@
+/*
+# Rolling Conversation Summaries
+
+1. New Tables
+  - `chat_summaries`
+    - `user_id` (uuid, primary key, references users)
+    - `summary` (text, not null) - compact digest of the user's conversation
+    - `updated_at` (timestamp, default now)
+
+2. Security
+  - Enable RLS on `chat_summaries` table
+  - Users can read their own summary; the backend maintains it
+*/
+
+CREATE TABLE IF NOT EXISTS chat_summaries (
+  user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+  summary TEXT NOT NULL DEFAULT '',
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE chat_summaries ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own chat summary" ON chat_summaries
+  FOR SELECT USING (auth.uid()::text = user_id::text);
+
+CREATE POLICY "Service role can manage chat summaries" ON chat_summaries
+  FOR ALL USING (true);
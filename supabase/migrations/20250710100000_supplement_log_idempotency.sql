@@ -0,0 +1,36 @@
+/*
+# Idempotent Supplement Logs
+
+1. Changes
+  - `supplement_logs.log_date` (date, not null) - the day a dose belongs to,
+    backfilled from `created_at`
+  - `supplement_logs.updated_at` (timestamp) - last change to the log
+
+2. Constraints
+  - One log per dose: unique (`supplement_id`, `log_date`, `scheduled_time`).
+    Existing duplicates are collapsed to the most recent row first.
+
+3. Indexes
+  - (`user_id`, `log_date`) for reading a user's day
+*/
+
+ALTER TABLE supplement_logs ADD COLUMN IF NOT EXISTS log_date DATE;
+ALTER TABLE supplement_logs ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+
+UPDATE supplement_logs SET log_date = COALESCE(created_at, NOW())::date WHERE log_date IS NULL;
+
+ALTER TABLE supplement_logs ALTER COLUMN log_date SET DEFAULT CURRENT_DATE;
+ALTER TABLE supplement_logs ALTER COLUMN log_date SET NOT NULL;
+
+DELETE FROM supplement_logs older
+USING supplement_logs newer
+WHERE older.supplement_id = newer.supplement_id
+  AND older.log_date = newer.log_date
+  AND older.scheduled_time = newer.scheduled_time
+  AND (older.created_at, older.id) < (newer.created_at, newer.id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_supplement_logs_dose
+  ON supplement_logs(supplement_id, log_date, scheduled_time);
+
+CREATE INDEX IF NOT EXISTS idx_supplement_logs_user_date
+  ON supplement_logs(user_id, log_date);
@@ -0,0 +1,105 @@
+/*
+# Daily Adherence Rollups
+
+1. New Tables
+  - `adherence_daily` - one row per supplement per day
+    - `supplement_id` (integer, references supplements)
+    - `log_date` (date)
+    - `user_id` (uuid, references users)
+    - `taken`, `skipped`, `missed`, `pending` (integer) - logged doses by status
+    - `updated_at` (timestamp, default now)
+    - Primary key (`supplement_id`, `log_date`)
+
+2. Maintenance
+  - Triggers on `supplement_logs` apply each insert, status change and delete
+    as a +1/-1 delta in the same transaction as the log write
+  - Existing logs are rolled up once here; `backend/adherence_rebuild.py`
+    recomputes rollups from the raw logs if they ever drift
+
+3. Security
+  - Enable RLS on `adherence_daily` table
+  - Users can read their own rollups; the triggers and backend maintain them
+*/
+
+CREATE TABLE IF NOT EXISTS adherence_daily (
+  supplement_id INTEGER NOT NULL REFERENCES supplements(id) ON DELETE CASCADE,
+  log_date DATE NOT NULL,
+  user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  taken INTEGER NOT NULL DEFAULT 0,
+  skipped INTEGER NOT NULL DEFAULT 0,
+  missed INTEGER NOT NULL DEFAULT 0,
+  pending INTEGER NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (supplement_id, log_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_adherence_daily_user_date
+  ON adherence_daily(user_id, log_date);
+
+ALTER TABLE adherence_daily ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own adherence rollups" ON adherence_daily
+  FOR SELECT USING (auth.uid()::text = user_id::text);
+
+CREATE POLICY "Service role can manage adherence rollups" ON adherence_daily
+  FOR ALL USING (true);
+
+-- Add sign (+1 or -1) of one log to its day's rollup
+CREATE OR REPLACE FUNCTION apply_adherence_delta(
+  p_user_id UUID, p_supplement_id INTEGER, p_log_date DATE, p_status TEXT, p_sign INTEGER
+)
+RETURNS VOID AS $$
+BEGIN
+  INSERT INTO adherence_daily (supplement_id, log_date, user_id, taken, skipped, missed, pending)
+  VALUES (
+    p_supplement_id, p_log_date, p_user_id,
+    CASE WHEN p_status = 'taken' THEN p_sign ELSE 0 END,
+    CASE WHEN p_status = 'skipped' THEN p_sign ELSE 0 END,
+    CASE WHEN p_status = 'missed' THEN p_sign ELSE 0 END,
+    CASE WHEN p_status = 'pending' THEN p_sign ELSE 0 END
+  )
+  ON CONFLICT (supplement_id, log_date) DO UPDATE SET
+    taken = adherence_daily.taken + EXCLUDED.taken,
+    skipped = adherence_daily.skipped + EXCLUDED.skipped,
+    missed = adherence_daily.missed + EXCLUDED.missed,
+    pending = adherence_daily.pending + EXCLUDED.pending,
+    updated_at = NOW();
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION update_adherence_daily()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_adherence_delta(OLD.user_id, OLD.supplement_id, OLD.log_date, OLD.status, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_adherence_delta(NEW.user_id, NEW.supplement_id, NEW.log_date, NEW.status, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER update_adherence_daily_on_write AFTER INSERT OR DELETE ON supplement_logs
+    FOR EACH ROW EXECUTE FUNCTION update_adherence_daily();
+
+-- Re-marking a dose with the same status (the common upsert) leaves the rollup untouched
+CREATE TRIGGER update_adherence_daily_on_change AFTER UPDATE ON supplement_logs
+    FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status
+          OR OLD.log_date IS DISTINCT FROM NEW.log_date
+          OR OLD.supplement_id IS DISTINCT FROM NEW.supplement_id)
+    EXECUTE FUNCTION update_adherence_daily();
+
+INSERT INTO adherence_daily (supplement_id, log_date, user_id, taken, skipped, missed, pending)
+SELECT
+  supplement_id,
+  log_date,
+  MIN(user_id::text)::uuid,
+  COUNT(*) FILTER (WHERE status = 'taken'),
+  COUNT(*) FILTER (WHERE status = 'skipped'),
+  COUNT(*) FILTER (WHERE status = 'missed'),
+  COUNT(*) FILTER (WHERE status = 'pending')
+FROM supplement_logs
+GROUP BY supplement_id, log_date
+ON CONFLICT (supplement_id, log_date) DO NOTHING;
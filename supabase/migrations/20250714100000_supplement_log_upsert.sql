@@ -0,0 +1,44 @@
+/*
+# Supplement Log Upsert
+
+1. Functions
+  - `upsert_supplement_logs(p_rows jsonb)` - writes a batch of dose logs,
+    one row per (`supplement_id`, `log_date`, `scheduled_time`), and returns
+    the stored rows
+
+2. Behaviour
+  - A dose that already has a log keeps its `id`, so logs written before ids
+    were derived keep theirs; only the owner's own log is updated
+  - Re-marking a dose taken keeps the first `taken_at`; an explicit
+    `taken_at` replaces it, and any other status clears it
+  - A taken log without `taken_at` is stamped with the write time
+*/
+
+CREATE OR REPLACE FUNCTION upsert_supplement_logs(p_rows JSONB)
+RETURNS SETOF supplement_logs AS $$
+BEGIN
+  RETURN QUERY
+  INSERT INTO supplement_logs AS existing (
+    id, user_id, supplement_id, log_date, scheduled_time, status, taken_at, notes, updated_at
+  )
+  SELECT
+    r.id, r.user_id, r.supplement_id, r.log_date, r.scheduled_time, r.status,
+    CASE WHEN r.status = 'taken' THEN COALESCE(r.taken_at, NOW()) END,
+    r.notes,
+    COALESCE(r.updated_at, NOW())
+  FROM jsonb_populate_recordset(NULL::supplement_logs, p_rows) AS r
+  ON CONFLICT (supplement_id, log_date, scheduled_time) DO UPDATE SET
+    status = EXCLUDED.status,
+    -- NOW() is fixed for the transaction, so a taken_at equal to it was stamped above, not given
+    taken_at = CASE
+      WHEN EXCLUDED.status <> 'taken' THEN NULL
+      WHEN existing.status = 'taken' AND existing.taken_at IS NOT NULL AND EXCLUDED.taken_at = NOW()
+        THEN existing.taken_at
+      ELSE EXCLUDED.taken_at
+    END,
+    notes = EXCLUDED.notes,
+    updated_at = EXCLUDED.updated_at
+  WHERE existing.user_id = EXCLUDED.user_id
+  RETURNING existing.*;
+END;
+$$ language 'plpgsql';